@@ -18,5 +18,7 @@ Here are the apps I made:
 - [ ] [MeetingGPT](/MeetingGPT)
 - [ ] [InvestorGPT](/InvestorGPT)
 
+Admin: [latency per app](/Admin)
+
 """
 )
\ No newline at end of file
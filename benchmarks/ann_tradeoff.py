@@ -0,0 +1,69 @@
+"""
+Memory footprint and recall/latency trade-off of the index chosen by
+utils.ann_index for a given corpus size.
+
+    python -m benchmarks.ann_tradeoff --count 200000 --dimension 1536
+    python -m benchmarks.ann_tradeoff --index-dir ./.cache/sites/<digest>
+
+Synthetic vectors are clustered gaussians (closer to real embeddings than
+uniform noise); with --index-dir the stored vectors are read back with
+`index_vectors` (any index type, including memory-mapped IVF indexes and
+indexes with deleted ids) and re-indexed with the chosen spec.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from utils.ann_index import (
+    build_index,
+    choose_index_spec,
+    describe_index,
+    evaluate_index,
+    index_vectors,
+)
+from utils.index_store import load_index
+
+
+def synthetic_vectors(count, dimension, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    return centers[labels] + 0.3 * rng.normal(size=(count, dimension)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--index-dir")
+    parser.add_argument("--spec", help="faiss factory string, default: chosen by size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--read-only", action="store_true", help="allow HNSW")
+    parser.add_argument("--quantize", action="store_true")
+    args = parser.parse_args()
+
+    if args.index_dir:
+        # query는 저장된 vector에서 만들므로 embedding model은 필요 없음
+        _, vectors = index_vectors(load_index(args.index_dir, None))
+    else:
+        vectors = synthetic_vectors(args.count, args.dimension)
+
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+
+    spec = args.spec or choose_index_spec(
+        len(vectors), vectors.shape[1], mutable=not args.read_only, quantize=args.quantize or None
+    )
+    index = build_index(vectors, spec=spec)
+    print(json.dumps({
+        "spec": spec,
+        **describe_index(index),
+        "tradeoff": evaluate_index(index, vectors, queries, k=args.k),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
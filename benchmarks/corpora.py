@@ -0,0 +1,197 @@
+"""
+Synthetic, seeded corpora for the offline benchmarks.
+
+- `write_text`: plain text file of `pages` form-feed separated pages
+- `write_pdf`: a real multi-page PDF with a text layer (written by hand, so
+  no PDF library is needed to produce it; pypdf / unstructured read it back)
+- `write_site`: static HTML pages with header / footer, `robots.txt` and a
+  `sitemap.xml` index pointing at sitemaps of `SITEMAP_SIZE` urls
+- `serve_directory`: serves a directory on 127.0.0.1 from a background
+  thread, for crawling the generated site through the real fetcher
+
+The same seed always produces the same bytes, so the content hashes (and
+therefore every ingestion cache key) are stable across runs.
+"""
+import os
+import random
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+LINE_WIDTH = 90
+LINES_PER_PAGE = 50
+SITEMAP_SIZE = 500
+
+
+def make_vocabulary(size=5000, seed=0):
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "bra", "qui", "den", "for", "gal", "hup"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_sentence(rng, vocabulary):
+    # zipf 분포에 가깝게 -> 자주 나오는 단어와 드문 단어가 섞이도록
+    words = [
+        vocabulary[min(len(vocabulary) - 1, int(10 * rng.paretovariate(1.0)) - 10)]
+        if rng.random() < 0.5 else rng.choice(vocabulary)
+        for _ in range(rng.randint(8, 20))
+    ]
+    return " ".join(words).capitalize() + "."
+
+
+def make_lines(rng, vocabulary, count):
+    lines = []
+    line = ""
+    while len(lines) < count:
+        for word in make_sentence(rng, vocabulary).split():
+            if len(line) + len(word) + 1 > LINE_WIDTH:
+                lines.append(line)
+                line = ""
+            line = f"{line} {word}" if line else word
+    return lines[:count]
+
+
+def make_pages(pages, seed=0):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(seed=seed)
+    return [make_lines(rng, vocabulary, LINES_PER_PAGE) for _ in range(pages)]
+
+
+def write_text(path, pages, seed=0):
+    with open(path, "w") as f:
+        f.write("\n\f\n".join("\n".join(lines) for lines in make_pages(pages, seed)))
+    return path
+
+
+def escape_pdf(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages, seed=0):
+    '''
+    object 1: catalog, 2: pages, 3: font, 이후 page마다 (page, content stream)
+    '''
+    page_lines = make_pages(pages, seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for lines in page_lines:
+        stream = "BT /F1 10 Tf 12 TL 40 780 Td " + " ".join(
+            f"({escape_pdf(line)}) Tj T*" for line in lines
+        ) + " ET"
+        stream = stream.encode("latin-1")
+        objects.append(None)
+        page_number = len(objects)
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        objects[page_number - 1] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (page_number + 1)
+        )
+        kids.append(page_number)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref
+    )
+    with open(path, "wb") as f:
+        f.write(output)
+    return path
+
+
+def write_site(directory, pages, seed=0, lastmod="2024-01-01"):
+    ''' {directory}/sitemap.xml이 sitemap index, page는 /pages/{i}.html '''
+    os.makedirs(os.path.join(directory, "pages"), exist_ok=True)
+    for number, lines in enumerate(make_pages(pages, seed)):
+        paragraphs = "\n".join(f"<p>{line}</p>" for line in lines)
+        with open(os.path.join(directory, "pages", f"{number}.html"), "w") as f:
+            f.write(
+                f"<html><head><title>Page {number}</title></head><body>"
+                f"<header>Site navigation</header><main>{paragraphs}</main>"
+                f"<footer>Copyright</footer></body></html>"
+            )
+
+    with open(os.path.join(directory, "robots.txt"), "w") as f:
+        f.write("User-agent: *\nAllow: /\n")
+
+    sitemaps = []
+    for start in range(0, pages, SITEMAP_SIZE):
+        name = f"sitemap-{start // SITEMAP_SIZE}.xml"
+        urls = "".join(
+            f"<url><loc>{{base}}/pages/{number}.html</loc><lastmod>{lastmod}</lastmod></url>"
+            for number in range(start, min(pages, start + SITEMAP_SIZE))
+        )
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+            )
+        sitemaps.append(name)
+
+    with open(os.path.join(directory, "sitemap.xml"), "w") as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            + "".join(f"<sitemap><loc>{{base}}/{name}</loc></sitemap>" for name in sitemaps)
+            + "</sitemapindex>"
+        )
+    return directory
+
+
+class SiteRequestHandler(SimpleHTTPRequestHandler):
+    ''' sitemap 안의 {base}를 실제 주소로 바꿔서 전송, access log 없음 '''
+
+    def send_head(self):
+        if not self.path.endswith(".xml"):
+            return super().send_head()
+        path = self.translate_path(self.path)
+        if not os.path.exists(path):
+            self.send_error(404)
+            return None
+        host, port = self.server.server_address[:2]
+        with open(path) as f:
+            body = f.read().replace("{base}", f"http://{host}:{port}").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return None
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_directory(directory):
+    ''' yield base url (http://127.0.0.1:{port}) '''
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(SiteRequestHandler, directory=directory)
+    )
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address[:2]
+        yield f"http://{host}:{port}"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,154 @@
+"""
+Deterministic stand-ins for OpenAI / Ollama used by the offline benchmarks.
+
+Both fakes cost a fixed latency per request plus a fixed time per token, so
+a run measures our own pipeline (parsing, splitting, batching, FAISS, chain
+plumbing) against a provider that always behaves the same way.
+
+- `FakeEmbeddings`: hashed bag-of-words vectors (same text -> same vector,
+  shared words -> similar vectors), `latency_ms` per request and
+  `ms_per_1k_tokens` per input token
+- `FakeChatModel`: answers the QuizGPT prompts from the context it is given,
+  as a `create_quiz` function call when `functions` are bound and in the
+  `Question: / Answers:` text format otherwise, taking `ttft_ms` before the
+  first token and `1 / tokens_per_second` per completion token after it
+"""
+import json
+import threading
+import time
+import zlib
+
+import numpy as np
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+from langchain.schema.embeddings import Embeddings
+
+from utils.context import get_encoding
+from utils.hybrid import tokenize
+from utils.quiz import QUIZ_SIZE
+
+def count_tokens(text):
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, dimension=1536, latency_ms=50.0, ms_per_1k_tokens=5.0):
+        self.model = f"fake-{dimension}"
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.tokens = 0
+
+    def vector(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text):
+            hashed = zlib.crc32(token.encode())
+            vector[hashed % self.dimension] += 1.0 if hashed & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def wait(self, texts):
+        tokens = sum(count_tokens(text) for text in texts)
+        with self.lock:
+            self.requests += 1
+            self.tokens += tokens
+        time.sleep((self.latency_ms + self.ms_per_1k_tokens * tokens / 1000) / 1000)
+
+    def embed_documents(self, texts):
+        self.wait(texts)
+        return [self.vector(text).tolist() for text in texts]
+
+    def embed_query(self, text):
+        self.wait([text])
+        return self.vector(text).tolist()
+
+    def stats(self):
+        return {"requests": self.requests, "tokens": self.tokens}
+
+
+def pick_facts(context, count):
+    ''' context에서 고르게 (앞 단어 두 개, 정답 단어, 오답 세 개) 추출 '''
+    words = [word for word in context.split() if word.isalpha()]
+    if len(words) < 6:
+        return []
+    facts = []
+    step = max(1, (len(words) - 3) // count)
+    for i in range(0, len(words) - 3, step)[:count]:
+        wrong = [words[(i + offset) % len(words)] for offset in (7, 13, 29)]
+        facts.append((words[i], words[i + 1], words[i + 2], wrong))
+    return facts
+
+
+def make_questions(context, count=QUIZ_SIZE):
+    questions = []
+    for first, second, answer, wrong in pick_facts(context, count):
+        options = [{"answer": word, "correct": False} for word in wrong]
+        options.insert(len(questions) % 4, {"answer": answer, "correct": True})
+        questions.append({
+            "question": f"Which word follows '{first} {second}' in the text?",
+            "answers": options,
+        })
+    return questions
+
+
+def format_quiz_text(questions):
+    lines = []
+    for question in questions:
+        lines.append(f"Question: {question['question']}")
+        lines.append("Answers: " + "|".join(
+            answer["answer"] + ("(o)" if answer["correct"] else "")
+            for answer in question["answers"]
+        ))
+        lines.append("")
+    return "\n".join(lines)
+
+
+class FakeChatModel(BaseChatModel):
+    ttft_ms: float = 400.0
+    tokens_per_second: float = 60.0
+    streaming: bool = False
+    cache: bool = False
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(message.content for message in messages)
+        # prompt 끝의 "Context: ..." 부분만 사용
+        context = prompt.rsplit("Context:", 1)[-1]
+        questions = make_questions(context)
+
+        if kwargs.get("functions"):
+            content = ""
+            arguments = json.dumps({"questions": questions})
+            additional_kwargs = {
+                "function_call": {"name": kwargs["functions"][0]["name"], "arguments": arguments}
+            }
+            completion = arguments
+        else:
+            content = format_quiz_text(questions)
+            additional_kwargs = {}
+            completion = content
+
+        time.sleep(self.ttft_ms / 1000)
+        tokens = encoding.encode(completion, disallowed_special=())
+        if self.streaming and run_manager:
+            for token in tokens:
+                run_manager.on_llm_new_token(encoding.decode([token]))
+                time.sleep(1 / self.tokens_per_second)
+        else:
+            time.sleep(len(tokens) / self.tokens_per_second)
+
+        return ChatResult(
+            generations=[ChatGeneration(
+                message=AIMessage(content=content, additional_kwargs=additional_kwargs)
+            )],
+            llm_output={"token_usage": {
+                "prompt_tokens": count_tokens(prompt),
+                "completion_tokens": len(tokens),
+                "total_tokens": count_tokens(prompt) + len(tokens),
+            }},
+        )
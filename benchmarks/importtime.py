@@ -0,0 +1,222 @@
+"""
+Import-time profile of the Streamlit entry points (cold start / first paint).
+
+Every target runs in a fresh interpreter under `python -X importtime`, in
+Streamlit's bare mode: there is no server, so widgets return their defaults
+and the run is exactly a page's first paint with nothing uploaded or typed.
+Each run happens in an empty temporary working directory, so ./.cache is
+never touched, and `OLLAMA_BASE_URL` points at a closed local port, so
+PrivateGPT's model preload fails at once instead of adding Ollama's load time
+to the page's wall time.
+
+For each target the report shows
+
+    wall        time to execute the script, interpreter startup excluded
+    imports     sum of all module import times (-X importtime "self")
+    modules     number of modules imported
+    heavy       loaded modules from `HEAVY_PACKAGES` (unstructured, faiss,
+                wikipedia) - these must only load when a feature is used
+    top         the slowest top-level imports (cumulative) and packages
+
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime pages/04_SiteGPT.py --top 30
+    python -m benchmarks.importtime --check    # exit 1 if a first paint fails or loads a heavy package
+
+Results are saved in the same JSON format as benchmarks/suite.py, so two runs
+can be diffed with `python -m benchmarks.suite compare`.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.suite import RESULTS_DIR, git_commit, metric
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_PACKAGES = ("unstructured", "faiss", "wikipedia")
+# 닫힌 port -> 연결이 바로 거부되어 preload가 wall time에 들어가지 않음
+UNREACHABLE_OLLAMA_URL = "http://127.0.0.1:9"
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+START_MARKER = "importtime: start"
+
+# child process: page를 bare mode로 실행하고 결과를 stdout 마지막 줄에 JSON으로
+RUNNER = """
+import json, runpy, sys, time
+sys.path.insert(0, {root!r})
+# interpreter / runner 자체의 import는 제외
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+try:
+    runpy.run_path({path!r}, run_name="__main__")
+    status = "ok"
+except BaseException as error:
+    status = f"{{type(error).__name__}}: {{error}}"
+print(json.dumps({{
+    "wall_ms": (time.perf_counter() - start) * 1000,
+    "status": status,
+    "modules": sorted(sys.modules),
+}}))
+"""
+
+
+def default_targets():
+    return [os.path.join(ROOT, "Home.py")] + sorted(glob.glob(os.path.join(ROOT, "pages", "*.py")))
+
+
+def target_name(path):
+    ''' pages/04_SiteGPT.py -> SiteGPT '''
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name.split("_", 1)[1] if "_" in name else name
+
+
+def parse_importtime(stderr):
+    ''' -X importtime 출력 -> [(module, self_us, cumulative_us, depth)] '''
+    imports = []
+    stderr = stderr.split(START_MARKER, 1)[-1]
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return imports
+
+
+def profile_once(path):
+    env = dict(os.environ)
+    # client는 처음 쓸 때 만들어지지만, 혹시 first paint에서 만들어도 실패하지 않도록
+    env.setdefault("OPENAI_API_KEY", "sk-importtime")
+    # 실제 Ollama가 떠 있어도 model load를 기다리지 않도록 항상 덮어씀
+    env["OLLAMA_BASE_URL"] = UNREACHABLE_OLLAMA_URL
+    with tempfile.TemporaryDirectory(prefix="fullstack-gpt-importtime-") as directory:
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", RUNNER.format(root=ROOT, path=path, marker=START_MARKER)],
+            cwd=directory,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    lines = process.stdout.strip().splitlines()
+    if process.returncode or not lines:
+        raise RuntimeError(f"{path} exited with {process.returncode}:\n{process.stderr[-2000:]}")
+    result = json.loads(lines[-1])
+    result["imports"] = parse_importtime(process.stderr)
+    return result
+
+
+def summarize(path, runs, top):
+    ''' 실패한 run이 있으면 그 status, 측정값은 성공한 run만 (모두 실패하면 전체 run) '''
+    status = next((run["status"] for run in runs if run["status"] != "ok"), "ok")
+    runs = [run for run in runs if run["status"] == "ok"] or runs
+    imports = runs[-1]["imports"]
+    packages = defaultdict(int)
+    for module, self_us, _, _ in imports:
+        packages[module.split(".")[0]] += self_us
+    top_level = sorted(
+        (item for item in imports if item[3] == 0), key=lambda item: -item[2]
+    )[:top]
+    return {
+        "target": os.path.relpath(path, ROOT),
+        "status": status,
+        "wall_ms": statistics.median(run["wall_ms"] for run in runs),
+        "imports_ms": statistics.median(
+            sum(item[1] for item in run["imports"]) / 1000 for run in runs
+        ),
+        "modules": len(imports),
+        "heavy": sorted({
+            module for module in runs[-1]["modules"]
+            if module.split(".")[0] in HEAVY_PACKAGES
+        }),
+        "top_imports": [[module, round(cumulative / 1000, 1)] for module, _, cumulative, _ in top_level],
+        "top_packages": [
+            [package, round(self_us / 1000, 1)]
+            for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        ],
+    }
+
+
+def print_report(report):
+    print(f"{report['target']}  [{report['status']}]")
+    print(
+        f"  wall {report['wall_ms']:.0f} ms · imports {report['imports_ms']:.0f} ms"
+        f" · {report['modules']} modules"
+    )
+    heavy_packages = sorted({module.split(".")[0] for module in report["heavy"]})
+    print(f"  heavy: {', '.join(heavy_packages) or '-'}")
+    print("  slowest top-level imports (cumulative ms):")
+    for module, ms in report["top_imports"]:
+        print(f"    {ms:>9.1f}  {module}")
+    print("  slowest packages (self ms):")
+    for package, ms in report["top_packages"]:
+        print(f"    {ms:>9.1f}  {package}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("targets", nargs="*", help="scripts to profile (default: Home.py and pages/*.py)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output")
+    parser.add_argument("--check", action="store_true", help=f"exit 1 if a first paint fails or imports {', '.join(HEAVY_PACKAGES)}")
+    args = parser.parse_args()
+
+    targets = [os.path.abspath(target) for target in args.targets] or default_targets()
+    metrics = {}
+    details = {}
+    failed = []
+    for path in targets:
+        print(f"profiling {os.path.relpath(path, ROOT)}...", file=sys.stderr)
+        runs = [profile_once(path) for _ in range(args.repeat)]
+        report = summarize(path, runs, args.top)
+        print_report(report)
+        name = target_name(path)
+        details[f"importtime.{name}"] = report
+        # 중간에 멈춘 page의 시간은 first paint가 아니므로 metric에 넣지 않음
+        if report["status"] != "ok":
+            failed.append(f"{name} ({report['status']})")
+            continue
+        metrics.update({
+            f"importtime.{name}.wall_ms": metric(report["wall_ms"], "ms"),
+            f"importtime.{name}.imports_ms": metric(report["imports_ms"], "ms"),
+            f"importtime.{name}.modules": metric(report["modules"], "modules"),
+            f"importtime.{name}.heavy_modules": metric(len(report["heavy"]), "modules"),
+        })
+        if report["heavy"]:
+            failed.append(f"{name} (heavy: {', '.join(report['heavy'])})")
+
+    commit = git_commit()
+    result = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {"targets": [os.path.relpath(path, ROOT) for path in targets], "repeat": args.repeat},
+        },
+        "metrics": metrics,
+        "details": details,
+    }
+    output = args.output or os.path.join(
+        ROOT, RESULTS_DIR, f"importtime-{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'local'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {output}", file=sys.stderr)
+
+    if args.check and failed:
+        print(f"first paint failed or loaded heavy packages: {'; '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+recall@k of plain dense search vs hybrid (BM25 + dense, RRF) retrieval.
+
+Queries are generated from the index itself: a random chunk is picked and a
+short span of it (one that contains a rare / identifier-like word when
+possible) becomes the query; the chunk it came from is the only relevant
+result.
+
+    python -m benchmarks.retrieval_recall ./.cache/files/<digest> --queries 200 --k 4
+    python -m benchmarks.retrieval_recall ./.cache/sites/<digest> --rerank cross-encoder/ms-marco-MiniLM-L-6-v2
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from langchain.embeddings import OllamaEmbeddings, OpenAIEmbeddings
+
+from utils.hybrid import HybridRetriever, tokenize
+from utils.index_store import load_index
+from utils.ollama import OLLAMA_BASE_URL, OLLAMA_EMBEDDING_MODEL
+
+
+def make_queries(vectorstore, count, words=8, seed=0):
+    rng = random.Random(seed)
+    docs = list(vectorstore.docstore._dict.values())
+    frequency = {}
+    for doc in docs:
+        for token in set(tokenize(doc.page_content)):
+            frequency[token] = frequency.get(token, 0) + 1
+
+    queries = []
+    for doc in rng.sample(docs, min(count, len(docs))):
+        tokens = doc.page_content.split()
+        if len(tokens) < words:
+            continue
+        # 가장 드문 단어 주변을 query로 -> keyword 검색이 유리한 경우도 포함
+        rarest = min(
+            range(len(tokens)),
+            key=lambda i: min((frequency.get(t, 0) for t in tokenize(tokens[i])), default=len(docs)),
+        )
+        start = max(0, min(rarest - words // 2, len(tokens) - words))
+        queries.append((" ".join(tokens[start:start + words]), doc.page_content))
+    return queries
+
+
+def evaluate(name, search, queries, k):
+    hits = 0
+    latencies = []
+    for query, expected in queries:
+        started = time.perf_counter()
+        docs = search(query)[:k]
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += any(doc.page_content == expected for doc in docs)
+    return {
+        "retriever": name,
+        f"recall@{k}": hits / len(queries) if queries else 0,
+        "p50_ms": statistics.median(latencies) if latencies else 0,
+        "p95_ms": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("index_dir")
+    parser.add_argument("--embeddings", choices=["openai", "ollama"], default="openai")
+    # PrivateGPT index는 이 model로 embedding 됨 (query도 같은 model이어야 함)
+    parser.add_argument("--ollama-model", default=OLLAMA_EMBEDDING_MODEL)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rerank")
+    args = parser.parse_args()
+
+    if args.embeddings == "openai":
+        embeddings = OpenAIEmbeddings()
+    else:
+        embeddings = OllamaEmbeddings(model=args.ollama_model, base_url=OLLAMA_BASE_URL)
+    vectorstore = load_index(args.index_dir, embeddings)
+    queries = make_queries(vectorstore, args.queries)
+
+    hybrid = HybridRetriever.from_vectorstore(
+        vectorstore, args.index_dir, k=args.k, rerank_model=None, budget_ms=0
+    )
+    results = [
+        evaluate("dense", lambda q: vectorstore.similarity_search(q, k=args.k), queries, args.k),
+        evaluate("hybrid", hybrid.get_relevant_documents, queries, args.k),
+    ]
+    if args.rerank:
+        reranked = HybridRetriever.from_vectorstore(
+            vectorstore, args.index_dir, k=args.k, rerank_model=args.rerank, budget_ms=0
+        )
+        results.append(evaluate("hybrid+rerank", reranked.get_relevant_documents, queries, args.k))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
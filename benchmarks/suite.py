@@ -0,0 +1,411 @@
+"""
+Offline benchmark suite for the ingestion and query hot paths.
+
+Every scenario runs the same utils code the pages call, against the
+deterministic fakes in benchmarks/fakes.py and the seeded corpora in
+benchmarks/corpora.py, inside a fresh temporary working directory (all
+caches live under ./.cache, so nothing is shared with a real install or
+between repeats):
+
+    ingest      embed_file: embed_upload on a synthetic PDF and text file
+                (cold, then warm from the on-disk index)
+    crawl       load_website: crawl_site against a local HTTP server serving a
+                synthetic sitemap, then re-crawl with nothing changed and
+                load the index + BM25 for querying
+    retrieval   dense and hybrid query latency at 1k / 100k / 1M chunks
+    quiz        QuizGPT end to end: split_upload + make_quiz, for a short
+                document (one LLM call) and a long one (map-reduce)
+
+    python -m benchmarks.suite run
+    python -m benchmarks.suite run --quick --scenarios ingest,quiz
+    python -m benchmarks.suite compare benchmarks/results/base.json benchmarks/results/new.json
+
+Results are JSON: `meta` (commit, machine, settings) and a flat `metrics`
+map of {"value", "unit", "better"}; `compare` exits with 1 when a metric
+got worse by more than `--tolerance`.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+from langchain.vectorstores.faiss import FAISS
+
+from benchmarks.corpora import (
+    make_vocabulary,
+    serve_directory,
+    write_pdf,
+    write_site,
+    write_text,
+)
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from utils.ann_index import build_index, choose_index_spec
+from utils.crawl import crawl_site, get_site_dir, make_splitter, parse_page
+from utils.embedding_executor import BatchedEmbeddings
+from utils.embedding_store import cache_backed_embeddings
+from utils.hybrid import HybridRetriever
+from utils.index_store import load_index
+from utils.ingest import embed_upload, split_upload
+from utils.quiz import make_quiz
+from utils.tracing import Trace
+
+SCENARIOS = ("ingest", "crawl", "retrieval", "quiz")
+RESULTS_DIR = "benchmarks/results"
+
+
+def metric(value, unit, better="lower"):
+    ''' better=None 은 참고용 (compare에서 제외) '''
+    return {"value": round(float(value), 3), "unit": unit, "better": better}
+
+
+def latency_metrics(prefix, latencies):
+    return {
+        f"{prefix}.p50_ms": metric(statistics.median(latencies), "ms"),
+        f"{prefix}.p95_ms": metric(
+            statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0], "ms"
+        ),
+    }
+
+
+@contextmanager
+def workdir():
+    ''' ./.cache 아래의 모든 cache가 repeat마다 비어 있도록 임시 디렉토리에서 실행 '''
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="fullstack-gpt-bench-") as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous)
+
+
+def fake_embeddings(args, dimension=None):
+    return FakeEmbeddings(
+        dimension=dimension or args.dimension,
+        latency_ms=args.embedding_latency_ms,
+        ms_per_1k_tokens=args.embedding_ms_per_1k_tokens,
+    )
+
+
+def page_embeddings(args):
+    ''' embed_file / update_website과 같은 구성: SQLite cache -> batching -> provider '''
+    return cache_backed_embeddings(BatchedEmbeddings(fake_embeddings(args)))
+
+
+def bench_ingest(args):
+    metrics = {}
+    details = {}
+    for kind, write, pages in (
+        ("pdf", write_pdf, args.pdf_pages),
+        ("txt", write_text, args.text_pages),
+    ):
+        cold = []
+        warm = []
+        for _ in range(args.repeat):
+            with workdir():
+                path = write(f"corpus.{kind}", pages)
+                trace = Trace("bench", "ingest")
+                started = time.perf_counter()
+                with open(path, "rb") as file:
+                    vectorstore = embed_upload(file, "files", page_embeddings(args), trace=trace)
+                cold.append(time.perf_counter() - started)
+                chunks = len(vectorstore.index_to_docstore_id)
+
+                started = time.perf_counter()
+                with open(path, "rb") as file:
+                    embed_upload(file, "files", page_embeddings(args))
+                warm.append(time.perf_counter() - started)
+
+        seconds = statistics.median(cold)
+        metrics.update({
+            f"ingest.{kind}.cold_seconds": metric(seconds, "s"),
+            f"ingest.{kind}.pages_per_second": metric(pages / seconds, "pages/s", "higher"),
+            f"ingest.{kind}.chunks_per_second": metric(chunks / seconds, "chunks/s", "higher"),
+            f"ingest.{kind}.warm_ms": metric(statistics.median(warm) * 1000, "ms"),
+            f"ingest.{kind}.chunks": metric(chunks, "chunks", None),
+        })
+        details[f"ingest.{kind}"] = trace.to_record()
+    return metrics, details
+
+
+def bench_crawl(args):
+    cold = []
+    recrawl = []
+    load = []
+    for _ in range(args.repeat):
+        with workdir():
+            write_site("site", args.site_pages)
+            with serve_directory("site") as base:
+                url = f"{base}/sitemap.xml"
+                fetch_kwargs = {
+                    "requests_per_second": args.requests_per_second,
+                    "burst": args.requests_per_second,
+                    "concurrency": 16,
+                }
+                trace = Trace("bench", "crawl")
+                started = time.perf_counter()
+                vector_store = crawl_site(
+                    url, parse_page, make_splitter(), page_embeddings(args), trace=trace, **fetch_kwargs
+                )
+                cold.append(time.perf_counter() - started)
+                chunks = len(vector_store.index_to_docstore_id)
+
+                # sitemap lastmod가 그대로 -> page는 다시 가져오지 않음
+                started = time.perf_counter()
+                crawl_site(url, parse_page, make_splitter(), page_embeddings(args), **fetch_kwargs)
+                recrawl.append(time.perf_counter() - started)
+
+                # load_website: disk index + BM25
+                started = time.perf_counter()
+                site_dir = get_site_dir(url)
+                HybridRetriever.from_vectorstore(load_index(site_dir, fake_embeddings(args)), site_dir)
+                load.append(time.perf_counter() - started)
+
+    seconds = statistics.median(cold)
+    return {
+        "crawl.cold_seconds": metric(seconds, "s"),
+        "crawl.pages_per_second": metric(args.site_pages / seconds, "pages/s", "higher"),
+        "crawl.chunks_per_second": metric(chunks / seconds, "chunks/s", "higher"),
+        "crawl.recrawl_unchanged_seconds": metric(statistics.median(recrawl), "s"),
+        "crawl.load_ms": metric(statistics.median(load) * 1000, "ms"),
+        "crawl.chunks": metric(chunks, "chunks", None),
+    }, {"crawl": trace.to_record()}
+
+
+def synthetic_chunks(count, embeddings, words=40, seed=0):
+    '''
+    (docs, vectors)
+    vector는 FakeEmbeddings.vector와 같은 값을 numpy로 한 번에 계산 (1M chunk도 몇 초)
+    '''
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_vocabulary(seed=seed))
+    word_vectors = np.stack([embeddings.vector(word) for word in vocabulary])
+    buckets = np.abs(word_vectors).argmax(axis=1)
+    signs = np.sign(word_vectors[np.arange(len(vocabulary)), buckets]).astype(np.float32)
+
+    ids = np.minimum(rng.zipf(1.3, size=(count, words)) - 1, len(vocabulary) - 1)
+    ids = np.where(rng.random((count, words)) < 0.5, ids, rng.integers(0, len(vocabulary), (count, words)))
+    vectors = np.zeros((count, embeddings.dimension), dtype=np.float32)
+    rows = np.repeat(np.arange(count), words)
+    np.add.at(vectors, (rows, buckets[ids].ravel()), signs[ids].ravel())
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    docs = [
+        Document(page_content=" ".join(vocabulary[row]), metadata={"source": f"chunk-{i}"})
+        for i, row in enumerate(ids)
+    ]
+    return docs, vectors
+
+
+def bench_retrieval(args):
+    metrics = {}
+    details = {}
+    # query embedding 시간은 빼고 검색 시간만
+    embeddings = FakeEmbeddings(args.retrieval_dimension, latency_ms=0, ms_per_1k_tokens=0)
+    rng = random.Random(0)
+    for size in args.sizes:
+        docs, vectors = synthetic_chunks(size, embeddings)
+        started = time.perf_counter()
+        spec = choose_index_spec(size, embeddings.dimension)
+        index = build_index(vectors, spec=spec)
+        del vectors
+        ids = [str(i) for i in range(size)]
+        vectorstore = FAISS(
+            embeddings, index, InMemoryDocstore(dict(zip(ids, docs))), dict(enumerate(ids))
+        )
+        build_seconds = time.perf_counter() - started
+
+        queries = []
+        for doc in rng.sample(docs, min(args.queries, size)):
+            words = doc.page_content.split()
+            start = rng.randrange(0, max(1, len(words) - 8))
+            queries.append((" ".join(words[start:start + 8]), doc.metadata["source"]))
+
+        latencies = []
+        hits = 0
+        for query, source in queries:
+            started = time.perf_counter()
+            result = vectorstore.similarity_search(query, k=args.k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += any(doc.metadata["source"] == source for doc in result)
+        prefix = f"retrieval.{size}"
+        metrics.update(latency_metrics(f"{prefix}.dense", latencies))
+        metrics[f"{prefix}.dense.recall@{args.k}"] = metric(hits / len(queries), "ratio", "higher")
+        metrics[f"{prefix}.build_seconds"] = metric(build_seconds, "s")
+        details[prefix] = {"spec": spec}
+
+        if size <= args.hybrid_max:
+            hybrid = HybridRetriever.from_vectorstore(
+                vectorstore, k=args.k, rerank_model=None, budget_ms=0
+            )
+            latencies = []
+            for query, _ in queries:
+                started = time.perf_counter()
+                hybrid.get_relevant_documents(query)
+                latencies.append((time.perf_counter() - started) * 1000)
+            metrics.update(latency_metrics(f"{prefix}.hybrid", latencies))
+        del vectorstore, docs
+    return metrics, details
+
+
+def bench_quiz(args):
+    metrics = {}
+    details = {}
+    for name, pages in (("single", args.quiz_short_pages), ("map_reduce", args.quiz_pages)):
+        totals = []
+        for _ in range(args.repeat):
+            with workdir():
+                path = write_pdf("corpus.pdf", pages, seed=1)
+                llm = FakeChatModel(ttft_ms=args.ttft_ms, tokens_per_second=args.tokens_per_second)
+                trace = Trace("bench", "quiz")
+                started = time.perf_counter()
+                with open(path, "rb") as file:
+                    _, docs = split_upload(file, "quiz_files", trace)
+                quiz = make_quiz(
+                    docs, llm, fake_embeddings(args), config={"callbacks": [trace.handler()]}
+                )
+                totals.append(time.perf_counter() - started)
+        metrics.update({
+            f"quiz.{name}.seconds": metric(statistics.median(totals), "s"),
+            f"quiz.{name}.questions": metric(len(quiz["questions"]), "questions", None),
+        })
+        details[f"quiz.{name}"] = trace.to_record()
+    return metrics, details
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    settings = {
+        key: value for key, value in vars(args).items()
+        if key not in ("command", "output", "func")
+    }
+    metrics = {}
+    details = {}
+    for name in args.scenarios:
+        print(f"running {name}...", file=sys.stderr)
+        scenario_metrics, scenario_details = globals()[f"bench_{name}"](args)
+        metrics.update(scenario_metrics)
+        details.update(scenario_details)
+
+    commit = git_commit()
+    result = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": settings,
+        },
+        "metrics": metrics,
+        "details": details,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'local'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(metrics, indent=2))
+    print(f"saved {output}", file=sys.stderr)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline["meta"]["settings"] != current["meta"]["settings"]:
+        print("warning: runs used different settings", file=sys.stderr)
+
+    regressions = []
+    for name in sorted(baseline["metrics"].keys() & current["metrics"].keys()):
+        before = baseline["metrics"][name]
+        after = current["metrics"][name]
+        better = after["better"]
+        change = (after["value"] - before["value"]) / before["value"] if before["value"] else 0.0
+        worse = better is not None and (
+            change > args.tolerance if better == "lower" else change < -args.tolerance
+        )
+        if worse:
+            regressions.append(name)
+        print(
+            f"{'REGRESSION' if worse else '':10} {name:45} "
+            f"{before['value']:>12} -> {after['value']:>12} {after['unit']:10} {change:+.1%}"
+        )
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.tolerance:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    run_parser.add_argument("--quick", action="store_true", help="small corpora, 1 repeat")
+    run_parser.add_argument("--output")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--sizes", default="1000,100000,1000000")
+    run_parser.add_argument("--queries", type=int, default=200)
+    run_parser.add_argument("--k", type=int, default=4)
+    run_parser.add_argument("--hybrid-max", type=int, default=100_000)
+    run_parser.add_argument("--pdf-pages", type=int, default=100)
+    run_parser.add_argument("--text-pages", type=int, default=100)
+    run_parser.add_argument("--site-pages", type=int, default=200)
+    run_parser.add_argument("--quiz-short-pages", type=int, default=2)
+    run_parser.add_argument("--quiz-pages", type=int, default=40)
+    run_parser.add_argument("--requests-per-second", type=float, default=200)
+    run_parser.add_argument("--dimension", type=int, default=1536)
+    # 1M x 1536 float32는 6GB -> retrieval은 더 작은 차원으로
+    run_parser.add_argument("--retrieval-dimension", type=int, default=256)
+    run_parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    run_parser.add_argument("--embedding-ms-per-1k-tokens", type=float, default=5)
+    run_parser.add_argument("--ttft-ms", type=float, default=400)
+    run_parser.add_argument("--tokens-per-second", type=float, default=60)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        args.scenarios = [name for name in args.scenarios.split(",") if name]
+        unknown = set(args.scenarios) - set(SCENARIOS)
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        args.sizes = [int(size) for size in args.sizes.split(",")]
+        if args.quick:
+            args.repeat = 1
+            args.sizes = [size for size in args.sizes if size <= 10_000] or [1000]
+            args.pdf_pages = args.text_pages = 20
+            args.site_pages = 50
+            args.quiz_pages = 20
+        args.output = args.output and os.path.abspath(args.output)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,21 @@
+from functools import partial
+from operator import itemgetter
+
 import streamlit as st
 from langchain.callbacks.base import BaseCallbackHandler
-from langchain.chat_models import ChatOpenAI
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.embeddings import OpenAIEmbeddings, CacheBackedEmbeddings
 from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-from langchain.storage import LocalFileStore
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
+from langchain.schema.runnable import RunnableLambda
+
+from utils import jobs
+from utils.collection import as_filtered_retriever, merge_collection
+from utils.context import make_formatter
+from utils.hybrid import BM25Index
+from utils.index_store import index_exists, index_version, load_index
+from utils.ingest import embed_upload, get_ingest_dir, get_partial_dir, write_upload
+from utils.resources import get_cached_embeddings, get_chat_openai, get_openai_embeddings
+from utils.semantic_cache import SemanticCache
+from utils.vector_client import remote_retriever
+from utils.tracing import Trace
 
 st.set_page_config(
     page_title="DocumentGPT",
@@ -22,35 +30,79 @@ def paint_history():
         send_message(message['message'], message['role'], save=False)
 
 
-@st.cache_data(show_spinner="Embedding file...")
-def embed_file(file):
-    ''' 현재 data가 변경될 때마다 매번 embed file function을 실행
-     사용자가 message를 보낼 때마다 function 실행 -> 불필요한 반복 실행'''
-    file_content = file.read()
-    file_path = f"./.cache/files/{file.name}"
-    with open(file_path, 'wb') as f:
-        f.write(file_content)
-
-    cache_dir = LocalFileStore(f"./.cache/embeddings/{file.name}")
-
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator='\n',
-        chunk_size=600,
-        chunk_overlap=100,
-    )
-
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
-    embeddings = OpenAIEmbeddings()
-
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(
-        embeddings, cache_dir
-    )
+def embed_job(file_path, progress):
+    ''' background thread에서 실행 (st.* 사용 금지), 결과는 디스크의 index '''
+    # 파일 이름이 아닌 내용 hash로 cache -> 같은 파일은 다시 embedding 하지 않음
+    trace = Trace("DocumentGPT", "ingest")
+    with open(file_path, "rb") as file:
+        vectorstore = embed_upload(
+            file,
+            "files",
+            # SQLite embedding cache + token 수 기준 batching (process 전체에서 하나)
+            get_cached_embeddings(),
+            on_progress=lambda embedded: progress.update(chunks=embedded),
+            trace=trace,
+            on_page=lambda pages: progress.update(pages=pages),
+            save_partial=True,
+        )
+    trace.finish()
+    if vectorstore is None:
+        raise ValueError("No text could be extracted from this file")
+
+
+def ingest_file(digest, file_path, retry=False):
+    ''' index가 이미 있으면 None, 없으면 background job 상태 (session이 끊겨도 계속 진행) '''
+    if index_exists(get_ingest_dir("files", digest)):
+        return None
+    return jobs.submit(f"files/{digest}", "embed", embed_job, file_path, retry=retry)
+
+
+def get_index_dir(digest, state):
+    '''
+    embedding이 끝난 파일은 index, 진행 중이면 지금까지 저장된 partial index
+    아직 검색할 수 있는 chunk가 없으면 None
+    '''
+    index_dir = get_ingest_dir("files", digest)
+    if state is None:
+        return index_dir
+    if jobs.is_active(state) and index_exists(get_partial_dir(index_dir)):
+        return get_partial_dir(index_dir)
+    return None
+
+
+@st.cache_resource(show_spinner="Loading file...")
+def load_file(digest):
+    return load_index(get_ingest_dir("files", digest), get_cached_embeddings())
+
+
+@st.cache_resource(show_spinner="Loading embedded chunks...", max_entries=8)
+def load_partial(digest, version):
+    ''' embedding 중인 파일의 앞부분, version(저장 시점)마다 한 번 load '''
+    return load_index(get_partial_dir(get_ingest_dir("files", digest)), get_cached_embeddings())
+
+
+# partial index는 저장될 때마다 version이 바뀌므로 오래된 조합은 버림
+@st.cache_resource(show_spinner="Merging files...", max_entries=16)
+def load_collection(_vectorstores, digests, file_names, versions):
+    ''' 파일별 index를 합치기만 함 -> 파일을 추가 / 삭제해도 다시 embedding 하지 않음 '''
+    collection = merge_collection(zip(digests, file_names, _vectorstores))
+    return collection, BM25Index.from_vectorstore(collection)
+
+
+def load_local_retriever(digests, file_names, versions, selected):
+    ''' vector service 없이 이 process에서 파일별 index를 load 해서 합친 collection으로 검색 '''
+    vectorstores = [
+        load_file(digest) if version is None else load_partial(digest, version)
+        for digest, version in zip(digests, versions)
+    ]
+    collection, bm25 = load_collection(vectorstores, digests, file_names, versions)
+    return as_filtered_retriever(collection, bm25, selected)
 
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
 
-    retriever = vectorstore.as_retriever()
-    return retriever
+@st.cache_resource
+def get_answer_cache(index_key):
+    ''' index(파일 조합 + filter)마다 따로 cache '''
+    return SemanticCache(get_openai_embeddings())
 
 
 def save_message(message, role):
@@ -68,10 +120,6 @@ def send_message(message, role, save=True):
         save_message(message, role)
 
 
-def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
-
-
 class ChatCallbackHandler(BaseCallbackHandler):
     message = ""
 
@@ -86,24 +134,36 @@ class ChatCallbackHandler(BaseCallbackHandler):
         self.message_box.markdown(self.message)
 
 
-llm = ChatOpenAI(
-    temperature=0.1,
-    streaming=True,
-    callbacks=[
-        ChatCallbackHandler(),
-    ]
-)
-prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        """
-        Answer the question using ONLY the following context. If you don't know the answer just say you don't know. DON'T make anything up.
-        
-        Context: {context}
-        """
-    ),
-    ("human", "{question}")
-])
+@st.cache_resource
+def get_chain():
+    '''
+    process당 한 번만 만듦 -> rerun 마다 client / prompt / chain을 다시 만들지 않음
+    retriever와 ChatCallbackHandler는 session마다 달라서 invoke 할 때 전달
+    '''
+    llm = get_chat_openai(
+        temperature=0.1,
+        streaming=True,
+        # token을 화면에 streaming 하므로 LLM cache를 쓰지 않음
+        cache=False,
+    )
+    prompt = ChatPromptTemplate.from_messages([
+        (
+            "system",
+            """
+            Answer the question using ONLY the following context. If you don't know the answer just say you don't know. DON'T make anything up.
+            
+            Context: {context}
+            """
+        ),
+        ("human", "{question}")
+    ])
+    # 겹치는 chunk는 합치고 중복은 버린 뒤 model context에 맞는 token 수까지만
+    format_docs = make_formatter(llm, prompt)
+    return {
+        "context": itemgetter("docs") | RunnableLambda(format_docs),
+        "question": itemgetter("question"),
+    } | prompt | llm
+
 
 # 사용자의 파일 업로드 요청
 st.markdown("""
@@ -115,25 +175,108 @@ Upload your files on the sidebar!
 """)
 
 with st.sidebar:
-    file = st.file_uploader(
-        "Upload a .txt, .pdf, .docx file",
-        type=["pdf", "txt", "docx"]
+    files = st.file_uploader(
+        "Upload .txt, .pdf, .docx files",
+        type=["pdf", "txt", "docx"],
+        accept_multiple_files=True,
     )
 
-if file:
-    retriever = embed_file(file)
-    send_message("I'm ready! Ask away!", "ai", save=False)
+states = {}
+if files:
+    uploads = [write_upload(file, "files") for file in files]
+    states = {
+        digest: ingest_file(digest, file_path) for digest, file_path in uploads
+    }
+    with st.sidebar:
+        for file, (digest, file_path) in zip(files, uploads):
+            jobs.render_job(
+                states[digest],
+                file.name,
+                partial(ingest_file, digest, file_path, retry=True),
+                key=f"retry-{digest}",
+            )
+
+    # embedding이 끝난 파일 + 진행 중인 파일은 지금까지 embedding 된 chunk만
+    ready = [
+        (file, digest, index_dir) for file, (digest, _) in zip(files, uploads)
+        if (index_dir := get_index_dir(digest, states[digest])) is not None
+    ]
+    files = [file for file, _, _ in ready]
+
+if files:
+    digests = tuple(digest for _, digest, _ in ready)
+    file_names = tuple(file.name for file in files)
+    index_dirs = [index_dir for _, _, index_dir in ready]
+    # 진행 중인 파일의 partial index version (끝난 파일은 None)
+    versions = tuple(
+        None if states[digest] is None else index_version(index_dir)
+        for digest, index_dir in zip(digests, index_dirs)
+    )
+    has_partial = any(version is not None for version in versions)
+
+    with st.sidebar:
+        selected = st.multiselect(
+            "Search only in",
+            options=digests,
+            format_func=lambda digest: file_names[digests.index(digest)],
+        )
+    # VECTOR_SERVICE_URL이 있으면 선택한 파일의 index만 vector service에 검색 요청
+    local = partial(load_local_retriever, digests, file_names, versions, selected)
+    retriever = remote_retriever(
+        [index_dir for digest, index_dir in zip(digests, index_dirs) if not selected or digest in selected],
+        get_cached_embeddings(),
+        labels={
+            index_dir: {"digest": digest, "file_name": file_name}
+            for digest, file_name, index_dir in zip(digests, file_names, index_dirs)
+        },
+        fallback=local,
+    )
+    if retriever is None:
+        try:
+            retriever = local()
+        # job이 끝나면서 partial/을 지운 경우 -> 다시 실행하면 전체 index 사용
+        except FileNotFoundError:
+            st.rerun()
+    if has_partial:
+        st.caption("Files that are still being embedded are searched up to the chunks embedded so far.")
+    else:
+        send_message("I'm ready! Ask away!", "ai", save=False)
     paint_history()
 
-    message = st.chat_input("Ask Anything about your file...")
+    message = st.chat_input("Ask Anything about your files...")
     if message:
         send_message(message, "human")
 
-        chain = {
-                    "context": retriever | RunnableLambda(format_docs),
-                    "question": RunnablePassthrough()
-                } | prompt | llm
-        with st.chat_message("ai"):
-            response = chain.invoke(message)
-else:
+        trace = Trace("DocumentGPT", "query")
+        # 비슷한 질문을 이미 했다면 LLM을 다시 호출하지 않음
+        # 파일 앞부분만 보고 한 답은 저장하지 않음 (이번 질문에만 쓰는 빈 cache)
+        answer_cache = SemanticCache(get_openai_embeddings()) if has_partial else get_answer_cache(
+            (digests, tuple(sorted(selected)))
+        )
+        with trace.stage("cache_lookup"):
+            question_vector = answer_cache.embed(message)
+            cached_answer = answer_cache.lookup(question_vector)
+        trace.cache_result("answer", cached_answer is not None)
+        if cached_answer is not None:
+            send_message(cached_answer, "ai")
+        else:
+            docs = retriever.get_relevant_documents(
+                message, callbacks=[trace.handler()]
+            )
+            with st.chat_message("ai"):
+                response = get_chain().invoke(
+                    {"docs": docs, "question": message},
+                    config={"callbacks": [ChatCallbackHandler(), trace.handler()]},
+                )
+            answer_cache.store(question_vector, response.content)
+        trace.finish()
+
+        with st.sidebar:
+            st.caption("Answer cache: {hits} hits / {misses} misses".format(
+                **answer_cache.stats
+            ))
+elif not states:
     st.session_state['messages'] = []
+
+# 진행 중인 job이 있으면 잠시 후 다시 실행해서 progress / 완성된 index 반영
+jobs.poll_if_active(states.values())
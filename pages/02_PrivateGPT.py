@@ -1,13 +1,21 @@
+from functools import partial
+from operator import itemgetter
+
 import streamlit as st
 from langchain.callbacks.base import BaseCallbackHandler
-from langchain.chat_models import ChatOllama
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.embeddings import OllamaEmbeddings, CacheBackedEmbeddings
 from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
-from langchain.storage import LocalFileStore
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
+from langchain.schema.runnable import RunnableLambda
+
+from utils import jobs
+from utils.context import make_formatter
+from utils.hybrid import HybridRetriever
+from utils.index_store import index_exists, index_version, load_index
+from utils.ingest import embed_upload, get_ingest_dir, get_partial_dir, write_upload
+from utils.ollama import OllamaManager
+from utils.resources import get_cached_embeddings
+from utils.semantic_cache import SemanticCache
+from utils.vector_client import remote_retriever
+from utils.tracing import Trace
 
 st.set_page_config(
     page_title="PrivateGPT",
@@ -17,40 +25,114 @@ st.set_page_config(
 st.title("PrivateGPT")
 
 
+@st.cache_resource(show_spinner="Loading local models...")
+def get_ollama():
+    ''' process당 한 번 model을 memory에 올리고 계속 warm 상태로 유지 '''
+    manager = OllamaManager()
+    manager.preload()
+    manager.start_keep_alive()
+    return manager
+
+
+def get_namespace():
+    # embedding model이 바뀌면 index도 따로 저장
+    return "private_files/" + ollama.embedding_model_name.replace(":", "_")
+
+
 def paint_history():
     for message in st.session_state['messages']:
         send_message(message['message'], message['role'], save=False)
 
 
-@st.cache_data(show_spinner="Embedding file...")
-def embed_file(file):
-    ''' 현재 data가 변경될 때마다 매번 embed file function을 실행
-     사용자가 message를 보낼 때마다 function 실행 -> 불필요한 반복 실행'''
-    file_content = file.read()
-    file_path = f"./.cache/private_files/{file.name}"
-    with open(file_path, 'wb') as f:
-        f.write(file_content)
+def local_embeddings(manager):
+    # SQLite embedding cache + batching, embedding model마다 process당 하나
+    # local model이라 batch는 작게, 동시 요청도 적게
+    return get_cached_embeddings(
+        "ollama:" + manager.embedding_model_name,
+        manager.embeddings(),
+        max_batch_size=16,
+        max_concurrency=2,
+    )
 
-    cache_dir = LocalFileStore(f"./.cache/private_embeddings/{file.name}")
 
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator='\n',
-        chunk_size=600,
-        chunk_overlap=100,
+def embed_job(file_path, namespace, manager, progress):
+    ''' background thread에서 실행 (st.* 사용 금지), 결과는 디스크의 index '''
+    # 파일 이름이 아닌 내용 hash로 cache -> 같은 파일은 다시 embedding 하지 않음
+    trace = Trace("PrivateGPT", "ingest")
+    with open(file_path, "rb") as file:
+        vectorstore = embed_upload(
+            file,
+            namespace,
+            local_embeddings(manager),
+            on_progress=lambda embedded: progress.update(chunks=embedded),
+            trace=trace,
+            on_page=lambda pages: progress.update(pages=pages),
+            save_partial=True,
+        )
+    trace.finish()
+    if vectorstore is None:
+        raise ValueError("No text could be extracted from this file")
+
+
+def ingest_file(digest, file_path, retry=False):
+    ''' index가 이미 있으면 None, 없으면 background job 상태 (session이 끊겨도 계속 진행) '''
+    namespace = get_namespace()
+    if index_exists(get_ingest_dir(namespace, digest)):
+        return None
+    return jobs.submit(
+        f"{namespace}/{digest}", "embed", embed_job, file_path, namespace, ollama, retry=retry
     )
 
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
-    embeddings = OllamaEmbeddings(model="mistral:latest")
 
-    cached_embeddings = CacheBackedEmbeddings.from_bytes_store(
-        embeddings, cache_dir
+@st.cache_resource(show_spinner="Loading file...")
+def load_file(namespace, digest):
+    # vector 검색 + BM25 keyword 검색
+    index_dir = get_ingest_dir(namespace, digest)
+    return HybridRetriever.from_vectorstore(
+        load_index(index_dir, local_embeddings(ollama)), index_dir
     )
 
-    vectorstore = FAISS.from_documents(docs, cached_embeddings)
 
-    retriever = vectorstore.as_retriever()
-    return retriever
+@st.cache_resource(show_spinner="Loading embedded chunks...", max_entries=2)
+def load_partial(namespace, digest, version):
+    ''' embedding 중인 파일의 앞부분, version(저장 시점)마다 한 번 load '''
+    partial_dir = get_partial_dir(get_ingest_dir(namespace, digest))
+    return HybridRetriever.from_vectorstore(
+        load_index(partial_dir, local_embeddings(ollama)), partial_dir
+    )
+
+
+def get_retriever(digest, state):
+    '''
+    (retriever, 검색 중인 chunk 수) 반환, 아직 검색할 수 있는 chunk가 없으면 (None, 0)
+    job이 끝나지 않았으면 partial index로 앞부분만 검색
+    '''
+    namespace = get_namespace()
+    if state is None:
+        # VECTOR_SERVICE_URL이 있으면 index는 vector service가 들고 있고 page는 query만 보냄
+        local = partial(load_file, namespace, digest)
+        return remote_retriever(
+            [get_ingest_dir(namespace, digest)], local_embeddings(ollama), fallback=local
+        ) or local(), None
+    version = index_version(get_partial_dir(get_ingest_dir(namespace, digest)))
+    if not jobs.is_active(state) or version is None:
+        return None, 0
+    try:
+        retriever = load_partial(namespace, digest, version)
+    # job이 끝나면서 partial/을 지운 경우 -> 다음 rerun에서 전체 index 사용
+    except FileNotFoundError:
+        return None, 0
+    return retriever, len(retriever.vectorstore.index_to_docstore_id)
+
+
+@st.cache_resource
+def get_answer_cache(digest):
+    return SemanticCache(get_query_embeddings(ollama))
+
+
+@st.cache_resource
+def get_query_embeddings(_manager):
+    return _manager.embeddings()
 
 
 def save_message(message, role):
@@ -68,10 +150,6 @@ def send_message(message, role, save=True):
         save_message(message, role)
 
 
-def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
-
-
 class ChatCallbackHandler(BaseCallbackHandler):
     message = ""
 
@@ -86,24 +164,37 @@ class ChatCallbackHandler(BaseCallbackHandler):
         self.message_box.markdown(self.message)
 
 
-llm = ChatOllama(
-    model="mistral:latest",
-    temperature=0.1,
-    streaming=True,
-    callbacks=[
-        ChatCallbackHandler(),
-    ]
-)
-prompt = ChatPromptTemplate.from_template(
-    """
-    Answer the question using ONLY the following context and not your training data. 
-    If you don't know the answer just say you don't know. 
-    DON'T make anything up.
-
-    Context: {context}
-    Question: {question}
-    """
-)
+@st.cache_resource
+def get_chain(_manager, model_name):
+    '''
+    chat model마다 한 번만 만듦 -> rerun 마다 client / prompt / chain을 다시 만들지 않음
+    retriever와 callback(ChatCallbackHandler, metrics)은 invoke 할 때 전달
+    '''
+    llm = _manager.chat_model(
+        temperature=0.1,
+        streaming=True,
+        # token을 화면에 streaming 하므로 LLM cache를 쓰지 않음
+        cache=False,
+    )
+    prompt = ChatPromptTemplate.from_template(
+        """
+        Answer the question using ONLY the following context and not your training data. 
+        If you don't know the answer just say you don't know. 
+        DON'T make anything up.
+
+        Context: {context}
+        Question: {question}
+        """
+    )
+    # 겹치는 chunk는 합치고 중복은 버린 뒤 model context에 맞는 token 수까지만
+    format_docs = make_formatter(llm, prompt)
+    return {
+        "context": itemgetter("docs") | RunnableLambda(format_docs),
+        "question": itemgetter("question"),
+    } | prompt | llm
+
+
+ollama = get_ollama()
 
 # 사용자의 파일 업로드 요청
 st.markdown("""
@@ -119,21 +210,71 @@ with st.sidebar:
         "Upload a .txt, .pdf, .docx file",
         type=["pdf", "txt", "docx"]
     )
+    for model, error in ollama.errors.items():
+        st.error(f"Could not load {model}: {error}")
 
+state = None
 if file:
-    retriever = embed_file(file)
-    send_message("I'm ready! Ask away!", "ai", save=False)
+    digest, file_path = write_upload(file, get_namespace())
+    state = ingest_file(digest, file_path)
+    with st.sidebar:
+        jobs.render_job(state, file.name, partial(ingest_file, digest, file_path, retry=True))
+
+retriever, partial_chunks = get_retriever(digest, state) if file else (None, 0)
+if retriever is not None:
+    if partial_chunks is None:
+        send_message("I'm ready! Ask away!", "ai", save=False)
+    else:
+        st.caption(f"Searching the first {partial_chunks} chunks while {file.name} is still being embedded.")
     paint_history()
 
     message = st.chat_input("Ask Anything about your file...")
     if message:
         send_message(message, "human")
 
-        chain = {
-            "context": retriever | RunnableLambda(format_docs),
-            "question": RunnablePassthrough()
-        } | prompt | llm
-        with st.chat_message("ai"):
-            response = chain.invoke(message)
-else:
+        trace = Trace("PrivateGPT", "query")
+        # 비슷한 질문을 이미 했다면 LLM을 다시 호출하지 않음
+        # 파일 앞부분만 보고 한 답은 저장하지 않음 (이번 질문에만 쓰는 빈 cache)
+        answer_cache = get_answer_cache(digest) if partial_chunks is None else SemanticCache(
+            get_query_embeddings(ollama)
+        )
+        with trace.stage("cache_lookup"):
+            question_vector = answer_cache.embed(message)
+            cached_answer = answer_cache.lookup(question_vector)
+        trace.cache_result("answer", cached_answer is not None)
+        if cached_answer is not None:
+            send_message(cached_answer, "ai")
+        else:
+            docs = retriever.get_relevant_documents(
+                message, callbacks=[trace.handler()]
+            )
+            chain = get_chain(ollama, ollama.chat_model_name)
+            with st.chat_message("ai"):
+                response = chain.invoke(
+                    {"docs": docs, "question": message},
+                    config={"callbacks": [
+                        ChatCallbackHandler(),
+                        ollama.metrics_handler(),
+                        trace.handler(),
+                    ]},
+                )
+            answer_cache.store(question_vector, response.content)
+        trace.finish()
+
+        with st.sidebar:
+            st.caption("Answer cache: {hits} hits / {misses} misses".format(
+                **answer_cache.stats
+            ))
+            if ollama.metrics:
+                last = ollama.metrics[-1]
+                st.caption(
+                    f"TTFT {last['ttft_s']:.2f}s · total {last['total_s']:.2f}s · "
+                    f"{last['tokens_per_s'] or 0:.1f} tokens/s"
+                )
+            for model, seconds in ollama.load_times.items():
+                st.caption(f"{model} loaded in {seconds:.2f}s")
+elif not file:
     st.session_state['messages'] = []
+
+# 진행 중인 job이 있으면 잠시 후 다시 실행해서 progress / 완성된 index 반영
+jobs.poll_if_active([state])
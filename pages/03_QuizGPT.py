@@ -1,13 +1,20 @@
-import json
+import os
+from functools import partial
 
 import streamlit as st
 from langchain.callbacks import StreamingStdOutCallbackHandler
-from langchain.chat_models import ChatOpenAI
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.prompts import ChatPromptTemplate
-from langchain.retrievers import WikipediaRetriever
-from langchain.schema import BaseOutputParser
-from langchain.text_splitter import CharacterTextSplitter
+
+from utils import jobs, wiki_index
+from utils.ingest import (
+    documents_digest,
+    get_chunks_path,
+    iter_cached_chunks,
+    split_upload,
+    write_upload,
+)
+from utils.llm_cache import enable_llm_cache
+from utils.resources import get_chat_openai, get_openai_embeddings, get_resource
+from utils.tracing import Trace
 
 st.set_page_config(
     page_title="QuizGPT",
@@ -17,220 +24,82 @@ st.set_page_config(
 st.title("QuizGPT")
 
 
-class JsonOutputParser(BaseOutputParser):
-    def parse(self, text):
-        text = text.replace("```json", "").replace("```", "")
-        return json.loads(text)
+def split_job(file_path, progress):
+    ''' background thread에서 실행 (st.* 사용 금지), 결과는 디스크의 chunks.pkl '''
+    # page 단위로 읽으면서 split (파일 전체를 한 번에 load 하지 않음)
+    trace = Trace("QuizGPT", "ingest")
+    with open(file_path, "rb") as file:
+        digest, docs = split_upload(
+            file,
+            "quiz_files",
+            trace,
+            on_page=lambda pages: progress.update(pages=pages),
+        )
+    progress.update(chunks=len(docs))
+    trace.finish()
+    if not docs:
+        raise ValueError("No text could be extracted from this file")
 
-output_parser = JsonOutputParser()
 
-@st.cache_data(show_spinner="Loading file...")
-def split_file(file):
-    ''' 현재 data가 변경될 때마다 매번 embed file function을 실행
-     사용자가 message를 보낼 때마다 function 실행 -> 불필요한 반복 실행'''
-    file_content = file.read()
-    file_path = f"./.cache/quiz_files/{file.name}"
-    with open(file_path, 'wb') as f:
-        f.write(file_content)
+def ingest_file(digest, file_path, retry=False):
+    ''' chunk가 이미 있으면 None, 없으면 background job 상태 (session이 끊겨도 계속 진행) '''
+    if os.path.exists(get_chunks_path("quiz_files", digest)):
+        return None
+    return jobs.submit(f"quiz_files/{digest}", "split", split_job, file_path, retry=retry)
 
-    splitter = CharacterTextSplitter.from_tiktoken_encoder(
-        separator='\n',
-        chunk_size=600,
-        chunk_overlap=100,
-    )
 
-    loader = UnstructuredFileLoader(file_path)
-    docs = loader.load_and_split(text_splitter=splitter)
-    return docs
+@st.cache_data(show_spinner="Loading file...")
+def load_chunks(digest):
+    return list(iter_cached_chunks(get_chunks_path("quiz_files", digest)))
 
 @st.cache_data(show_spinner="Making quiz...")
-def run_quiz_chain(_docs, topic):
-    chain = {"context": questions_chain} | formatting_chain | output_parser
-    return chain.invoke(_docs)
+def run_quiz_chain(_docs, topic, docs_digest):
+    ''' docs_digest: 문서 내용이 바뀌면 cache도 새로 '''
+    # numpy / tiktoken을 쓰는 quiz 모듈은 처음 quiz를 만들 때 import
+    from utils.quiz import is_valid_response, make_quiz
+
+    # 같은 prompt + model 설정이면 worker / 재시작과 상관없이 LLM 호출 없이 재사용
+    # parser를 통과한 응답만 저장 (utils/llm_cache.py)
+    enable_llm_cache(validate=is_valid_response)
+
+    # rerun 마다 새로 만들지 않고 process 전체에서 같은 client (callback은 invoke 할 때 전달)
+    llm = get_chat_openai(
+        temperature=0.1,
+        model_name="gpt-3.5-turbo-1106",
+        # 다른 page의 client는 cache=False (utils/llm_cache.py)
+        cache=True,
+    )
+    trace = Trace("QuizGPT", "quiz")
+    config = {"callbacks": [StreamingStdOutCallbackHandler(), trace.handler()]}
+    # 짧은 문서는 function calling 한 번, 긴 문서는 chunk group별 map-reduce
+    # (client와 compile 된 quiz chain은 process 전체에서 재사용)
+    quiz = make_quiz(_docs, llm, get_openai_embeddings(), config=config)
+    trace.finish()
+    return quiz
 
 @st.cache_data(show_spinner="Searching Wikipedia...")
 def wiki_search(term):
-    retriever = WikipediaRetriever(top_k_results=5)
-    docs = retriever.get_relevant_documents(term)
+    # local index(utils/wiki_index.py)가 있으면 network 없이 검색, 없으면 Wikipedia API
+    trace = Trace("QuizGPT", "wiki_search")
+    with trace.stage("retrieve"):
+        docs = wiki_index.search(term, top_k=5)
+    trace.cache_result("wiki_index", bool(docs))
+    if not docs:
+        # local index에 없을 때만 wikipedia package를 load
+        from langchain.retrievers import WikipediaRetriever
+
+        retriever = get_resource("WikipediaRetriever", WikipediaRetriever, top_k_results=5)
+        docs = retriever.get_relevant_documents(
+            term, callbacks=[trace.handler()]
+        )
+    trace.finish()
     return docs
 
 
-def format_docs(docs):
-    return "\n\n".join(document.page_content for document in docs)
-
-
-llm = ChatOpenAI(
-    temperature=0.1,
-    model="gpt-3.5-turbo-1106",
-    callbacks=[
-        StreamingStdOutCallbackHandler()
-    ]
-)
-
-questions_prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        """
-        You are a helpful assistant that is role playing as a teacher.
-
-        Based ONLY on the following context make 10 questions to test the user's
-        knowledge about the text.
-
-        Each question should have 4 answers, three of them must be incorrect and
-        one should me correct.
-
-        Use (o) signal to correct answer.
-
-        Question examples:
-
-        Question: What is the color of the ocean?
-        Answers: Red|Yellow|Green|Blue(o)
-
-        Question: What is the capital of Georgia?
-        Answers: Baku|Tbilisi(o)|Manila|Beirut
-
-        Question: When was Avartar released?
-        Answers: 2007|2001|2009(o)|1998
-
-        Question: Who was Julius Caesar?
-        Answers: A Roman Emperor(o)|Painter|Actor|Model
-
-        Your turn!
-
-        Context: {context}
-        """
-    ),
-])
-
-questions_chain = {
-    "context": format_docs
-} | questions_prompt | llm
-
-formatting_prompt = ChatPromptTemplate.from_messages([
-    (
-        "system",
-        """
-        You are a powerful formatting algorithm.
-     
-    You format exam questions into JSON format.
-    Answers with (o) are the correct ones.
-     
-    Example Input:
-    Question: What is the color of the ocean?
-    Answers: Red|Yellow|Green|Blue(o)
-         
-    Question: What is the capital or Georgia?
-    Answers: Baku|Tbilisi(o)|Manila|Beirut
-         
-    Question: When was Avatar released?
-    Answers: 2007|2001|2009(o)|1998
-         
-    Question: Who was Julius Caesar?
-    Answers: A Roman Emperor(o)|Painter|Actor|Model
-    
-     
-    Example Output:
-     
-    ```json
-    {{ "questions": [
-            {{
-                "question": "What is the color of the ocean?",
-                "answers": [
-                        {{
-                            "answer": "Red",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "Yellow",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "Green",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "Blue",
-                            "correct": true
-                        }},
-                ]
-            }},
-                        {{
-                "question": "What is the capital or Georgia?",
-                "answers": [
-                        {{
-                            "answer": "Baku",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "Tbilisi",
-                            "correct": true
-                        }},
-                        {{
-                            "answer": "Manila",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "Beirut",
-                            "correct": false
-                        }},
-                ]
-            }},
-                        {{
-                "question": "When was Avatar released?",
-                "answers": [
-                        {{
-                            "answer": "2007",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "2001",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "2009",
-                            "correct": true
-                        }},
-                        {{
-                            "answer": "1998",
-                            "correct": false
-                        }},
-                ]
-            }},
-            {{
-                "question": "Who was Julius Caesar?",
-                "answers": [
-                        {{
-                            "answer": "A Roman Emperor",
-                            "correct": true
-                        }},
-                        {{
-                            "answer": "Painter",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "Actor",
-                            "correct": false
-                        }},
-                        {{
-                            "answer": "Model",
-                            "correct": false
-                        }},
-                ]
-            }}
-        ]
-     }}
-    ```
-    Your turn!
-    Questions: {context}
-    """
-    )
-])
-
-formatting_chain = formatting_prompt | llm
-
-
 with st.sidebar:
     docs = None
+    topic = None
+    state = None
     choice = st.selectbox(
         "Choose what you want to use.",
         ("File", "Wikipedia Article")
@@ -239,7 +108,16 @@ with st.sidebar:
     if choice == 'File':
         file = st.file_uploader("Upload a .docx, .txt or .pdf file", type=["pdf", "txt", "docx"])
         if file:
-            docs = split_file(file)
+            digest, file_path = write_upload(file, "quiz_files")
+            state = ingest_file(digest, file_path)
+            if state is None:
+                docs = load_chunks(digest)
+            jobs.render_job(
+                state,
+                file.name,
+                partial(ingest_file, digest, file_path, retry=True),
+                action="Reading",
+            )
     else:
         topic = st.text_input("Search Wikipedia...")
         if topic:
@@ -257,7 +135,9 @@ if not docs:
         """
     )
 else:
-    response = run_quiz_chain(docs, topic if topic else file.name)
+    response = run_quiz_chain(
+        docs, topic if topic else file.name, documents_digest(docs)
+    )
     with st.form(key="questions_form"):
         for question in response['questions']:
             st.write(question['question'])
@@ -272,3 +152,5 @@ else:
                 st.error("Wrong")
         button = st.form_submit_button()
 
+# 진행 중인 job이 있으면 잠시 후 다시 실행해서 progress / 완성된 chunk 반영
+jobs.poll_if_active([state])
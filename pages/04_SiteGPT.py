@@ -1,12 +1,17 @@
+import os
+from functools import partial
+
 import streamlit as st
-from langchain.chat_models import ChatOpenAI
-from langchain.document_loaders import SitemapLoader
-from langchain.document_transformers import Html2TextTransformer
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores.faiss import FAISS
+
+from utils import jobs
+from utils.crawl import crawl_site, get_site_dir, make_splitter, parse_page
+from utils.hybrid import HybridRetriever
+from utils.index_store import index_exists, index_version, load_index
+from utils.resources import get_chat_openai, get_openai_embeddings, get_resource
+from utils.tracing import Trace
+from utils.vector_client import remote_retriever
 
 st.set_page_config(
     page_title="SiteGPT",
@@ -15,8 +20,10 @@ st.set_page_config(
 
 st.title("SiteGPT")
 
-html2text_transformer = Html2TextTransformer()
-llm = ChatOpenAI(temperature=0.1)
+# get_answers: 문서별 LLM 호출을 동시에 실행 (map-rerank)
+ANSWERS_MAX_CONCURRENCY = 4
+ANSWERS_TIMEOUT = 30
+
 answers_prompt = ChatPromptTemplate.from_template("""
     Using ONLY the following context answer the user's question. If you can't just say you don't know, don't make anything up.
                                                   
@@ -43,7 +50,7 @@ answers_prompt = ChatPromptTemplate.from_template("""
     Question: {question}
 """)
 
-def get_answers(inputs):
+def get_answers(inputs, callbacks=None):
     """
     요구사항 -  return 값
     {
@@ -54,17 +61,28 @@ def get_answers(inputs):
     """
     docs = inputs['docs']
     question = inputs['question']
-    answers_chain = answers_prompt | llm
+    # client / chain은 process 전체에서 재사용 (callback은 invoke 할 때 config로 전달)
+    answers_chain = get_resource("SiteGPT:answers_chain", lambda: answers_prompt | get_chat_openai(
+        temperature=0.1,
+        request_timeout=ANSWERS_TIMEOUT,
+        max_retries=1,
+    ))
+
+    # 순서대로 N번 호출하지 않고 한 번에 batch -> latency는 가장 느린 호출 하나 정도
+    results = answers_chain.batch(
+        [{"question": question, "context": doc.page_content} for doc in docs],
+        config={"max_concurrency": ANSWERS_MAX_CONCURRENCY, "callbacks": callbacks},
+        return_exceptions=True,
+    )
 
-    return {"question": question, "answers":[
+    # timeout / 실패한 문서는 버리고 나머지 답변으로 choose_answer 진행
+    return {"question": question, "answers": [
         {
-            "answer": answers_chain.invoke({
-                "question": question,
-                "context": doc.page_content
-            }).content,
+            "answer": result.content,
             "source": doc.metadata['source'],
             "date": doc.metadata["lastmod"]
-        } for doc in docs
+        } for doc, result in zip(docs, results)
+        if not isinstance(result, Exception)
     ]}
 
 choose_prompt = ChatPromptTemplate.from_messages([
@@ -84,43 +102,66 @@ choose_prompt = ChatPromptTemplate.from_messages([
     ("human", "{question}"),
 ])
 
-def choose_answer(inputs):
+def choose_answer(inputs, callbacks=None):
     answers = inputs["answers"]
     question = inputs["question"]
-    choose_chain = choose_prompt | llm
+    choose_chain = get_resource(
+        "SiteGPT:choose_chain", lambda: choose_prompt | get_chat_openai(temperature=0.1)
+    )
     condensed = "\n\n".join(
         f"Answer: {answer['answer']}\nSource: {answer['source']}\nDate: {answer['date']}" for answer in answers
     )
     return choose_chain.invoke({
             "question": question,
             "answers": condensed
-        })
-
-
-def parse_page(soup):
-    header = soup.find("header")
-    footer = soup.find("footer")
-    if header:
-        header.decompose()
-    if footer:
-        footer.decompose()
-    return str(soup.get_text()).replace(
-        "\n", " ").replace("\xa0", " ").replace("CloseSEarch Submit Blog", "")
-
-@st.cache_data(show_spinner="Loading website")
-def load_website(url):
-    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=1000,
-        chunk_overlap=200,
+        }, config={"callbacks": callbacks})
+
+
+def crawl_job(url, progress):
+    ''' background thread에서 실행 (st.* 사용 금지), lastmod / 내용이 바뀐 page만 다시 embedding '''
+    from utils.embedding_executor import BatchedEmbeddings
+    from utils.embedding_store import cache_backed_embeddings
+
+    trace = Trace("SiteGPT", "crawl")
+    embeddings = cache_backed_embeddings(
+        BatchedEmbeddings(
+            get_openai_embeddings(),
+            on_progress=lambda embedded, total: progress.update(chunks=embedded, total=total),
+        )
     )
-    loader = SitemapLoader(
+    vector_store = crawl_site(
         url,
-        parsing_function=parse_page
+        parse_page,
+        make_splitter(),
+        embeddings,
+        trace=trace,
+        requests_per_second=5,
+        concurrency=16,
+        on_page=lambda pages: progress.update(pages=pages),
+    )
+    trace.finish()
+    if vector_store is None:
+        raise ValueError("No pages could be loaded from this sitemap.")
+
+
+def get_job_key(url):
+    return "sites/" + os.path.basename(get_site_dir(url))
+
+
+def update_website(url, retry=False):
+    ''' 이미 crawl 중이면 새로 시작하지 않고 그 상태를 반환 '''
+    return jobs.submit(get_job_key(url), "crawl", crawl_job, url, retry=retry)
+
+
+@st.cache_resource(show_spinner="Loading website")
+def load_website(url, version):
+    ''' version: index_version -> re-crawl이 끝나면 다음 rerun에서 새 index를 load '''
+    # 다른 worker / 재시작 후에도 디스크의 index를 재사용
+    site_dir = get_site_dir(url)
+    # vector 검색 + BM25 keyword 검색
+    return HybridRetriever.from_vectorstore(
+        load_index(site_dir, get_openai_embeddings()), site_dir
     )
-    loader.requests_per_second = 1
-    docs = loader.load_and_split(text_splitter=splitter)
-    vector_store = FAISS.from_documents(docs, OpenAIEmbeddings())
-    return vector_store.as_retriever()
 
 with st.sidebar:
     url = st.text_input("Write down a URL", placeholder="https://example.com")
@@ -131,16 +172,56 @@ if url:
         with st.sidebar:
             st.error("Please write down a Sitemap URL")
     else:
-        retriever = load_website(url)
-
-        query = st.text_input("Ask a question to the website.")
-        if query:
+        site_dir = get_site_dir(url)
+        state = jobs.get_job(get_job_key(url))
+        with st.sidebar:
+            if st.button("Re-crawl changed pages"):
+                state = update_website(url)
+            # 처음 보는 site는 바로 crawl 시작 (실패한 crawl은 Retry 버튼으로만)
+            if not index_exists(site_dir) and not jobs.is_active(state) and (
+                state is None or state["status"] != "failed"
+            ):
+                state = update_website(url)
+            crawling = jobs.render_job(
+                state, url, partial(update_website, url, retry=True), action="Crawling"
+            )
+            if crawling and index_exists(site_dir):
+                st.caption("The updated index is used once the crawl finishes.")
+
+        # re-crawl 중에도 이전 index로 계속 검색
+        query = None
+        version = index_version(site_dir)
+        if version is not None:
+            # VECTOR_SERVICE_URL이 있으면 index는 vector service가 load (re-crawl 후 reload도 service에서)
+            local = partial(load_website, url, version)
+            retriever = remote_retriever(
+                [site_dir], get_openai_embeddings(), fallback=local
+            ) or local()
+            query = st.text_input("Ask a question to the website.")
+        answered = st.session_state.get("site_answer")
+        # polling rerun에서는 같은 index에 같은 질문이면 저장된 답을 다시 표시 (LLM 다시 호출하지 않음)
+        if query and answered and answered["key"] == (url, version, query):
+            st.markdown(answered["answer"].replace("$", r"\$"))
+        elif query:
+            trace = Trace("SiteGPT", "query")
+            # RunnableLambda 안에서 새로 invoke 하는 chain에도 같은 callback 전달
+            callbacks = [trace.handler()]
             chain = {
                 "docs": retriever,
                 "question": RunnablePassthrough(),
-            } | RunnableLambda(get_answers) | RunnableLambda(choose_answer)
-
-            result = chain.invoke(query)
-            st.markdown(result.content.replace("$", "\$"))
-
-
+            } | RunnableLambda(
+                lambda inputs: get_answers(inputs, callbacks)
+            ) | RunnableLambda(
+                lambda inputs: choose_answer(inputs, callbacks)
+            )
+
+            result = chain.invoke(query, config={"callbacks": callbacks})
+            trace.finish()
+            st.session_state["site_answer"] = {
+                "key": (url, version, query),
+                "answer": result.content,
+            }
+            st.markdown(result.content.replace("$", r"\$"))
+
+        # crawl / re-crawl 중이면 잠시 후 다시 실행해서 progress / 완성된 index 반영
+        jobs.poll_if_active([state])
@@ -0,0 +1,79 @@
+import httpx
+import streamlit as st
+
+from utils.tracing import load_records, summarize, to_openmetrics
+from utils.vector_client import VECTOR_SERVICE_URL, get_vector_client
+
+st.set_page_config(
+    page_title="Admin",
+    page_icon="📊"
+)
+
+st.title("Admin")
+
+st.markdown("""
+Latency per app and stage, from `./.cache/metrics/traces.jsonl`.
+""")
+
+records = load_records()
+
+if not records:
+    st.info("No traces recorded yet. Use one of the apps first!")
+else:
+    summary = summarize(records)
+    apps = sorted({row["app"] for row in summary})
+
+    with st.sidebar:
+        selected = st.multiselect("Apps", apps, default=apps)
+
+    st.dataframe(
+        [row for row in summary if row["app"] in selected],
+        use_container_width=True,
+    )
+
+    st.subheader("Recent requests")
+    st.dataframe(
+        [
+            {
+                "app": record["app"],
+                "operation": record["operation"],
+                "total_ms": round(record["total_ms"], 1),
+                **record["tokens"],
+                **{f"cache:{name}": result for name, result in record["cache"].items()},
+            }
+            for record in reversed(records[-50:])
+            if record["app"] in selected
+        ],
+        use_container_width=True,
+    )
+
+    st.download_button(
+        "Download OpenMetrics",
+        to_openmetrics(summary),
+        file_name="metrics.txt",
+        mime="application/openmetrics-text",
+    )
+
+# VECTOR_SERVICE_URL이 있을 때만: vector service가 들고 있는 index와 그 크기
+vector_client = get_vector_client()
+if vector_client is not None:
+    st.subheader("Vector service")
+    try:
+        stats = vector_client.indexes()
+    # service가 꺼져 있거나 응답하지 않는 경우 -> page는 각자 index를 load 해서 검색
+    except httpx.HTTPError as error:
+        st.error(f"Vector service is not reachable at {VECTOR_SERVICE_URL}: {error}")
+    else:
+        st.caption(
+            "{:.1f} / {:.1f} MB on disk · {} loads · {} evictions".format(
+                stats["total_disk_bytes"] / 2 ** 20,
+                stats["max_disk_bytes"] / 2 ** 20,
+                stats["loads"],
+                stats["evictions"],
+            )
+        )
+        st.caption(
+            "Indexes are accounted by their size on disk, not measured memory "
+            "(IVF indexes are mmapped and use less)."
+        )
+        st.dataframe(stats["indexes"], use_container_width=True)
@@ -0,0 +1,42 @@
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.embeddings.fake import FakeEmbeddings
+from langchain.schema import Document
+from langchain.vectorstores.faiss import FAISS
+
+from utils import ann_index
+from utils.ann_index import build_index, index_vectors, rebuild_if_outgrown
+
+embeddings = FakeEmbeddings(size=16)
+
+
+def test_index_vectors_skips_removed_ivf_ids():
+    vectors = np.random.default_rng(0).random((2000, 16), dtype=np.float32)
+    index = build_index(vectors, spec="IVF8,Flat")
+    index.remove_ids(np.array([0, 5], dtype=np.int64))
+    ids = [str(position) for position in range(2000)]
+    vectorstore = FAISS(
+        embeddings,
+        index,
+        InMemoryDocstore({doc_id: Document(page_content=doc_id) for doc_id in ids}),
+        {position: ids[position] for position in range(2000) if position not in (0, 5)},
+    )
+
+    found_ids, found = index_vectors(vectorstore)
+
+    assert found_ids[:2] == ["1", "2"] and len(found_ids) == 1998
+    assert np.array_equal(found[0], vectors[1])
+
+
+def test_rebuild_if_outgrown(monkeypatch):
+    monkeypatch.setattr(ann_index, "FLAT_MAX", 100)
+    vectorstore = FAISS.from_texts([str(i) for i in range(150)], embeddings)
+
+    # 고칠 일이 없는 upload index -> HNSW, re-crawl로 patch 하는 site index -> IVF
+    rebuilt = rebuild_if_outgrown(vectorstore, mutable=False)
+    assert type(rebuilt.index).__name__ == "IndexHNSWFlat"
+    assert rebuilt.index.ntotal == 150 and len(rebuilt.docstore._dict) == 150
+    assert type(rebuild_if_outgrown(vectorstore).index).__name__ == "IndexIVFFlat"
+
+    small = FAISS.from_texts(["a"], embeddings)
+    assert rebuild_if_outgrown(small) is small
@@ -0,0 +1,45 @@
+from langchain.embeddings.fake import FakeEmbeddings
+from langchain.vectorstores.faiss import FAISS
+
+from utils import ann_index
+from utils.collection import as_filtered_retriever, merge_collection
+from utils.hybrid import BM25Index
+
+embeddings = FakeEmbeddings(size=8)
+
+
+def test_merge_tags_copies_and_keeps_originals():
+    big = FAISS.from_texts([f"big chunk {i}" for i in range(50)], embeddings)
+    small = FAISS.from_texts(["small chunk"], embeddings)
+
+    collection = merge_collection([("big", "big.pdf", big), ("small", "small.pdf", small)])
+
+    assert collection.index.ntotal == 51
+    assert big.index.ntotal == 50 and small.index.ntotal == 1
+    assert all("digest" not in doc.metadata for doc in small.docstore._dict.values())
+    assert {doc.metadata["file_name"] for doc in collection.docstore._dict.values()} == {
+        "big.pdf", "small.pdf"
+    }
+
+
+def test_filter_on_small_file_finds_its_chunks():
+    big = FAISS.from_texts([f"big chunk {i}" for i in range(500)], embeddings)
+    small = FAISS.from_texts(["small chunk"], embeddings)
+    collection = merge_collection([("big", "big.pdf", big), ("small", "small.pdf", small)])
+
+    retriever = as_filtered_retriever(collection, BM25Index.from_vectorstore(collection), ["small"])
+
+    docs = retriever.dense_search("question")
+    assert [doc.metadata["digest"] for doc in docs] == ["small"]
+
+
+def test_large_collection_is_not_hnsw(monkeypatch):
+    # HNSW는 filter 검색 recall이 낮음 -> Flat 다음은 IVF
+    monkeypatch.setattr(ann_index, "FLAT_MAX", 100)
+    big = FAISS.from_texts([f"big chunk {i}" for i in range(300)], embeddings)
+    small = FAISS.from_texts(["small chunk"], embeddings)
+
+    collection = merge_collection([("big", "big.pdf", big), ("small", "small.pdf", small)])
+
+    assert ann_index.index_family(collection.index) == "IVF"
+    assert collection.index.ntotal == 301
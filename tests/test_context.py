@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema import Document
+
+from utils import context
+from utils.context import (
+    CONTEXT_TOKENS,
+    MIN_PASSAGE_TOKENS,
+    QUESTION_TOKENS,
+    SEPARATOR,
+    context_budget,
+    pack_docs,
+)
+
+
+class CharEncoding:
+    ''' 글자 하나 = token 하나 (tiktoken encoding 파일 없이 test) '''
+
+    def encode(self, text, **kwargs):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+encoding = CharEncoding()
+
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def test_overlapping_chunks_are_merged():
+    text = words("w", 60)
+    docs = [
+        Document(page_content=text[:200], metadata={"source": "a.pdf"}),
+        Document(page_content=text[150:], metadata={"source": "a.pdf"}),
+    ]
+
+    assert pack_docs(docs, budget=10_000, encoding=encoding) == text
+
+
+def test_duplicates_are_dropped_and_order_follows_score():
+    low = words("low", 30)
+    high = words("high", 30)
+    docs = [
+        Document(page_content=low, metadata={"source": "a", "score": 0.2}),
+        Document(page_content=high, metadata={"source": "b", "score": 0.9}),
+        Document(page_content=high + " extra", metadata={"source": "c", "score": 0.5}),
+    ]
+
+    assert pack_docs(docs, budget=10_000, encoding=encoding) == high + SEPARATOR + low
+
+
+def test_context_never_exceeds_budget():
+    docs = [
+        Document(page_content=words(f"d{n}_", 40), metadata={"source": str(n)})
+        for n in range(10)
+    ]
+    for budget in (0, 30, MIN_PASSAGE_TOKENS + 5, 400, 1000):
+        packed = pack_docs(docs, budget=budget, encoding=encoding)
+        assert len(encoding.encode(packed)) <= budget
+        # 마지막 passage는 잘리더라도 MIN_PASSAGE_TOKENS 이상
+        if packed:
+            assert len(packed.split(SEPARATOR)[-1]) >= MIN_PASSAGE_TOKENS
+
+
+def test_budget_leaves_room_for_template_question_and_completion(monkeypatch):
+    monkeypatch.setattr(context, "get_encoding", lambda model_name=None: encoding)
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "Context: {context}"),
+        ("human", "{question}"),
+    ])
+    small = SimpleNamespace(model_name="gpt-3.5-turbo", max_tokens=256)
+    template = len("Context: {context}\n{question}")
+
+    assert context_budget(small, prompt, cap=None) == 4096 - 256 - template - QUESTION_TOKENS
+    assert context_budget(small, prompt) == CONTEXT_TOKENS
+    # Ollama model은 num_ctx 기준
+    ollama = SimpleNamespace(num_ctx=2048, max_tokens=128)
+    assert context_budget(ollama, prompt, cap=None) == 2048 - 128 - template - QUESTION_TOKENS
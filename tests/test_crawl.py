@@ -0,0 +1,109 @@
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain.embeddings.fake import FakeEmbeddings
+from langchain.text_splitter import CharacterTextSplitter
+
+from utils import crawl
+from utils.crawl import crawl_site, get_site_dir, load_manifest, parse_page
+
+FETCH = {"requests_per_second": 100, "burst": 10, "parse_workers": 1}
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    texts: list = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requested.append(self.path)
+        super().do_GET()
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl, "SITES_DIR", str(tmp_path / "sites"))
+    root = tmp_path / "www"
+    root.mkdir()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RecordingHandler, directory=str(root)))
+    server.requested = []
+    server.root = root
+    server.base = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def publish(site, pages):
+    ''' pages: {name: (lastmod, text)} -> html 파일 + sitemap.xml '''
+    urls = []
+    for name, (lastmod, text) in pages.items():
+        (site.root / name).write_text(f"<html><body><p>{text}</p></body></html>")
+        lastmod = f"<lastmod>{lastmod}</lastmod>" if lastmod else ""
+        urls.append(f"<url><loc>{site.base}/{name}</loc>{lastmod}</url>")
+    (site.root / "sitemap.xml").write_text(
+        '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + "".join(urls) + "</urlset>"
+    )
+    site.requested.clear()
+
+
+def recrawl(site, embeddings):
+    embeddings.texts = []
+    return crawl_site(
+        f"{site.base}/sitemap.xml",
+        parse_page,
+        CharacterTextSplitter(chunk_size=1000, chunk_overlap=0),
+        embeddings,
+        **FETCH,
+    )
+
+
+def test_recrawl_fetches_and_embeds_only_changed_pages(site):
+    embeddings = CountingEmbeddings(size=8)
+    publish(site, {
+        "a.html": ("2024-01-01", "alpha page"),
+        "b.html": ("2024-01-01", "beta page"),
+        "c.html": (None, "gamma page"),
+    })
+    vectorstore = recrawl(site, embeddings)
+    assert vectorstore.index.ntotal == 3
+    assert sorted(embeddings.texts) == ["alpha page", "beta page", "gamma page"]
+
+    # 변경 없음: lastmod가 같은 page는 fetch 하지 않고, lastmod가 없는 page는 fetch 하지만 hash가 같아 embedding 안 함
+    publish(site, {
+        "a.html": ("2024-01-01", "alpha page"),
+        "b.html": ("2024-01-01", "beta page"),
+        "c.html": (None, "gamma page"),
+    })
+    vectorstore = recrawl(site, embeddings)
+    assert [path for path in site.requested if path.endswith(".html")] == ["/c.html"]
+    assert embeddings.texts == []
+    assert vectorstore.index.ntotal == 3
+
+    # b 수정, a는 sitemap에서 삭제
+    publish(site, {
+        "b.html": ("2024-02-01", "beta page, second edition"),
+        "c.html": (None, "gamma page"),
+    })
+    vectorstore = recrawl(site, embeddings)
+    assert embeddings.texts == ["beta page, second edition"]
+    assert sorted(doc.page_content for doc in vectorstore.docstore._dict.values()) == [
+        "beta page, second edition", "gamma page"
+    ]
+    assert vectorstore.index.ntotal == 2
+
+    manifest = load_manifest(get_site_dir(f"{site.base}/sitemap.xml"))
+    assert sorted(manifest) == [f"{site.base}/b.html", f"{site.base}/c.html"]
+    assert manifest[f"{site.base}/b.html"]["lastmod"] == "2024-02-01"
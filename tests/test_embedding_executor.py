@@ -0,0 +1,150 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+from langchain.schema.embeddings import Embeddings
+
+from utils import embedding_executor
+from utils.embedding_executor import BatchedEmbeddings
+
+
+class WordEncoding:
+    ''' 단어 하나 = token 하나 (tiktoken encoding 파일 없이 test) '''
+
+    def encode(self, text, **kwargs):
+        return text.split()
+
+
+class FakeEmbeddingServer(ThreadingHTTPServer):
+    ''' OpenAI /v1/embeddings 형식, failures에 넣은 (status, headers)를 먼저 응답 '''
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeEmbeddingHandler)
+        self.lock = threading.Lock()
+        self.failures = []
+        self.batches = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/embeddings"
+
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            failure = self.server.failures.pop(0) if self.server.failures else None
+            if failure is None:
+                self.server.batches.append(body["input"])
+        if failure:
+            status, headers = failure
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        data = [
+            {"index": i, "embedding": [float(len(text)), 1.0]}
+            for i, text in enumerate(body["input"])
+        ]
+        payload = json.dumps({"data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class HTTPEmbeddings(Embeddings):
+    ''' fake server를 호출하는 client (실패 응답은 httpx.HTTPStatusError) '''
+
+    def __init__(self, url):
+        self.url = url
+
+    def embed_documents(self, texts):
+        response = httpx.post(self.url, json={"input": texts})
+        response.raise_for_status()
+        return [item["embedding"] for item in response.json()["data"]]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(embedding_executor, "get_encoding", lambda model_name=None: WordEncoding())
+    server = FakeEmbeddingServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_batches_are_packed_by_tokens_and_size(server):
+    texts = [" ".join(["word"] * 10) for _ in range(5)] + ["one", "two", "three"]
+    embeddings = BatchedEmbeddings(
+        HTTPEmbeddings(server.url), max_batch_tokens=25, max_batch_size=3
+    )
+
+    assert embeddings.pack(texts) == [(0, 2), (2, 4), (4, 7), (7, 8)]
+    vectors = embeddings.embed_documents(texts)
+
+    # 결과는 batch 완료 순서와 상관없이 입력 순서대로
+    assert vectors == [[float(len(text)), 1.0] for text in texts]
+    assert sorted(len(batch) for batch in server.batches) == [1, 2, 2, 3]
+
+
+def test_retry_after_is_honoured(server, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(embedding_executor.time, "sleep", sleeps.append)
+    server.failures = [(429, {"Retry-After": "2"})]
+
+    vectors = BatchedEmbeddings(HTTPEmbeddings(server.url)).embed_documents(["a b", "c"])
+
+    assert vectors == [[3.0, 1.0], [1.0, 1.0]]
+    assert sleeps == [2.0]
+
+
+def test_backoff_uses_full_jitter(server, monkeypatch):
+    bounds = []
+    monkeypatch.setattr(embedding_executor.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(
+        embedding_executor.random, "uniform", lambda low, high: bounds.append((low, high)) or 0.0
+    )
+    server.failures = [(503, {}), (503, {}), (503, {})]
+
+    BatchedEmbeddings(HTTPEmbeddings(server.url)).embed_documents(["a"])
+
+    # 0 ~ backoff * 2^attempt
+    assert bounds == [(0, 1.0), (0, 2.0), (0, 4.0)]
+
+
+def test_client_errors_are_not_retried(server):
+    server.failures = [(400, {})]
+
+    with pytest.raises(httpx.HTTPStatusError):
+        BatchedEmbeddings(HTTPEmbeddings(server.url), max_retries=3).embed_documents(["a"])
+    assert server.batches == []
+
+
+def test_progress_is_reported_from_the_calling_thread(server):
+    calls = []
+    caller = threading.get_ident()
+
+    def on_progress(embedded, total):
+        calls.append((embedded, total, threading.get_ident() == caller))
+
+    BatchedEmbeddings(
+        HTTPEmbeddings(server.url), max_batch_size=2, on_progress=on_progress
+    ).embed_documents(["a", "b", "c", "d", "e"])
+
+    # 동시에 끝난 batch는 한 번에 보고될 수 있음
+    counts = [embedded for embedded, _, _ in calls]
+    assert counts == sorted(set(counts)) and counts[-1] == 5
+    assert all(total == 5 and same_thread for _, total, same_thread in calls)
@@ -0,0 +1,47 @@
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.schema.embeddings import Embeddings
+from langchain.storage import LocalFileStore
+
+from utils.embedding_store import cache_backed_embeddings, embedding_namespace, migrate_local_file_store
+
+TEXTS = ["first chunk", "second chunk", "한글 chunk"]
+
+
+class LengthEmbeddings(Embeddings):
+    model = "length"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), float(i)] for i, text in enumerate(texts)]
+
+    def embed_query(self, text):
+        return [float(len(text)), 0.0]
+
+
+def test_migrated_local_file_store_is_hit_without_embedding(tmp_path):
+    # 예전 page와 같은 방식으로 LocalFileStore에 저장
+    directory = tmp_path / "embeddings"
+    old = CacheBackedEmbeddings.from_bytes_store(LengthEmbeddings(), LocalFileStore(str(directory)))
+    vectors = old.embed_documents(TEXTS)
+
+    underlying = LengthEmbeddings()
+    path = str(tmp_path / "embeddings.db")
+    assert migrate_local_file_store(str(directory), embedding_namespace(underlying), path=path) == 3
+
+    embeddings = cache_backed_embeddings(underlying, path=path)
+    assert embeddings.embed_documents(TEXTS + ["new chunk"])[:3] == vectors
+    # 옮겨진 key와 새로 계산한 key가 같음 -> 새 chunk만 embedding
+    assert underlying.embedded == ["new chunk"]
+
+
+def test_namespaces_do_not_share_vectors(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    cache_backed_embeddings(LengthEmbeddings(), path=path).embed_documents(TEXTS)
+
+    other = LengthEmbeddings()
+    other.model = "other-model"
+    cache_backed_embeddings(other, path=path).embed_documents(TEXTS)
+    assert other.embedded == TEXTS
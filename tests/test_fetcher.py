@@ -0,0 +1,40 @@
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.fetcher import fetch_pages
+
+
+def parse_title(soup):
+    ''' process pool에서 실행되므로 module 최상위 함수 '''
+    if soup.title is None:
+        raise ValueError("page has no title")
+    return soup.title.text
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    (tmp_path / "good.html").write_text("<html><title>good</title></html>")
+    (tmp_path / "broken.html").write_text("<html><body>no title</body></html>")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(tmp_path)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    yield f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_error_skips_only_that_page(site):
+    entries = [{"loc": f"{site}/good.html"}, {"loc": f"{site}/broken.html"}]
+
+    pages = fetch_pages(entries, parse_title, requests_per_second=100, burst=10, parse_workers=1)
+
+    assert pages == [(entries[0], "good")]
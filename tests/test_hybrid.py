@@ -0,0 +1,22 @@
+from langchain.embeddings.fake import FakeEmbeddings
+from langchain.vectorstores.faiss import FAISS
+
+from utils.hybrid import HybridRetriever
+from utils.tracing import Trace
+
+
+def test_retrieval_steps_are_recorded_on_the_callers_trace():
+    vectorstore = FAISS.from_texts(
+        ["error code E1234 on startup", "how to reset a password", "billing questions"],
+        FakeEmbeddings(size=8),
+    )
+    retriever = HybridRetriever.from_vectorstore(vectorstore, k=2)
+    first, second = Trace("DocumentGPT", "chat"), Trace("DocumentGPT", "chat")
+
+    docs = retriever.get_relevant_documents("E1234", callbacks=[first.handler()])
+
+    assert len(docs) == 2
+    assert {"retrieve", "retrieve.dense", "retrieve.sparse"} <= set(first.stages)
+    # 같은 retriever를 쓰는 다른 session의 trace에는 기록되지 않음
+    assert not second.stages
+    assert not hasattr(retriever, "timings")
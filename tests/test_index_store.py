@@ -0,0 +1,38 @@
+import os
+
+from langchain.embeddings.fake import FakeEmbeddings
+from langchain.vectorstores.faiss import FAISS
+
+from utils.index_store import (
+    KEEP_VERSIONS,
+    VERSIONS_DIR,
+    index_exists,
+    index_version,
+    load_index,
+    save_index,
+)
+
+embeddings = FakeEmbeddings(size=8)
+
+
+def test_save_swaps_version_and_keeps_previous(tmp_path):
+    index_dir = str(tmp_path)
+    for texts in (["a"], ["a", "b"], ["a", "b", "c"]):
+        version = save_index(FAISS.from_texts(texts, embeddings), index_dir)
+
+    assert index_version(index_dir) == version
+    assert len(os.listdir(os.path.join(index_dir, VERSIONS_DIR))) == KEEP_VERSIONS
+    vectorstore = load_index(index_dir, embeddings)
+    assert vectorstore.index.ntotal == 3
+    assert len(vectorstore.index_to_docstore_id) == 3
+
+
+def test_legacy_layout_is_read_then_replaced(tmp_path):
+    index_dir = str(tmp_path)
+    FAISS.from_texts(["a", "b"], embeddings).save_local(index_dir)
+    assert index_exists(index_dir)
+    assert load_index(index_dir, embeddings).index.ntotal == 2
+
+    save_index(FAISS.from_texts(["a"], embeddings), index_dir)
+    assert not os.path.exists(os.path.join(index_dir, "index.faiss"))
+    assert load_index(index_dir, embeddings).index.ntotal == 1
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from utils import jobs
+from utils.jobs import STALE_SECONDS, JobManager, JobStore, is_active
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def test_claim_once_while_active(store):
+    assert store.claim("files/a", "embed")
+    # 다른 session / process가 같은 key를 claim 해도 새로 시작하지 않음
+    assert not store.claim("files/a", "embed")
+    assert store.get("files/a")["status"] == "queued"
+
+
+def test_failed_job_is_claimed_again_only_on_retry(store):
+    store.claim("files/a", "embed")
+    store.update("files/a", status="failed", error="ValueError: boom")
+    assert not store.claim("files/a", "embed")
+    assert store.claim("files/a", "embed", retry=True)
+    assert store.get("files/a")["error"] is None
+
+
+def test_stale_running_row_is_not_active_and_can_be_claimed(store):
+    store.claim("sites/a", "crawl")
+    store.update("sites/a", status="running")
+    assert is_active(store.get("sites/a"))
+
+    # 실행하던 process가 죽어서 heartbeat가 멈춘 row
+    stale = time.time() - STALE_SECONDS - 1
+    store.connection.execute("UPDATE jobs SET updated = ? WHERE key = ?", (stale, "sites/a"))
+
+    state = store.get("sites/a")
+    assert state["status"] == "running"
+    assert not is_active(state)
+    assert store.claim("sites/a", "crawl")
+
+
+def test_manager_runs_job_and_records_progress(tmp_path):
+    manager = JobManager(str(tmp_path / "jobs.db"), max_workers=1)
+    release = threading.Event()
+
+    def job(progress):
+        progress.update(pages=3, chunks=10)
+        release.wait(5)
+
+    state = manager.submit("files/a", "embed", job)
+    assert is_active(state)
+    # 실행 중인 job은 다시 submit 해도 한 번만 실행
+    assert is_active(manager.submit("files/a", "embed", job))
+    release.set()
+
+    deadline = time.monotonic() + 5
+    while is_active(manager.get("files/a")) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    state = manager.get("files/a")
+    assert (state["status"], state["pages"], state["chunks"]) == ("done", 3, 10)
+    assert jobs.describe(state) == "3 pages parsed · 10 chunks embedded"
+
+
+def test_manager_records_failure(tmp_path):
+    manager = JobManager(str(tmp_path / "jobs.db"), max_workers=1)
+
+    def job(progress):
+        raise ValueError("No text could be extracted from this file")
+
+    manager.submit("files/a", "embed", job)
+    deadline = time.monotonic() + 5
+    while is_active(manager.get("files/a")) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    state = manager.get("files/a")
+    assert state["status"] == "failed"
+    assert state["error"] == "ValueError: No text could be extracted from this file"
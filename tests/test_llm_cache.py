@@ -0,0 +1,53 @@
+import time
+
+import pytest
+from langchain.chat_models.fake import FakeListChatModel
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain.schema import Generation
+
+from utils.llm_cache import ValidatedCache, create_cache_engine
+from utils.quiz import is_valid_response, parse_quiz_text
+
+GOOD = "Question: What color is the sky?\nAnswers: Red|Blue(o)|Green"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    previous = get_llm_cache()
+    cache = ValidatedCache(
+        create_cache_engine(str(tmp_path / "llm_cache.db")), validate=is_valid_response
+    )
+    set_llm_cache(cache)
+    yield cache
+    set_llm_cache(previous)
+
+
+def test_malformed_response_is_not_cached(cache):
+    llm = FakeListChatModel(responses=["Sorry, I can't help with that.", GOOD], cache=True)
+
+    assert llm.predict("make a quiz") == "Sorry, I can't help with that."
+    # retry -> 실패한 응답이 재사용되지 않고 LLM을 다시 호출
+    assert parse_quiz_text(llm.predict("make a quiz"))["questions"]
+    # 이번에는 parser를 통과한 응답이 cache에서 나옴 (FakeListChatModel이면 다음 응답은 다시 첫 번째)
+    assert llm.predict("make a quiz") == GOOD
+
+
+def test_expired_entries_are_not_returned(cache):
+    cache.update("prompt", "llm", [Generation(text=GOOD)])
+    assert cache.lookup("prompt", "llm")[0].text == GOOD
+
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.lookup("prompt", "llm") is None
+
+
+def test_least_recently_used_entries_are_deleted(cache):
+    cache.max_size = 2
+    for prompt in ("a", "b"):
+        cache.update(prompt, "llm", [Generation(text=GOOD)])
+    # a를 사용 -> 다음 저장에서 b가 삭제됨
+    assert cache.lookup("a", "llm")
+    cache.update("c", "llm", [Generation(text=GOOD)])
+
+    assert cache.lookup("b", "llm") is None
+    assert cache.lookup("a", "llm") and cache.lookup("c", "llm")
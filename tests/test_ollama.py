@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.ollama import (
+    OLLAMA_DEFAULT_KEEP_ALIVE,
+    OllamaManager,
+    keep_alive_interval,
+    parse_duration,
+)
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    ''' /api/generate, /api/embeddings 요청을 기록하고 load_duration을 돌려줌 '''
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+        payload = json.dumps({"load_duration": self.server.load_duration}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.requests = []
+    server.load_duration = 2_000_000_000
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    yield server, f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def make_manager(base_url):
+    return OllamaManager(
+        base_url=base_url,
+        chat_model="chat-model",
+        embedding_model="embedding-model",
+        keep_alive="30m",
+        num_ctx=2048,
+        num_thread=4,
+    )
+
+
+def test_preload_payloads(stub_server):
+    server, base_url = stub_server
+    manager = make_manager(base_url)
+
+    manager.preload()
+
+    assert server.requests == [
+        ("/api/generate", {
+            "model": "chat-model",
+            "keep_alive": "30m",
+            "options": {"num_ctx": 2048, "num_thread": 4},
+            "stream": False,
+        }),
+        ("/api/embeddings", {
+            "model": "embedding-model",
+            "keep_alive": "30m",
+            "options": {"num_ctx": 2048, "num_thread": 4},
+            "prompt": "",
+        }),
+    ]
+    assert manager.load_times == {"chat-model": 2.0, "embedding-model": 2.0}
+    assert manager.errors == {}
+
+
+def test_keep_alive_repeats_preload(stub_server):
+    server, base_url = stub_server
+    manager = make_manager(base_url)
+
+    manager.start_keep_alive(interval=0.05)
+    deadline = time.monotonic() + 5
+    while len(server.requests) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    paths = [path for path, _ in server.requests[:4]]
+    assert paths == ["/api/generate", "/api/embeddings"] * 2
+    assert all(body["keep_alive"] == "30m" for _, body in server.requests)
+
+
+def test_warm_pings_keep_the_cold_load_time(stub_server):
+    server, base_url = stub_server
+    manager = make_manager(base_url)
+    manager.preload()
+
+    # model이 아직 memory에 있음 -> load_duration은 몇 ms
+    server.load_duration = 3_000_000
+    manager.preload()
+    assert manager.load_times == {"chat-model": 2.0, "embedding-model": 2.0}
+
+    # keep-alive 사이에 unload 되어 다시 load
+    server.load_duration = 4_000_000_000
+    manager.preload()
+    assert manager.load_times == {"chat-model": 4.0, "embedding-model": 4.0}
+
+
+def test_unreachable_server_records_error():
+    manager = make_manager("http://127.0.0.1:9")
+    manager.preload()
+    assert set(manager.errors) == {"chat-model", "embedding-model"}
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("30m", 1800), ("1h30m", 5400), ("90s", 90), ("300", 300), (300, 300), ("-1", None),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == seconds
+
+
+def test_keep_alive_interval_stays_under_default_window():
+    # chat 요청이 window를 기본 5분으로 되돌리므로 30m으로 설정해도 5분보다 짧아야 함
+    assert keep_alive_interval("30m") < OLLAMA_DEFAULT_KEEP_ALIVE
+    assert keep_alive_interval("2m") < 120
+    assert keep_alive_interval("-1") < OLLAMA_DEFAULT_KEEP_ALIVE
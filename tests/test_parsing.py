@@ -0,0 +1,26 @@
+import os
+
+from pypdf import PdfWriter
+
+from utils import parsing
+
+
+def write_blank_pdf(path):
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_empty_page_is_not_cached_when_ocr_is_off(tmp_path, monkeypatch):
+    monkeypatch.setattr(parsing, "PAGES_DIR", str(tmp_path / "pages"))
+    file_path = str(tmp_path / "scan.pdf")
+    write_blank_pdf(file_path)
+
+    assert parsing.parse_range(file_path, 1, 2, ocr=False) == [(1, "", "skipped")]
+    assert not os.path.exists(parsing.PAGES_DIR)
+
+    # OCR을 켜면 빈 cache가 아니라 OCR 결과를 사용하고 그 결과를 cache
+    monkeypatch.setattr(parsing, "ocr_page", lambda file_path, number: "scanned text")
+    assert parsing.parse_range(file_path, 1, 2, ocr=True) == [(1, "scanned text", "ocr")]
+    assert parsing.parse_range(file_path, 1, 2, ocr=True) == [(1, "scanned text", "cache")]
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult, Document, OutputParserException
+
+from utils import context
+from utils.quiz import build_quiz_chain, parse_quiz_text
+
+QUIZ_TEXT = """
+1. Question: What is the capital of France?
+Answers: Berlin|Paris(o)|Rome
+Question: Which planet is red?
+Answers: Mars (o) | Venus | | Jupiter
+Question: A question without answers
+"""
+
+QUIZ = {"questions": [{
+    "question": "What is the capital of France?",
+    "answers": [
+        {"answer": "Berlin", "correct": False},
+        {"answer": "Paris", "correct": True},
+    ],
+}]}
+
+
+class CharEncoding:
+    ''' 글자 하나 = token 하나 (tiktoken encoding 파일 없이 test) '''
+
+    def encode(self, text, **kwargs):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+class ScriptedChatModel(BaseChatModel):
+    ''' 정해진 message를 순서대로 반환하고, 호출마다 받은 kwargs를 기록 '''
+    replies: list
+    calls: list = []
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(kwargs)
+        return ChatResult(generations=[ChatGeneration(message=self.replies.pop(0))])
+
+
+def function_call(arguments):
+    return AIMessage(content="", additional_kwargs={
+        "function_call": {"name": "create_quiz", "arguments": json.dumps(arguments)},
+    })
+
+
+@pytest.fixture(autouse=True)
+def char_encoding(monkeypatch):
+    monkeypatch.setattr(context, "get_encoding", lambda model_name=None: CharEncoding())
+
+
+def test_parse_quiz_text():
+    quiz = parse_quiz_text(QUIZ_TEXT)
+
+    assert quiz == {"questions": [
+        {
+            "question": "What is the capital of France?",
+            "answers": [
+                {"answer": "Berlin", "correct": False},
+                {"answer": "Paris", "correct": True},
+                {"answer": "Rome", "correct": False},
+            ],
+        },
+        {
+            "question": "Which planet is red?",
+            "answers": [
+                {"answer": "Mars", "correct": True},
+                {"answer": "Venus", "correct": False},
+                {"answer": "Jupiter", "correct": False},
+            ],
+        },
+    ]}
+
+
+def test_parse_quiz_text_without_questions_raises():
+    with pytest.raises(OutputParserException):
+        parse_quiz_text("Sorry, I can't make a quiz from this document.")
+
+
+def test_structured_call_is_used_when_it_parses():
+    llm = ScriptedChatModel(replies=[function_call(QUIZ)], calls=[])
+
+    assert build_quiz_chain(llm).invoke([Document(page_content="Paris is in France.")]) == QUIZ
+    assert len(llm.calls) == 1
+    assert llm.calls[0]["function_call"] == {"name": "create_quiz"}
+
+
+def test_text_format_is_the_fallback():
+    llm = ScriptedChatModel(
+        replies=[AIMessage(content="Here is your quiz!"), AIMessage(content=QUIZ_TEXT)],
+        calls=[],
+    )
+
+    quiz = build_quiz_chain(llm).invoke([Document(page_content="Paris is in France.")])
+
+    assert [question["question"] for question in quiz["questions"]] == [
+        "What is the capital of France?", "Which planet is red?"
+    ]
+    # 두 번째 호출은 function 없이 text 형식 prompt
+    assert len(llm.calls) == 2 and "functions" not in llm.calls[1]
+
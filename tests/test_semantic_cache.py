@@ -0,0 +1,59 @@
+import time
+
+from langchain.schema.embeddings import Embeddings
+
+from utils.semantic_cache import SemanticCache
+
+VECTORS = {
+    "What is the refund policy?": [1.0, 0.0, 0.0],
+    "what's the refund policy": [0.99, 0.1, 0.0],
+    "How do I reset my password?": [0.0, 1.0, 0.0],
+    "Who founded the company?": [0.0, 0.0, 1.0],
+}
+
+
+class TableEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text):
+        return VECTORS[text]
+
+
+def ask(cache, question, answer):
+    ''' page처럼 lookup 후 없으면 답변을 저장 '''
+    vector = cache.embed(question)
+    cached = cache.lookup(vector)
+    if cached is None:
+        cache.store(vector, answer)
+    return cached
+
+
+def test_similar_question_returns_stored_answer():
+    cache = SemanticCache(TableEmbeddings(), threshold=0.95)
+
+    assert ask(cache, "What is the refund policy?", "30 days") is None
+    assert ask(cache, "what's the refund policy", "not used") == "30 days"
+    assert ask(cache, "How do I reset my password?", "Settings") is None
+    assert cache.stats == {"hits": 1, "misses": 2, "size": 2}
+
+
+def test_entries_expire_after_ttl():
+    cache = SemanticCache(TableEmbeddings(), ttl=0)
+    ask(cache, "What is the refund policy?", "30 days")
+    time.sleep(0.01)
+
+    assert ask(cache, "What is the refund policy?", "60 days") is None
+    assert cache.stats["size"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(TableEmbeddings(), max_size=2)
+    ask(cache, "What is the refund policy?", "30 days")
+    ask(cache, "How do I reset my password?", "Settings")
+    # refund를 다시 사용 -> 다음 저장에서 password가 삭제됨
+    assert ask(cache, "What is the refund policy?", None) == "30 days"
+    ask(cache, "Who founded the company?", "Nico")
+
+    assert ask(cache, "What is the refund policy?", None) == "30 days"
+    assert cache.lookup(cache.embed("How do I reset my password?")) is None
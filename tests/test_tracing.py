@@ -0,0 +1,47 @@
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+
+from utils import context
+from utils.tracing import Trace
+
+
+class WordEncoding:
+    ''' 단어 하나 = token 하나 (tiktoken encoding 파일 없이 test) '''
+
+    def encode(self, text, **kwargs):
+        return text.split()
+
+
+class StreamingChatModel(BaseChatModel):
+    ''' streaming ChatOpenAI처럼 token을 하나씩 보내고 token_usage는 없음 '''
+
+    @property
+    def _llm_type(self):
+        return "streaming-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for token in ["Paris", " is", " the", " capital"]:
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def test_streaming_chat_model_counts_prompt_tokens(monkeypatch):
+    monkeypatch.setattr(context, "get_encoding", lambda model_name=None: WordEncoding())
+    trace = Trace("DocumentGPT", "chat")
+    messages = [
+        SystemMessage(content="Answer using only the context"),
+        HumanMessage(content="What is the capital of France?"),
+    ]
+
+    chunks = list(StreamingChatModel().stream(messages, config={"callbacks": [trace.handler()]}))
+
+    assert len(chunks) == 4
+    # 5 + 6 단어 + message마다 3 + 응답 시작 3
+    assert trace.tokens == {"prompt": 5 + 6 + 3 * 2 + 3, "completion": 4}
+    assert "generation" in trace.stages and "ttft" in trace.stages
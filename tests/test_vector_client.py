@@ -0,0 +1,28 @@
+from langchain.embeddings.fake import FakeEmbeddings
+from langchain.vectorstores.faiss import FAISS
+
+from utils import vector_client
+from utils.vector_client import RemoteRetriever, VectorServiceClient, remote_retriever
+
+embeddings = FakeEmbeddings(size=8)
+# 닫힌 port -> 연결이 바로 거부됨
+UNREACHABLE_URL = "http://127.0.0.1:9"
+
+
+def test_unreachable_service_falls_back_to_local_retriever():
+    local = FAISS.from_texts(["local chunk"], embeddings).as_retriever(search_kwargs={"k": 1})
+    retriever = RemoteRetriever(
+        client=VectorServiceClient(UNREACHABLE_URL),
+        embeddings=embeddings,
+        indexes=["files/digest"],
+        fallback=lambda: local,
+    )
+
+    docs = retriever.get_relevant_documents("question")
+
+    assert [doc.page_content for doc in docs] == ["local chunk"]
+
+
+def test_remote_retriever_is_none_when_service_is_down(monkeypatch):
+    monkeypatch.setattr(vector_client, "VECTOR_SERVICE_URL", UNREACHABLE_URL)
+    assert remote_retriever(["./.cache/files/digest"], embeddings) is None
@@ -0,0 +1,244 @@
+"""
+FAISS index selection for large corpora.
+
+`FAISS.from_documents` always builds a flat (exact, brute force) float32
+index. That is right for one uploaded file but not for SiteGPT sites with
+100k+ chunks. `choose_index_spec` picks a faiss factory string by corpus size:
+
+    < FLAT_MAX vectors             Flat                exact
+    < HNSW_MAX and read only       HNSW32              graph, no training (uploads)
+    otherwise                      IVF{nlist},Flat     clustered, supports add/remove
+    >= PQ_MIN or quantize=True     IVF{nlist},PQ{m}    + product quantization (m bytes/vector)
+
+IVF/PQ indexes are trained on a sample of the vectors. `nprobe` / `efSearch`
+trade recall for latency and can be changed at query time with
+`set_search_params`; `describe_index` and `evaluate_index` report memory and
+the recall/latency curve against exact search.
+
+IVF ids are not renumbered on removal the way flat ids are, so IVF indexes
+must be patched through `add_documents` / `delete_documents` here instead of
+the langchain FAISS methods.
+
+DocumentGPT collections are searched with a metadata filter. HNSW recall
+drops under such filters, and building HNSW on the page's script thread is
+slow, so collections use the mutable specs (Flat, then IVF).
+
+Indexes that grow in place (uploads are embedded batch by batch, sites are
+patched on every re-crawl) start out Flat; `rebuild_if_outgrown` rebuilds
+them from their stored vectors, without re-embedding, once the count calls
+for a larger kind of index.
+"""
+import math
+import statistics
+import time
+import uuid
+
+import faiss
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.vectorstores.faiss import FAISS
+
+FLAT_MAX = 20_000
+HNSW_MAX = 200_000
+PQ_MIN = 1_000_000
+TRAIN_SAMPLE = 100_000
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+ADD_BATCH_SIZE = 10_000
+# choose_index_spec가 count가 늘수록 고르는 순서
+INDEX_FAMILIES = ("Flat", "HNSW", "IVF", "PQ")
+
+
+def choose_pq_m(dimension):
+    ''' dimension을 나누어 떨어지게 하는 sub-quantizer 수 (sub-vector당 8~16 차원) '''
+    for m in (dimension // 16, dimension // 12, dimension // 8, 64, 32, 16, 8):
+        if m and dimension % m == 0:
+            return m
+    return 1
+
+
+def choose_index_spec(count, dimension, mutable=True, quantize=None):
+    if count < FLAT_MAX and not quantize:
+        return "Flat"
+    if not mutable and count < HNSW_MAX and not quantize:
+        return "HNSW32"
+    nlist = min(65536, 2 ** round(math.log2(4 * math.sqrt(count))))
+    if quantize or (quantize is None and count >= PQ_MIN):
+        return f"IVF{nlist},PQ{choose_pq_m(dimension)}"
+    return f"IVF{nlist},Flat"
+
+
+def set_search_params(index, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    parameters = faiss.ParameterSpace()
+    if faiss.try_extract_index_ivf(index) is not None:
+        parameters.set_index_parameter(index, "nprobe", nprobe)
+    if "HNSW" in type(index).__name__:
+        parameters.set_index_parameter(index, "efSearch", ef_search)
+
+
+def build_index(vectors, spec=None, mutable=True, quantize=None, seed=0):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+    spec = spec or choose_index_spec(count, dimension, mutable, quantize)
+    index = faiss.index_factory(dimension, spec)
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(count, min(count, TRAIN_SAMPLE), replace=False)]
+        index.train(sample)
+    for start in range(0, count, ADD_BATCH_SIZE):
+        index.add(vectors[start:start + ADD_BATCH_SIZE])
+    set_search_params(index)
+    return index
+
+
+def is_ivf(vectorstore):
+    return faiss.try_extract_index_ivf(vectorstore.index) is not None
+
+
+def index_family(index_or_spec):
+    ''' faiss index 또는 factory string -> INDEX_FAMILIES 중 하나 '''
+    name = index_or_spec if isinstance(index_or_spec, str) else type(index_or_spec).__name__
+    # "IVF1024,PQ64"는 PQ, "IVF1024,Flat"은 IVF
+    for family in reversed(INDEX_FAMILIES):
+        if family in name:
+            return family
+    return "Flat"
+
+
+def vectorstore_from_vectors(embeddings, vectors, docs, ids, **index_kwargs):
+    return FAISS(
+        embeddings,
+        build_index(vectors, **index_kwargs),
+        InMemoryDocstore(dict(zip(ids, docs))),
+        dict(enumerate(ids)),
+    )
+
+
+def build_vectorstore(docs, embeddings, ids=None, **index_kwargs):
+    ''' FAISS.from_documents와 같지만 corpus 크기에 맞는 index 사용 '''
+    vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+    ids = ids or [str(uuid.uuid4()) for _ in docs]
+    return vectorstore_from_vectors(
+        embeddings, np.asarray(vectors, dtype=np.float32), docs, ids, **index_kwargs
+    )
+
+
+def index_vectors(vectorstore):
+    '''
+    (docstore id 목록, vector) -> 이미 계산된 vector를 index에서 다시 꺼냄 (PQ는 근사값)
+    index 순서대로, 원본 index는 바꾸지 않음
+    '''
+    index = vectorstore.index
+    positions = sorted(vectorstore.index_to_docstore_id)
+    ids = [vectorstore.index_to_docstore_id[position] for position in positions]
+    if not positions:
+        return ids, np.empty((0, index.d), dtype=np.float32)
+    if faiss.try_extract_index_ivf(index) is None:
+        return ids, index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+    # IVF에는 id -> list 위치 map이 없고 (mmap 된 index는 만들 수도 없음)
+    # 삭제된 id가 있으면 reconstruct_n도 쓸 수 없으므로 list를 돌면서 꺼냄
+    ivf = faiss.extract_index_ivf(index)
+    vectors = np.empty((positions[-1] + 1, index.d), dtype=np.float32)
+    for list_no in range(ivf.nlist):
+        size = ivf.invlists.list_size(list_no)
+        if not size:
+            continue
+        list_ids = ivf.invlists.get_ids(list_no)
+        for offset, position in enumerate(faiss.rev_swig_ptr(list_ids, size).tolist()):
+            ivf.reconstruct_from_offset(list_no, offset, faiss.swig_ptr(vectors[position]))
+        ivf.invlists.release_ids(list_no, list_ids)
+    return ids, vectors[positions]
+
+
+def rebuild_if_outgrown(vectorstore, mutable=True, quantize=None):
+    '''
+    vector 수가 늘어 choose_index_spec이 더 큰 종류 (Flat -> HNSW / IVF -> IVF + PQ)를 고르면
+    저장된 vector로 index를 다시 만든 vectorstore, 아니면 그대로 반환
+    count가 다시 줄어도 작은 종류로는 되돌리지 않음 (threshold 근처에서 매번 rebuild 하지 않도록)
+    '''
+    index = vectorstore.index
+    spec = choose_index_spec(index.ntotal, index.d, mutable, quantize)
+    if INDEX_FAMILIES.index(index_family(spec)) <= INDEX_FAMILIES.index(index_family(index)):
+        return vectorstore
+    ids, vectors = index_vectors(vectorstore)
+    docs = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+    return vectorstore_from_vectors(vectorstore.embedding_function, vectors, docs, ids, spec=spec)
+
+
+def add_documents(vectorstore, docs, ids):
+    if not is_ivf(vectorstore):
+        return vectorstore.add_documents(docs, ids=ids)
+    # IVF는 삭제 후에도 id가 당겨지지 않으므로 직접 id를 지정해서 추가
+    vectors = np.asarray(
+        vectorstore.embedding_function.embed_documents([doc.page_content for doc in docs]),
+        dtype=np.float32,
+    )
+    start = max(vectorstore.index_to_docstore_id, default=-1) + 1
+    positions = np.arange(start, start + len(docs), dtype=np.int64)
+    vectorstore.index.add_with_ids(vectors, positions)
+    vectorstore.docstore.add(dict(zip(ids, docs)))
+    vectorstore.index_to_docstore_id.update(zip(positions.tolist(), ids))
+    return ids
+
+
+def delete_documents(vectorstore, ids):
+    if not is_ivf(vectorstore):
+        return vectorstore.delete(ids)
+    ids = set(ids)
+    positions = [
+        position for position, doc_id in vectorstore.index_to_docstore_id.items()
+        if doc_id in ids
+    ]
+    vectorstore.index.remove_ids(np.asarray(positions, dtype=np.int64))
+    for position in positions:
+        del vectorstore.index_to_docstore_id[position]
+    vectorstore.docstore.delete(list(ids))
+    return True
+
+
+def describe_index(index):
+    flat_bytes = index.ntotal * index.d * 4
+    memory_bytes = faiss.serialize_index(index).nbytes
+    return {
+        "type": type(index).__name__,
+        "ntotal": index.ntotal,
+        "dimension": index.d,
+        "memory_bytes": int(memory_bytes),
+        "flat_bytes": int(flat_bytes),
+        "compression": round(flat_bytes / memory_bytes, 2) if memory_bytes else None,
+    }
+
+
+def evaluate_index(index, vectors, queries, k=4, nprobes=(1, 4, 16, 64), ef_searches=(16, 64, 256)):
+    ''' exact search 대비 recall@k와 query latency (ms) '''
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        settings = [{"nprobe": nprobe} for nprobe in nprobes]
+    elif "HNSW" in type(index).__name__:
+        settings = [{"ef_search": ef} for ef in ef_searches]
+    else:
+        settings = [{}]
+
+    report = []
+    for setting in settings:
+        set_search_params(index, **setting)
+        latencies = []
+        found = 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            _, result = index.search(query[None, :], k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found += len(set(result[0]) & set(expected))
+        report.append({
+            **setting,
+            f"recall@{k}": found / (len(queries) * k),
+            "p50_ms": statistics.median(latencies),
+            "p95_ms": statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0],
+        })
+    set_search_params(index)
+    return report
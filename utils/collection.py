@@ -0,0 +1,77 @@
+"""
+Multi-file collections for DocumentGPT.
+
+Every file keeps its own FAISS index (built once, cached by content hash in
+utils/ingest.py). A collection is a fresh in-memory index built from the
+vectors already stored in those indexes, so adding or removing one file never
+re-embeds the others. Each chunk of the collection is tagged with its file's
+`digest` and `file_name` so searches can be filtered by source; the cached
+per-file indexes are never modified.
+"""
+import math
+
+from utils.hybrid import HybridRetriever
+
+
+def merge_collection(items):
+    '''
+    items: [(digest, file_name, vectorstore)]
+    파일별 index에서 vector를 꺼내 새 index를 만듦 (다시 embedding 하지 않음)
+    원본 index / docstore는 다른 session / collection과 공유하는 cache이므로 바꾸지 않고
+    복사한 문서에만 digest / file_name 추가
+    파일 index의 종류가 달라도 (Flat / HNSW / IVF) 합칠 수 있음
+    합친 index는 Flat (크면 IVF) -> HNSW는 page thread에서 만들기 느리고 filter 검색 recall이 낮음
+    '''
+    # page import 시점이 아니라 처음 merge 할 때 faiss load
+    import numpy as np
+    from langchain.schema import Document
+
+    from utils.ann_index import index_vectors, vectorstore_from_vectors
+
+    embeddings = None
+    ids = []
+    docs = []
+    vectors = []
+    merged = set()
+    for digest, file_name, vectorstore in items:
+        # 같은 내용의 파일이 다른 이름으로 두 번 올라온 경우
+        if digest in merged:
+            continue
+        merged.add(digest)
+        embeddings = embeddings or vectorstore.embedding_function
+        file_ids, file_vectors = index_vectors(vectorstore)
+        for doc_id in file_ids:
+            doc = vectorstore.docstore.search(doc_id)
+            docs.append(Document(
+                page_content=doc.page_content,
+                metadata={**doc.metadata, "digest": digest, "file_name": file_name},
+            ))
+        ids.extend(file_ids)
+        vectors.append(file_vectors)
+    if not ids:
+        return None
+    # filter 검색(as_filtered_retriever)에 맞는 Flat / IVF만 사용
+    return vectorstore_from_vectors(embeddings, np.vstack(vectors), docs, ids, mutable=True)
+
+
+def as_filtered_retriever(collection, bm25, digests=None, fetch_k=20):
+    '''
+    digests가 주어지면 해당 파일의 chunk만 검색 (BM25 + vector)
+    filter 전 후보 수는 collection 중 선택한 파일의 비율만큼 늘림
+    -> 큰 collection에서 작은 파일 하나만 골라도 fetch_k개 정도가 filter를 통과
+    '''
+    if not digests:
+        return HybridRetriever(vectorstore=collection, bm25=bm25, fetch_k=fetch_k)
+    digests = list(digests)
+    total = len(collection.index_to_docstore_id)
+    selected = sum(
+        doc.metadata.get("digest") in digests for doc in collection.docstore._dict.values()
+    )
+    candidates = math.ceil(fetch_k * total / max(selected, 1))
+    return HybridRetriever(
+        vectorstore=collection,
+        bm25=bm25,
+        fetch_k=fetch_k,
+        search_filter={"digest": digests},
+        filter_fetch_k=min(total, max(fetch_k * 4, candidates)),
+    )
@@ -0,0 +1,229 @@
+"""
+Token-budgeted context assembly for the RAG prompts (replaces `format_docs`).
+
+`format_docs` joined the retrieved chunks verbatim. The splitters keep a
+100-200 token overlap, so neighbouring chunks repeated text, and nothing
+capped the size of the prompt. `pack_docs` turns retrieved documents into the
+`{context}` string in four steps:
+
+1. merge: chunks of the same source whose text overlaps (the splitter
+   overlap makes adjacent chunks overlap) become one passage
+2. dedupe: passages whose word 3-grams are mostly contained in a
+   higher-ranked passage are dropped
+3. order: by `metadata["score"]` when the retriever sets one, otherwise by
+   retrieval rank (for QuizGPT that is simply document order)
+4. pack: passages are added until the tiktoken budget is reached; the last
+   one is cut at a token boundary, and the final string is re-counted so
+   the budget is exact
+
+The budget comes from the model: its context window minus the completion
+reserve (`max_tokens`) minus the prompt template and a question allowance,
+capped by `CONTEXT_TOKENS`. Models without `max_tokens` fall back to the
+settings in model.json, and Ollama models use their `num_ctx`. Ollama
+tokenizers differ from tiktoken, so for them the budget is approximate.
+"""
+import json
+import os
+from functools import lru_cache
+
+from utils.hybrid import tokenize
+
+MODEL_PATH = "./model.json"
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", 3000))
+QUESTION_TOKENS = 256
+DEFAULT_CONTEXT_WINDOW = 4096
+DEFAULT_MAX_TOKENS = 512
+MIN_PASSAGE_TOKENS = 50
+MIN_OVERLAP_CHARS = 20
+DUPLICATE_THRESHOLD = 0.85
+SEPARATOR = "\n\n"
+
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo-16k-0613": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-4": 8192,
+    "gpt-4-0613": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-1106-preview": 128000,
+}
+
+
+@lru_cache
+def load_model_config(path=MODEL_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+@lru_cache
+def get_encoding(model_name=None):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name or "")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def prompt_text(prompt):
+    ''' ChatPromptTemplate / PromptTemplate의 template 부분 (변수 제외) '''
+    if prompt is None:
+        return ""
+    if hasattr(prompt, "template"):
+        return prompt.template
+    return "\n".join(
+        message.prompt.template for message in prompt.messages
+        if hasattr(message, "prompt")
+    )
+
+
+def model_limits(llm=None):
+    ''' (model_name, context window, completion token reserve) '''
+    config = load_model_config()
+    if getattr(llm, "num_ctx", None):
+        model_name = None
+        window = llm.num_ctx
+    else:
+        model_name = getattr(llm, "model_name", None) or config.get("model_name")
+        window = CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+    max_tokens = getattr(llm, "max_tokens", None) or config.get("max_tokens") or DEFAULT_MAX_TOKENS
+    return model_name, window, max_tokens
+
+
+def context_budget(llm=None, prompt=None, cap=CONTEXT_TOKENS):
+    model_name, window, max_tokens = model_limits(llm)
+    template_tokens = len(get_encoding(model_name).encode(prompt_text(prompt)))
+    budget = window - max_tokens - template_tokens - QUESTION_TOKENS
+    return max(0, min(budget, cap) if cap else budget)
+
+
+def merge_text(first, second):
+    ''' first 끝과 second 앞이 겹치면 합친 text, 아니면 None '''
+    if second in first:
+        return first
+    if first in second:
+        return second
+    probe = second[:MIN_OVERLAP_CHARS]
+    start = first.find(probe, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first[:start] + second
+        start = first.find(probe, start + 1)
+    return None
+
+
+def to_passages(docs):
+    passages = []
+    for rank, doc in enumerate(docs):
+        score = doc.metadata.get("score")
+        passages.append({
+            "source": doc.metadata.get("source"),
+            "text": doc.page_content,
+            "score": -rank if score is None else score,
+            "rank": rank,
+        })
+    return passages
+
+
+def merge_passages(passages):
+    ''' 같은 source에서 겹치는 passage를 더 이상 합칠 게 없을 때까지 합침 '''
+    merged = []
+    for passage in passages:
+        passage = dict(passage)
+        changed = True
+        while changed:
+            changed = False
+            for other in merged:
+                if other["source"] != passage["source"]:
+                    continue
+                text = merge_text(other["text"], passage["text"]) or merge_text(
+                    passage["text"], other["text"]
+                )
+                if text is None:
+                    continue
+                merged.remove(other)
+                passage = {
+                    **passage,
+                    "text": text,
+                    "score": max(passage["score"], other["score"]),
+                    "rank": min(passage["rank"], other["rank"]),
+                }
+                changed = True
+                break
+        merged.append(passage)
+    return merged
+
+
+def shingles(text, size=3):
+    tokens = tokenize(text)
+    return {tuple(tokens[i:i + size]) for i in range(max(1, len(tokens) - size + 1))}
+
+
+def drop_duplicates(passages, threshold=DUPLICATE_THRESHOLD):
+    ''' score 순서로, 이미 고른 passage에 거의 다 포함된 passage는 버림 '''
+    kept = []
+    kept_shingles = []
+    for passage in passages:
+        current = shingles(passage["text"])
+        if any(
+            len(current & other) / (min(len(current), len(other)) or 1) >= threshold
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(passage)
+        kept_shingles.append(current)
+    return kept
+
+
+def pack_passages(passages, budget, encoding, separator=SEPARATOR):
+    separator_tokens = len(encoding.encode(separator))
+    texts = []
+    used = 0
+    for passage in passages:
+        tokens = encoding.encode(passage["text"])
+        cost = len(tokens) + (separator_tokens if texts else 0)
+        if used + cost <= budget:
+            texts.append(passage["text"])
+            used += cost
+            continue
+        remaining = budget - used - (separator_tokens if texts else 0)
+        if remaining >= MIN_PASSAGE_TOKENS:
+            texts.append(encoding.decode(tokens[:remaining]))
+        break
+
+    # 이어 붙인 경계에서 token이 달라질 수 있으므로 마지막에 다시 세서 정확히 맞춤
+    context = separator.join(texts)
+    excess = len(encoding.encode(context)) - budget
+    while texts and excess > 0:
+        tokens = encoding.encode(texts[-1])
+        if len(tokens) - excess < MIN_PASSAGE_TOKENS:
+            texts.pop()
+        else:
+            texts[-1] = encoding.decode(tokens[:len(tokens) - excess])
+        context = separator.join(texts)
+        excess = len(encoding.encode(context)) - budget
+    return context
+
+
+def pack_docs(docs, budget=CONTEXT_TOKENS, encoding=None):
+    encoding = encoding or get_encoding()
+    passages = drop_duplicates(sorted(
+        merge_passages(to_passages(docs)),
+        key=lambda passage: (-passage["score"], passage["rank"]),
+    ))
+    return pack_passages(passages, budget, encoding)
+
+
+def make_formatter(llm=None, prompt=None, cap=CONTEXT_TOKENS):
+    ''' chain의 "context"에 쓰는 format_docs 대체 함수 (budget은 model / prompt 기준으로 한 번만 계산) '''
+    budget = context_budget(llm, prompt, cap)
+    encoding = get_encoding(model_limits(llm)[0])
+
+    def format_docs(docs):
+        return pack_docs(docs, budget, encoding)
+
+    return format_docs
@@ -0,0 +1,196 @@
+"""
+Incremental sitemap crawler for SiteGPT.
+
+Each crawled site keeps a manifest next to its FAISS index:
+
+    ./.cache/sites/{digest}/manifest.json
+        {url: {"lastmod": ..., "hash": ..., "ids": [docstore ids]}}
+
+A re-crawl only fetches pages whose sitemap `lastmod` changed (or that have
+no `lastmod`), only re-splits / re-embeds pages whose parsed text hash
+changed, and patches the persisted index in place (see utils/ann_index.py for
+why IVF indexes are patched through its add / delete helpers).
+
+The fetcher (aiohttp, process pool) and faiss are imported by `crawl_site`,
+so SiteGPT can resolve a site's directory without loading them.
+"""
+import hashlib
+import json
+import os
+
+from bs4 import BeautifulSoup
+from langchain.schema import Document
+
+from utils.index_store import index_exists, load_index, save_index
+from utils.resources import get_http_session, get_resource
+from utils.tracing import NullTrace
+
+SITES_DIR = "./.cache/sites"
+
+
+def get_site_dir(url):
+    return os.path.join(SITES_DIR, hashlib.sha256(url.encode()).hexdigest())
+
+
+def load_manifest(site_dir):
+    manifest_path = os.path.join(site_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(site_dir, manifest):
+    manifest_path = os.path.join(site_dir, "manifest.json")
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def parse_sitemap(xml):
+    ''' (sitemap 목록, [{"loc", "lastmod"}]) 반환 '''
+    soup = BeautifulSoup(xml, "xml")
+    sitemaps = [
+        tag.find("loc").text.strip() for tag in soup.find_all("sitemap")
+        if tag.find("loc")
+    ]
+    entries = []
+    for tag in soup.find_all("url"):
+        loc = tag.find("loc")
+        if not loc:
+            continue
+        lastmod = tag.find("lastmod")
+        entries.append({
+            "loc": loc.text.strip(),
+            "lastmod": lastmod.text.strip() if lastmod else "",
+        })
+    return sitemaps, entries
+
+
+def fetch_sitemap(url, session):
+    ''' sitemap index 안의 sitemap까지 따라가서 전체 url 목록 반환 '''
+    entries = []
+    pending = [url]
+    seen = set()
+    while pending:
+        sitemap_url = pending.pop()
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        response = session.get(sitemap_url, timeout=30)
+        response.raise_for_status()
+        sitemaps, urls = parse_sitemap(response.text)
+        pending.extend(sitemaps)
+        entries.extend(urls)
+    return entries
+
+
+def make_splitter():
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return get_resource(
+        "splitter:crawl",
+        RecursiveCharacterTextSplitter.from_tiktoken_encoder,
+        chunk_size=1000,
+        chunk_overlap=200,
+    )
+
+
+def page_ids(url, count):
+    prefix = hashlib.sha1(url.encode()).hexdigest()
+    return [f"{prefix}-{i}" for i in range(count)]
+
+
+def parse_page(soup):
+    header = soup.find("header")
+    footer = soup.find("footer")
+    if header:
+        header.decompose()
+    if footer:
+        footer.decompose()
+    return str(soup.get_text()).replace(
+        "\n", " ").replace("\xa0", " ").replace("CloseSEarch Submit Blog", "")
+
+
+def crawl_site(
+    url,
+    parsing_function,
+    splitter,
+    embeddings,
+    trace=None,
+    **fetch_kwargs,
+):
+    '''
+    바뀐 page만 다시 가져와서 embedding, index는 다시 만들지 않고 add / delete
+    fetch_kwargs는 fetch_pages로 전달 (requests_per_second, concurrency, ...)
+    parsing_function은 process pool에서 실행되므로 module 최상위 함수
+    '''
+    from utils.ann_index import add_documents, build_vectorstore, delete_documents, rebuild_if_outgrown
+    from utils.fetcher import fetch_pages
+
+    trace = trace or NullTrace()
+    site_dir = get_site_dir(url)
+    os.makedirs(site_dir, exist_ok=True)
+    manifest = load_manifest(site_dir)
+
+    with trace.stage("sitemap"):
+        entries = fetch_sitemap(url, get_http_session())
+
+    # lastmod가 같으면 fetch 하지 않음 (lastmod가 없는 page는 항상 확인)
+    stale = [
+        entry for entry in entries
+        if entry["loc"] not in manifest
+        or not entry["lastmod"]
+        or manifest[entry["loc"]]["lastmod"] != entry["lastmod"]
+    ]
+
+    delete_ids = []
+    add_docs = []
+    add_ids = []
+    with trace.stage("load"):
+        pages = fetch_pages(stale, parsing_function, **fetch_kwargs)
+    for entry, text in pages:
+        loc = entry["loc"]
+        text_hash = hashlib.sha256(text.encode()).hexdigest()
+        previous = manifest.get(loc)
+        if previous and previous["hash"] == text_hash:
+            previous["lastmod"] = entry["lastmod"]
+            continue
+        if previous:
+            delete_ids.extend(previous["ids"])
+
+        with trace.stage("split"):
+            docs = splitter.split_documents([Document(
+                page_content=text,
+                metadata={"source": loc, "lastmod": entry["lastmod"]},
+            )])
+        ids = page_ids(loc, len(docs))
+        add_docs.extend(docs)
+        add_ids.extend(ids)
+        manifest[loc] = {"lastmod": entry["lastmod"], "hash": text_hash, "ids": ids}
+
+    # sitemap에서 사라진 page 삭제
+    live = {entry["loc"] for entry in entries}
+    for loc in [loc for loc in manifest if loc not in live]:
+        delete_ids.extend(manifest.pop(loc)["ids"])
+
+    with trace.stage("embed"):
+        if index_exists(site_dir):
+            vector_store = load_index(site_dir, embeddings, mmap=False)
+            if delete_ids:
+                delete_documents(vector_store, delete_ids)
+            if add_docs:
+                add_documents(vector_store, add_docs, add_ids)
+            # re-crawl로 page가 늘어 threshold를 넘으면 flat -> IVF(/PQ)
+            vector_store = rebuild_if_outgrown(vector_store)
+        elif add_docs:
+            # page 수가 많으면 flat 대신 IVF(/PQ) index
+            vector_store = build_vectorstore(add_docs, embeddings, ids=add_ids, mutable=True)
+        else:
+            return None
+
+    if delete_ids or add_docs:
+        with trace.stage("save"):
+            save_index(vector_store, site_dir)
+    save_manifest(site_dir, manifest)
+    return vector_store
@@ -0,0 +1,160 @@
+"""
+Batched, concurrent embedding client shared by every page.
+
+`BatchedEmbeddings` wraps any langchain `Embeddings` (OpenAIEmbeddings,
+OllamaEmbeddings, ...) and:
+
+- packs texts into batches by tiktoken count (`max_batch_tokens`) and by
+  number of inputs (`max_batch_size`) so each request stays under provider limits
+- sends batches concurrently on one process-wide thread pool, so the total
+  number of in-flight requests is bounded across all sessions (backpressure)
+- retries rate-limit / transient errors with exponential backoff and full
+  jitter, honouring `Retry-After` when the error carries it
+- reports `(embedded, total)` progress from the calling thread, so the
+  callback may update Streamlit elements
+
+It only talks to the wrapped client, so it can be exercised against a local
+fake embedding server, e.g. `OpenAIEmbeddings(openai_api_base="http://127.0.0.1:8000/v1")`.
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain.schema.embeddings import Embeddings
+
+from utils.context import get_encoding
+
+MAX_IN_FLIGHT = 8
+MAX_BATCH_TOKENS = 32_000
+MAX_BATCH_SIZE = 256
+MAX_RETRIES = 6
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+TRANSIENT_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+executor_lock = threading.Lock()
+executor = None
+
+
+def get_executor():
+    ''' 모든 page / session이 같은 thread pool을 사용 -> 동시 요청 수 제한 '''
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=MAX_IN_FLIGHT, thread_name_prefix="embeddings"
+            )
+        return executor
+
+
+def get_status(error):
+    for name in ("http_status", "status_code", "status"):
+        status = getattr(error, name, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def get_retry_after(error):
+    headers = getattr(error, "headers", None) or getattr(
+        getattr(error, "response", None), "headers", None
+    ) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    name = type(error).__name__
+    if "RateLimit" in name or "Timeout" in name or "Connection" in name:
+        return True
+    return get_status(error) in TRANSIENT_STATUSES
+
+
+class BatchedEmbeddings(Embeddings):
+    def __init__(
+        self,
+        underlying,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_concurrency=MAX_IN_FLIGHT,
+        max_retries=MAX_RETRIES,
+        on_progress=None,
+    ):
+        self.underlying = underlying
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.on_progress = on_progress
+
+    def pack(self, texts):
+        ''' [(start, end)] -- token 수 / 개수 제한 안에서 최대한 크게 '''
+        encoding = get_encoding()
+        batches = []
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            size = len(encoding.encode(text, disallowed_special=()))
+            if i > start and (
+                tokens + size > self.max_batch_tokens or i - start >= self.max_batch_size
+            ):
+                batches.append((start, i))
+                start = i
+                tokens = 0
+            tokens += size
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.underlying.embed_documents(texts)
+            except Exception as error:
+                if attempt == self.max_retries or not is_retryable(error):
+                    raise
+                delay = get_retry_after(error)
+                if delay is None:
+                    # full jitter: 0 ~ backoff * 2^attempt
+                    delay = random.uniform(
+                        0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt)
+                    )
+                time.sleep(delay)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        results = [None] * len(texts)
+        pending = {}
+        batches = iter(self.pack(texts))
+        embedded = 0
+        pool = get_executor()
+
+        def submit_next():
+            batch = next(batches, None)
+            if batch is not None:
+                start, end = batch
+                pending[pool.submit(self.embed_batch, texts[start:end])] = batch
+
+        # 최대 max_concurrency개 batch만 동시에 요청
+        for _ in range(self.max_concurrency):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end = pending.pop(future)
+                results[start:end] = future.result()
+                embedded += end - start
+                submit_next()
+            if self.on_progress:
+                self.on_progress(embedded, len(texts))
+        return results
+
+    def embed_query(self, text):
+        return self.underlying.embed_query(text)
+
@@ -0,0 +1,158 @@
+"""
+Single-file embedding cache.
+
+`LocalFileStore` writes one small file per chunk embedding, so large corpora
+end up as hundreds of thousands of files and most lookup time goes to
+filesystem metadata. `SQLiteEmbeddingStore` keeps every embedding of every
+page and model in one SQLite table keyed by (namespace, text hash), with the
+vector as a float32 (or float16) BLOB, and answers `mget` / `mset` in bulk.
+
+The text hash is the same uuid langchain's `CacheBackedEmbeddings` uses for
+its file names, so existing LocalFileStore directories can be imported as is:
+
+    python -m utils.embedding_store migrate ./.cache/embeddings --namespace OpenAIEmbeddings:text-embedding-ada-002
+    python -m utils.embedding_store migrate ./.cache/private_embeddings --namespace OllamaEmbeddings:mistral:latest
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.schema.storage import BaseStore
+
+EMBEDDING_STORE_PATH = "./.cache/embeddings.db"
+# langchain.embeddings.cache와 같은 값 -> 기존 LocalFileStore 파일 이름과 key가 같음
+NAMESPACE_UUID = uuid.UUID(int=1985)
+SQL_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+"""
+
+
+def hash_text(text):
+    return str(uuid.uuid5(NAMESPACE_UUID, hashlib.sha1(text.encode("utf-8")).hexdigest()))
+
+
+def embedding_namespace(embeddings):
+    ''' 예: OpenAIEmbeddings:text-embedding-ada-002 '''
+    while hasattr(embeddings, "underlying"):
+        embeddings = embeddings.underlying
+    return f"{type(embeddings).__name__}:{getattr(embeddings, 'model', '')}"
+
+
+class SQLiteEmbeddingStore(BaseStore):
+    ''' key는 원본 text, 저장은 (namespace, text hash) -> vector BLOB '''
+
+    def __init__(self, namespace, path=EMBEDDING_STORE_PATH, dtype="float32"):
+        self.namespace = namespace
+        self.dtype = np.dtype(dtype)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def encode(self, vector):
+        return np.asarray(vector, dtype=self.dtype).tobytes()
+
+    def decode(self, blob):
+        return np.frombuffer(blob, dtype=self.dtype).astype(np.float32).tolist()
+
+    def mget_hashed(self, keys):
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), SQL_BATCH_SIZE):
+                batch = keys[start:start + SQL_BATCH_SIZE]
+                rows = self.connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE namespace = ? AND key IN ({})".format(
+                        ",".join("?" * len(batch))
+                    ),
+                    [self.namespace, *batch],
+                ).fetchall()
+                found.update(rows)
+        return [self.decode(found[key]) if key in found else None for key in keys]
+
+    def mset_hashed(self, pairs):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (namespace, key, vector) VALUES (?, ?, ?)",
+                [(self.namespace, key, self.encode(vector)) for key, vector in pairs],
+            )
+
+    def mget(self, keys):
+        return self.mget_hashed([hash_text(key) for key in keys])
+
+    def mset(self, key_value_pairs):
+        self.mset_hashed([(hash_text(key), value) for key, value in key_value_pairs])
+
+    def mdelete(self, keys):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM embeddings WHERE namespace = ? AND key = ?",
+                [(self.namespace, hash_text(key)) for key in keys],
+            )
+
+    def yield_keys(self, prefix=None):
+        ''' 원본 text는 저장하지 않으므로 text hash를 반환 '''
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key FROM embeddings WHERE namespace = ?", (self.namespace,)
+            ).fetchall()
+        for (key,) in rows:
+            if prefix is None or key.startswith(prefix):
+                yield key
+
+
+def cache_backed_embeddings(underlying, path=EMBEDDING_STORE_PATH, dtype="float32"):
+    return CacheBackedEmbeddings(
+        underlying,
+        SQLiteEmbeddingStore(embedding_namespace(underlying), path=path, dtype=dtype),
+    )
+
+
+def migrate_local_file_store(directory, namespace, path=EMBEDDING_STORE_PATH, dtype="float32"):
+    ''' LocalFileStore 디렉토리(하위 디렉토리 포함)의 embedding을 SQLite로 복사 '''
+    store = SQLiteEmbeddingStore(namespace, path=path, dtype=dtype)
+    pairs = []
+    count = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                uuid.UUID(name)
+            except ValueError:
+                continue
+            with open(os.path.join(root, name), "rb") as f:
+                pairs.append((name, json.loads(f.read())))
+            if len(pairs) >= SQL_BATCH_SIZE:
+                store.mset_hashed(pairs)
+                count += len(pairs)
+                pairs = []
+    if pairs:
+        store.mset_hashed(pairs)
+        count += len(pairs)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single-file embedding cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="import a LocalFileStore directory")
+    migrate_parser.add_argument("directory")
+    migrate_parser.add_argument("--namespace", required=True)
+    migrate_parser.add_argument("--db", default=EMBEDDING_STORE_PATH)
+    migrate_parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+    count = migrate_local_file_store(args.directory, args.namespace, args.db, args.dtype)
+    print(f"Migrated {count} embeddings into {args.db} ({args.namespace})")
@@ -0,0 +1,183 @@
+"""
+Async page fetcher for the SiteGPT crawler.
+
+- one pooled aiohttp session (keep-alive connections)
+- per-host token bucket, slowed down further by robots.txt `Crawl-delay`
+- retries with exponential backoff + jitter (honours `Retry-After`)
+- HTML parsing runs in a process pool, so BeautifulSoup never blocks fetching
+
+The only network assumption is plain HTTP, so it can be pointed at a local
+`http.server` serving a synthetic sitemap.
+"""
+import asyncio
+import logging
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+USER_AGENT = "SiteGPT"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostPolicy:
+    ''' host 별 robots.txt + rate limit '''
+
+    def __init__(self, requests_per_second, burst):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.buckets = {}
+        self.robots = {}
+        self.lock = asyncio.Lock()
+
+    async def get(self, session, url):
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        async with self.lock:
+            if host not in self.buckets:
+                robots = await fetch_robots(session, host)
+                rate = self.requests_per_second
+                delay = robots.crawl_delay(USER_AGENT) if robots else None
+                if delay:
+                    rate = min(rate, 1 / float(delay))
+                self.robots[host] = robots
+                self.buckets[host] = TokenBucket(
+                    rate, capacity=1 if delay else self.burst
+                )
+        return self.robots[host], self.buckets[host]
+
+
+async def fetch_robots(session, host):
+    robots = RobotFileParser()
+    try:
+        async with session.get(f"{host}/robots.txt") as response:
+            if response.status >= 400:
+                return None
+            robots.parse((await response.text()).splitlines())
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+    return robots
+
+
+def parse_html(parsing_function, html):
+    ''' process pool에서 실행 -> parsing_function은 module 최상위 함수여야 함 '''
+    return parsing_function(BeautifulSoup(html, "html.parser"))
+
+
+async def fetch_html(session, url, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            async with session.get(url) as response:
+                if response.status not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return await response.text()
+                retry_after = response.headers.get("Retry-After", "")
+        except aiohttp.ClientResponseError:
+            # 404 같은 응답은 다시 시도하지 않음
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == retries:
+                raise
+            retry_after = ""
+        if attempt == retries:
+            break
+        delay = float(retry_after) if retry_after.isdigit() else backoff * 2 ** attempt
+        await asyncio.sleep(delay + random.uniform(0, backoff))
+    raise aiohttp.ClientError(f"giving up on {url}")
+
+
+async def fetch_pages_async(
+    entries,
+    parsing_function,
+    requests_per_second=5,
+    burst=5,
+    concurrency=16,
+    retries=3,
+    backoff=0.5,
+    timeout=30,
+    parse_workers=None,
+    on_page=None,
+):
+    ''' on_page: page를 하나 가져올 때마다 on_page(지금까지 page 수) '''
+    policy = HostPolicy(requests_per_second, burst)
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    fetched = 0
+
+    async with aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={"User-Agent": USER_AGENT},
+    ) as session:
+        # fork는 Streamlit의 thread / lock 상태까지 복사 -> spawn으로 새 interpreter에서 실행
+        # (parsing_function은 module 최상위 함수여야 함)
+        with ProcessPoolExecutor(
+            max_workers=parse_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+
+            async def fetch_one(entry):
+                nonlocal fetched
+                robots, bucket = await policy.get(session, entry["loc"])
+                if robots and not robots.can_fetch(USER_AGENT, entry["loc"]):
+                    return None
+                async with semaphore:
+                    await bucket.acquire()
+                    try:
+                        html = await fetch_html(session, entry["loc"], retries, backoff)
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        return None
+                try:
+                    text = await loop.run_in_executor(pool, parse_html, parsing_function, html)
+                # pool이 죽은 경우는 모든 page가 실패하므로 crawl을 멈춤
+                except BrokenProcessPool:
+                    raise
+                # parsing_function이 이 page에서만 실패 -> 이 page만 건너뛰고 나머지는 계속
+                except Exception as error:
+                    logger.warning("could not parse %s: %s", entry["loc"], error)
+                    return None
+                fetched += 1
+                if on_page:
+                    on_page(fetched)
+                return entry, text
+
+            results = await asyncio.gather(*[fetch_one(entry) for entry in entries])
+    return [result for result in results if result is not None]
+
+
+def fetch_pages(entries, parsing_function, **kwargs):
+    ''' 실패한 page는 건너뛰고 [(entry, text)] 반환 '''
+    if not entries:
+        return []
+    return asyncio.run(fetch_pages_async(entries, parsing_function, **kwargs))
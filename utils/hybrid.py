@@ -0,0 +1,211 @@
+"""
+Hybrid sparse + dense retrieval.
+
+Dense FAISS search misses exact identifiers and rare keywords, so every FAISS
+index also gets a BM25 inverted index (`bm25.pkl` in the index directory,
+stamped with a digest of the docstore so a patched index rebuilds it).
+`HybridRetriever` runs both, fuses the two rankings with reciprocal rank
+fusion and, if a cross-encoder is configured (`RERANK_MODEL`) and the
+latency budget allows it, reranks the fused candidates on CPU.
+
+The time spent in each step is added to the caller's `Trace` (found through
+the run's callbacks) as `retrieve.dense`, `retrieve.sparse` and
+`retrieve.rerank`, a breakdown of the `retrieve` stage.
+"""
+import hashlib
+import math
+import os
+import pickle
+import re
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from langchain.schema import BaseRetriever, Document
+
+from utils.tracing import NullTrace, trace_from
+
+RERANK_MODEL = os.getenv("RERANK_MODEL")  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+RETRIEVAL_BUDGET_MS = float(os.getenv("RETRIEVAL_BUDGET_MS", 500))
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = []
+        self.lengths = []
+        self.postings = defaultdict(list)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        index = cls()
+        for position in sorted(vectorstore.index_to_docstore_id):
+            doc_id = vectorstore.index_to_docstore_id[position]
+            doc = vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                index.add(doc_id, doc.page_content)
+        return index
+
+    def add(self, doc_id, text):
+        number = len(self.doc_ids)
+        tokens = tokenize(text)
+        self.doc_ids.append(doc_id)
+        self.lengths.append(len(tokens))
+        for term, frequency in Counter(tokens).items():
+            self.postings[term].append((number, frequency))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, query, k=20):
+        ''' [(docstore id, score)] '''
+        if not self.doc_ids:
+            return []
+        average = sum(self.lengths) / len(self.lengths) or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.doc_ids) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for number, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[number] / average)
+                scores[number] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.doc_ids[number], score) for number, score in ranked]
+
+
+def docstore_digest(vectorstore):
+    ''' index 순서대로 (docstore id, 내용) hash -> 문서 수가 같아도 내용이 바뀌면 달라짐 '''
+    sha = hashlib.sha256()
+    for position in sorted(vectorstore.index_to_docstore_id):
+        doc_id = vectorstore.index_to_docstore_id[position]
+        doc = vectorstore.docstore.search(doc_id)
+        sha.update(str(doc_id).encode())
+        sha.update(b"\0")
+        if isinstance(doc, Document):
+            sha.update(doc.page_content.encode())
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+def load_bm25(index_dir, vectorstore):
+    '''
+    bm25.pkl에 저장된 docstore digest가 FAISS index와 다르면 다시 생성
+    (re-crawl은 page_ids가 같아서 문서 수는 그대로이고 내용만 바뀔 수 있음)
+    '''
+    path = os.path.join(index_dir, "bm25.pkl")
+    digest = docstore_digest(vectorstore)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        # 예전 형식(BM25Index만 저장)은 digest가 없으므로 다시 생성
+        if isinstance(saved, dict) and saved.get("digest") == digest:
+            return saved["bm25"]
+    bm25 = BM25Index.from_vectorstore(vectorstore)
+    with open(path + ".tmp", 'wb') as f:
+        pickle.dump({"digest": digest, "bm25": bm25}, f)
+    os.replace(path + ".tmp", path)
+    return bm25
+
+
+@lru_cache(maxsize=2)
+def get_cross_encoder(model_name):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model_name, device="cpu")
+
+
+def matches_filter(doc, search_filter):
+    for key, value in (search_filter or {}).items():
+        allowed = value if isinstance(value, list) else [value]
+        if doc.metadata.get(key) not in allowed:
+            return False
+    return True
+
+
+class HybridRetriever(BaseRetriever):
+    vectorstore: object
+    bm25: object
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    search_filter: dict = None
+    # search_filter가 있을 때 filter 전에 가져올 후보 수 (기본 fetch_k * 4)
+    filter_fetch_k: int = None
+    rerank_model: str = RERANK_MODEL
+    budget_ms: float = RETRIEVAL_BUDGET_MS
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, index_dir=None, **kwargs):
+        if index_dir:
+            bm25 = load_bm25(index_dir, vectorstore)
+        else:
+            bm25 = BM25Index.from_vectorstore(vectorstore)
+        return cls(vectorstore=vectorstore, bm25=bm25, **kwargs)
+
+    def candidate_count(self):
+        return self.filter_fetch_k or self.fetch_k * 4
+
+    def dense_search(self, query, embedding=None):
+        ''' embedding: 이미 계산된 query vector (vector service는 query를 직접 embedding 하지 않음) '''
+        kwargs = {"filter": self.search_filter, "fetch_k": self.candidate_count()} if self.search_filter else {}
+        if embedding is not None:
+            return self.vectorstore.similarity_search_by_vector(embedding, k=self.fetch_k, **kwargs)
+        return self.vectorstore.similarity_search(query, k=self.fetch_k, **kwargs)
+
+    def sparse_search(self, query):
+        docs = []
+        for doc_id, _ in self.bm25.search(query, self.candidate_count() if self.search_filter else self.fetch_k):
+            doc = self.vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document) and matches_filter(doc, self.search_filter):
+                docs.append(doc)
+        return docs[:self.fetch_k]
+
+    def fuse(self, rankings):
+        ''' reciprocal rank fusion: score = sum(1 / (rrf_k + rank)) '''
+        scores = defaultdict(float)
+        docs = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking, start=1):
+                key = (doc.metadata.get("source"), doc.page_content)
+                scores[key] += 1 / (self.rrf_k + rank)
+                docs[key] = doc
+        return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+    def rerank(self, query, docs):
+        encoder = get_cross_encoder(self.rerank_model)
+        scores = encoder.predict([(query, doc.page_content) for doc in docs])
+        return [doc for _, doc in sorted(zip(scores, docs), key=lambda item: item[0], reverse=True)]
+
+    def search(self, query, embedding=None, trace=None):
+        ''' trace: 단계별 시간을 기록할 Trace (retriever는 여러 session이 공유하므로 self에 저장하지 않음) '''
+        trace = trace or NullTrace()
+        started = time.perf_counter()
+        dense = self.dense_search(query, embedding)
+        dense_done = time.perf_counter()
+        sparse = self.sparse_search(query)
+        sparse_done = time.perf_counter()
+        fused = self.fuse([dense, sparse])
+
+        trace.add("retrieve.dense", dense_done - started)
+        trace.add("retrieve.sparse", sparse_done - dense_done)
+        # 예산의 절반 이상을 이미 썼으면 rerank는 건너뜀
+        spent = (time.perf_counter() - started) * 1000
+        if self.rerank_model and fused and (not self.budget_ms or spent < self.budget_ms / 2):
+            rerank_started = time.perf_counter()
+            fused = self.rerank(query, fused[:self.fetch_k])
+            trace.add("retrieve.rerank", time.perf_counter() - rerank_started)
+        return fused[:self.k]
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search(query, trace=trace_from(run_manager))
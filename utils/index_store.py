@@ -0,0 +1,134 @@
+"""
+On-disk FAISS index store.
+
+Every save writes a new version directory in the same layout as
+`FAISS.save_local` (index.faiss + index.pkl), then swaps a `CURRENT` pointer
+file with `os.replace`:
+
+    {index_dir}/CURRENT                        name of the live version
+    {index_dir}/versions/{version}/index.faiss
+    {index_dir}/versions/{version}/index.pkl
+
+Readers resolve the pointer once and read both files from that version, so
+several Streamlit workers can share one directory and never pair the vectors
+of one save with the docstore of another. The previous version is kept for
+readers that resolved the pointer just before a swap; older ones are
+deleted. Directories written before versioning (index.faiss directly in
+`index_dir`) are still read.
+
+`load_index` reopens the vectors with `faiss.IO_FLAG_MMAP`. faiss can only
+map the inverted lists of IVF indexes: those vectors then live in the OS page
+cache once and are shared by every worker process. Flat and HNSW indexes
+(uploads and sites below the IVF thresholds in utils/ann_index.py) are read
+into each process.
+
+faiss is imported inside the functions that read or write an index, so pages
+can check `index_exists` on first paint without loading it.
+"""
+import os
+import pickle
+import shutil
+import time
+import uuid
+
+INDEX_NAME = "index"
+CURRENT_NAME = "CURRENT"
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 2
+
+
+def read_version(index_dir):
+    ''' CURRENT에 적힌 version 이름, 없으면 None (versioning 전에 저장된 index) '''
+    try:
+        with open(os.path.join(index_dir, CURRENT_NAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def get_version_dir(index_dir, version=None):
+    version = version or read_version(index_dir)
+    return os.path.join(index_dir, VERSIONS_DIR, version) if version else index_dir
+
+
+def get_index_paths(index_dir, version=None):
+    version_dir = get_version_dir(index_dir, version)
+    return (
+        os.path.join(version_dir, f"{INDEX_NAME}.faiss"),
+        os.path.join(version_dir, f"{INDEX_NAME}.pkl"),
+    )
+
+
+def index_exists(index_dir):
+    return all(os.path.exists(path) for path in get_index_paths(index_dir))
+
+
+def index_version(index_dir):
+    ''' index가 다시 저장될 때마다 바뀌는 값 (cache key용), index가 없으면 None '''
+    version = read_version(index_dir)
+    if version:
+        return version
+    faiss_path, _ = get_index_paths(index_dir)
+    if not os.path.exists(faiss_path):
+        return None
+    return str(os.stat(faiss_path).st_mtime_ns)
+
+
+def remove_old_versions(index_dir, keep=KEEP_VERSIONS):
+    versions_dir = os.path.join(index_dir, VERSIONS_DIR)
+    # version 이름은 저장 시각 순서로 정렬됨
+    for version in sorted(os.listdir(versions_dir))[:-keep]:
+        shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
+    # versioning 전에 index_dir에 바로 저장된 파일 -> CURRENT가 생긴 뒤에는 읽히지 않음
+    for path in (os.path.join(index_dir, f"{INDEX_NAME}.faiss"), os.path.join(index_dir, f"{INDEX_NAME}.pkl")):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def save_index(vectorstore, index_dir):
+    import faiss
+
+    version = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+    version_dir = get_version_dir(index_dir, version)
+    os.makedirs(version_dir)
+    faiss_path, pkl_path = get_index_paths(index_dir, version)
+
+    # CURRENT를 바꾸기 전에는 아무도 이 version을 읽지 않으므로 임시 파일이 필요 없음
+    with open(pkl_path, 'wb') as f:
+        pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), f)
+    faiss.write_index(vectorstore.index, faiss_path)
+
+    pointer_path = os.path.join(index_dir, CURRENT_NAME)
+    with open(pointer_path + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer_path + ".tmp", pointer_path)
+    remove_old_versions(index_dir)
+    return version
+
+
+def read_faiss_index(faiss_path, mmap=True):
+    import faiss
+
+    if mmap:
+        try:
+            return faiss.read_index(
+                faiss_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+        except RuntimeError:
+            pass
+    return faiss.read_index(faiss_path)
+
+
+def load_index(index_dir, embeddings, mmap=True):
+    '''
+    mmap=True 는 검색 전용 (read only)
+    index에 vector를 추가 / 삭제할 경우 mmap=False로 load
+    '''
+    from langchain.vectorstores.faiss import FAISS
+
+    # pointer는 한 번만 읽음 -> 두 파일이 항상 같은 version
+    faiss_path, pkl_path = get_index_paths(index_dir)
+    index = read_faiss_index(faiss_path, mmap=mmap)
+    with open(pkl_path, 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
@@ -0,0 +1,299 @@
+"""
+Content-addressed ingestion cache shared by DocumentGPT, PrivateGPT and QuizGPT.
+
+Uploads are keyed by the sha256 of their bytes instead of their file name, so
+two different files called `report.pdf` never collide and the same bytes
+uploaded under another name reuse the chunks and the FAISS index on disk.
+
+    ./.cache/{namespace}/{digest}/
+        source.pdf      the uploaded bytes (extension kept for unstructured)
+        chunks.pkl      split documents, one pickled batch after another
+        CURRENT         FAISS index + docstore, saved atomically
+        versions/       (see utils/index_store.py)
+        partial/        index of the chunks embedded so far, while the
+                        ingest job is still running (removed when it ends)
+
+Ingestion is a pipeline of generators (pages -> chunks -> batches), so a
+300-page PDF is never held as one document list: pages are parsed one at a
+time, chunked with the usual 600/100 tiktoken settings and embedded in
+batches of `EMBED_BATCH_SIZE` while parsing continues. Ingestion runs as a
+background job (utils/jobs.py), so `embed_upload` saves what has been
+embedded so far to `partial/` every `PARTIAL_SAVE_SECONDS`; pages load it
+to answer questions about the first chunks before the whole file is done.
+
+unstructured, pypdf and faiss are imported where they are used, so importing
+this module (every page does on first paint) stays cheap.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from itertools import islice
+
+from langchain.schema import Document
+
+from utils.index_store import index_exists, load_index, save_index
+from utils.parsing import iter_pdf_pages
+from utils.resources import get_resource
+from utils.tracing import NullTrace
+
+CACHE_DIR = "./.cache"
+COPY_BUFFER_SIZE = 1024 * 1024
+EMBED_BATCH_SIZE = 256
+PARTIAL_SAVE_SECONDS = 5
+
+
+def file_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def documents_digest(docs):
+    sha = hashlib.sha256()
+    for doc in docs:
+        sha.update(doc.page_content.encode())
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+def upload_digest(file):
+    ''' 파일 전체를 bytes로 복사하지 않고 조금씩 읽어서 hash '''
+    sha = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(COPY_BUFFER_SIZE), b""):
+        sha.update(block)
+    file.seek(0)
+    return sha.hexdigest()
+
+
+def get_ingest_dir(namespace, digest):
+    path = os.path.join(CACHE_DIR, namespace, digest)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_partial_dir(index_dir):
+    return os.path.join(index_dir, "partial")
+
+
+def make_splitter():
+    from langchain.text_splitter import CharacterTextSplitter
+
+    # tiktoken encoding을 매번 다시 load 하지 않도록 process당 하나
+    return get_resource(
+        "splitter:ingest",
+        CharacterTextSplitter.from_tiktoken_encoder,
+        separator='\n',
+        chunk_size=600,
+        chunk_overlap=100,
+    )
+
+
+def write_upload(file, namespace):
+    ''' 업로드된 파일을 hash 경로에 저장하고 (digest, file_path) 반환 '''
+    digest = upload_digest(file)
+    extension = os.path.splitext(file.name)[1].lower()
+    file_path = os.path.join(get_ingest_dir(namespace, digest), f"source{extension}")
+    if not os.path.exists(file_path):
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(file_path), delete=False
+        ) as f:
+            shutil.copyfileobj(file, f, COPY_BUFFER_SIZE)
+        os.replace(f.name, file_path)
+        file.seek(0)
+    return digest, file_path
+
+
+def iter_pages(file_path):
+    '''
+    page 단위로 Document를 yield
+    pdf는 page range별로 process pool에서 parsing (utils/parsing.py)
+    나머지는 unstructured element를 page_number로 묶음
+    '''
+    if file_path.endswith(".pdf"):
+        yield from iter_pdf_pages(file_path)
+        return
+
+    # UnstructuredFileLoader는 lazy_load가 없고 load()가 element마다 Document + metadata dict를
+    # 한 번 더 만들므로, partition 결과를 바로 page 단위로 묶음
+    from unstructured.partition.auto import partition
+
+    page_number = None
+    texts = []
+    for element in partition(filename=file_path):
+        number = element.metadata.page_number
+        if texts and number != page_number:
+            yield Document(
+                page_content="\n\n".join(texts),
+                metadata={"source": file_path, "page": page_number},
+            )
+            texts = []
+        page_number = number
+        texts.append(str(element))
+    if texts:
+        yield Document(
+            page_content="\n\n".join(texts),
+            metadata={"source": file_path, "page": page_number},
+        )
+
+
+def iter_chunks(pages, splitter):
+    '''
+    page마다 split 하되 마지막 chunk는 다음 page 앞에 붙여서 다시 split
+    -> page 경계에서도 chunk가 이어지고, 메모리에는 한 page + chunk 하나만 유지
+    '''
+    carry = None
+    for page in pages:
+        text = page.page_content
+        if carry is not None:
+            text = carry.page_content + "\n" + text
+        chunks = splitter.split_documents([
+            Document(page_content=text, metadata=page.metadata)
+        ])
+        if not chunks:
+            continue
+        yield from chunks[:-1]
+        carry = chunks[-1]
+    if carry is not None:
+        yield carry
+
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def iter_counted(iterable, callback):
+    ''' item을 하나 넘길 때마다 callback(지금까지 개수) '''
+    for count, item in enumerate(iterable, start=1):
+        callback(count)
+        yield item
+
+
+def get_chunks_path(namespace, digest):
+    return os.path.join(get_ingest_dir(namespace, digest), "chunks.pkl")
+
+
+def iter_cached_chunks(chunks_path):
+    with open(chunks_path, 'rb') as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                return
+
+
+def iter_upload_chunks(file, namespace, trace=None, on_page=None):
+    '''
+    (digest, chunk generator) 반환
+    같은 내용의 파일은 다시 parsing / split 하지 않고 chunks.pkl에서 읽음
+    on_page: page를 하나 parsing 할 때마다 on_page(지금까지 page 수)
+    '''
+    trace = trace or NullTrace()
+    digest, file_path = write_upload(file, namespace)
+    chunks_path = get_chunks_path(namespace, digest)
+    trace.cache_result("chunks", os.path.exists(chunks_path))
+    if os.path.exists(chunks_path):
+        return digest, trace.timed(iter_cached_chunks(chunks_path), "load")
+
+    def generate():
+        with open(chunks_path + ".tmp", 'wb') as f:
+            pages = trace.timed(iter_pages(file_path), "load")
+            if on_page:
+                pages = iter_counted(pages, on_page)
+            for batch in iter_batches(
+                trace.timed(iter_chunks(pages, make_splitter()), "split"),
+                EMBED_BATCH_SIZE,
+            ):
+                pickle.dump(batch, f)
+                yield from batch
+        os.replace(chunks_path + ".tmp", chunks_path)
+
+    return digest, generate()
+
+
+def split_upload(file, namespace, trace=None, on_page=None):
+    digest, chunks = iter_upload_chunks(file, namespace, trace, on_page)
+    return digest, list(chunks)
+
+
+def embed_stream(
+    file,
+    namespace,
+    embeddings,
+    batch_size=EMBED_BATCH_SIZE,
+    trace=None,
+    on_page=None,
+):
+    '''
+    batch를 embedding 할 때마다 (vectorstore, embedded chunk 수)를 yield
+    처음 yield 된 vectorstore부터 바로 검색 가능 (parsing은 계속 진행)
+    '''
+    trace = trace or NullTrace()
+    digest = upload_digest(file)
+    index_dir = get_ingest_dir(namespace, digest)
+    trace.cache_result("index", index_exists(index_dir))
+    if index_exists(index_dir):
+        with trace.stage("load"):
+            vectorstore = load_index(index_dir, embeddings)
+        yield vectorstore, len(vectorstore.index_to_docstore_id)
+        return
+
+    from langchain.vectorstores.faiss import FAISS
+
+    digest, chunks = iter_upload_chunks(file, namespace, trace, on_page)
+    vectorstore = None
+    embedded = 0
+    for batch in iter_batches(chunks, batch_size):
+        with trace.stage("embed"):
+            if vectorstore is None:
+                vectorstore = FAISS.from_documents(batch, embeddings)
+            else:
+                vectorstore.add_documents(batch)
+        embedded += len(batch)
+        yield vectorstore, embedded
+
+    if vectorstore is not None:
+        from utils.ann_index import rebuild_if_outgrown
+
+        # batch마다 flat index에 추가했으므로 크기에 맞는 index로 (upload index는 저장 후 바뀌지 않음)
+        with trace.stage("index"):
+            vectorstore = rebuild_if_outgrown(vectorstore, mutable=False)
+        with trace.stage("save"):
+            save_index(vectorstore, index_dir)
+
+
+def embed_upload(
+    file,
+    namespace,
+    embeddings,
+    on_progress=None,
+    trace=None,
+    on_page=None,
+    save_partial=False,
+):
+    '''
+    파일 내용 hash 기준으로 FAISS index를 디스크에 저장
+    이미 index가 있으면 loader, splitter, embedding 모두 건너뛰고 바로 load
+    save_partial: 지금까지 embedding 한 chunk를 PARTIAL_SAVE_SECONDS마다 partial/에 저장
+    -> 다른 session / worker가 job이 끝나기 전에도 앞부분을 검색할 수 있음
+    '''
+    partial_dir = get_partial_dir(get_ingest_dir(namespace, upload_digest(file)))
+    saved = time.monotonic()
+    vectorstore = None
+    try:
+        for vectorstore, embedded in embed_stream(
+            file, namespace, embeddings, trace=trace, on_page=on_page
+        ):
+            if on_progress:
+                on_progress(embedded)
+            if save_partial and time.monotonic() - saved >= PARTIAL_SAVE_SECONDS:
+                with (trace or NullTrace()).stage("save"):
+                    save_index(vectorstore, partial_dir)
+                saved = time.monotonic()
+    finally:
+        # 전체 index는 embed_stream이 마지막에 저장, 실패하면 retry가 처음부터 다시 만듦
+        shutil.rmtree(partial_dir, ignore_errors=True)
+    return vectorstore
@@ -0,0 +1,267 @@
+"""
+Background ingestion jobs shared by every session of every page.
+
+Embedding a large upload or crawling a site used to run inside the Streamlit
+script under a spinner, freezing that session and losing the work when the
+session reran or disconnected. Pages now `submit` the work and poll:
+
+- jobs are keyed by content (`files/{digest}`, `sites/{digest}`, ...), so two
+  sessions uploading the same bytes share one job, and a job that is already
+  queued or running is never started twice
+- jobs run on one process-wide thread pool (`INGEST_WORKERS` threads); the
+  heavy parts already release the GIL (faiss, embedding requests) or run in
+  their own process pool (HTML parsing in utils/fetcher.py)
+- state (status, pages parsed, chunks embedded, error) is persisted in SQLite
+  (`./.cache/jobs.db`), so it survives reruns and is visible to every worker
+  process; a running job whose heartbeat is older than `STALE_SECONDS`
+  belonged to a process that died and may be claimed again
+- results are never returned through the job: the job writes its index /
+  chunks to the usual cache directory and the page loads it from there on a
+  later rerun
+
+    state = submit(key, kind, fn, *args)   # fn(*args, progress=JobProgress)
+    state = get_job(key)                   # {"status", "pages", "chunks", "total", "error", ...}
+
+Pages show a job with `render_job` (progress caption, or the error and a
+Retry button) and end with `poll_if_active`, which reruns the page every
+`POLL_SECONDS` while one of its jobs is active. streamlit is only imported
+by those two helpers, so jobs still run from threads and benchmarks.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_PATH = "./.cache/jobs.db"
+MAX_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+STALE_SECONDS = 120
+PROGRESS_INTERVAL = 0.5
+POLL_SECONDS = 1.0
+ACTIVE = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pages INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+COLUMNS = ("key", "kind", "status", "pages", "chunks", "total", "error", "created", "updated")
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    def __init__(self, path=JOBS_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE key = ?", (key,)
+            ).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def update(self, key, **fields):
+        fields["updated"] = time.time()
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET {} WHERE key = ?".format(", ".join(f"{name} = ?" for name in fields)),
+                [*fields.values(), key],
+            )
+
+    def claim(self, key, kind, retry=False):
+        '''
+        다른 process가 실행 중이 아니면 queued로 바꾸고 True
+        failed는 retry=True일 때만 다시 실행
+        '''
+        now = time.time()
+        with self.lock:
+            # BEGIN IMMEDIATE -> 여러 process가 동시에 claim 해도 하나만 성공
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    "SELECT status, updated FROM jobs WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    status, updated = row
+                    if status in ACTIVE and now - updated < STALE_SECONDS:
+                        self.connection.execute("ROLLBACK")
+                        return False
+                    if status == "failed" and not retry:
+                        self.connection.execute("ROLLBACK")
+                        return False
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO jobs (key, kind, status, created, updated) "
+                    "VALUES (?, ?, 'queued', ?, ?)",
+                    (key, kind, now, now),
+                )
+                self.connection.execute("COMMIT")
+                return True
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+
+class JobProgress:
+    ''' job 함수에 전달, 너무 자주 쓰지 않도록 PROGRESS_INTERVAL마다 저장 (heartbeat 겸용) '''
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self.counts = {}
+        self.saved = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, **counts):
+        with self.lock:
+            self.counts.update(counts)
+            if time.monotonic() - self.saved < PROGRESS_INTERVAL:
+                return
+            self.saved = time.monotonic()
+            counts = dict(self.counts)
+        self.store.update(self.key, **counts)
+
+    def flush(self):
+        with self.lock:
+            counts = dict(self.counts)
+        if counts:
+            self.store.update(self.key, **counts)
+
+
+class JobManager:
+    def __init__(self, path=JOBS_PATH, max_workers=MAX_WORKERS):
+        self.store = JobStore(path)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.futures = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.heartbeat, daemon=True, name="ingest-heartbeat").start()
+
+    def heartbeat(self):
+        ''' progress가 한동안 없어도 (큰 batch 하나 등) 실행 중인 job이 stale로 보이지 않도록 '''
+        while True:
+            time.sleep(STALE_SECONDS / 4)
+            with self.lock:
+                keys = list(self.futures)
+            for key in keys:
+                self.store.update(key)
+
+    def submit(self, key, kind, fn, *args, retry=False, **kwargs):
+        '''
+        같은 key의 job이 이미 queued / running이면 새로 시작하지 않고 그 상태를 반환
+        done인 job은 다시 실행 -> 결과(index 등)가 없을 때만 submit 할 것
+        '''
+        with self.lock:
+            future = self.futures.get(key)
+            if future is None or future.done():
+                if self.store.claim(key, kind, retry=retry):
+                    self.futures[key] = self.executor.submit(self.run, key, fn, args, kwargs)
+        return self.store.get(key)
+
+    def run(self, key, fn, args, kwargs):
+        progress = JobProgress(self.store, key)
+        self.store.update(key, status="running")
+        try:
+            fn(*args, progress=progress, **kwargs)
+        except Exception as error:
+            logger.exception("job %s failed", key)
+            progress.flush()
+            self.store.update(key, status="failed", error=f"{type(error).__name__}: {error}")
+        else:
+            progress.flush()
+            self.store.update(key, status="done", error=None)
+        finally:
+            with self.lock:
+                self.futures.pop(key, None)
+
+    def get(self, key):
+        return self.store.get(key)
+
+
+manager_lock = threading.Lock()
+manager = None
+
+
+def get_job_manager():
+    ''' process 안의 모든 session이 같은 thread pool / job 상태를 사용 '''
+    global manager
+    with manager_lock:
+        if manager is None:
+            manager = JobManager()
+        return manager
+
+
+def submit(key, kind, fn, *args, retry=False, **kwargs):
+    return get_job_manager().submit(key, kind, fn, *args, retry=retry, **kwargs)
+
+
+def get_job(key):
+    return get_job_manager().get(key)
+
+
+def is_active(state):
+    ''' heartbeat가 STALE_SECONDS보다 오래된 job은 process가 죽은 것 (JobStore.claim과 같은 기준) '''
+    return (
+        bool(state)
+        and state["status"] in ACTIVE
+        and time.time() - state["updated"] < STALE_SECONDS
+    )
+
+
+def describe(state):
+    ''' "12 pages parsed · 240/512 chunks embedded" '''
+    page_verb = "fetched" if state["kind"] == "crawl" else "parsed"
+    chunk_verb = "split" if state["kind"] == "split" else "embedded"
+    parts = []
+    if state["pages"]:
+        parts.append(f"{state['pages']} pages {page_verb}")
+    if state["total"]:
+        parts.append(f"{state['chunks']}/{state['total']} chunks {chunk_verb}")
+    elif state["chunks"]:
+        parts.append(f"{state['chunks']} chunks {chunk_verb}")
+    return " · ".join(parts) or state["status"].capitalize() + "..."
+
+
+def render_job(state, label, on_retry, action="Embedding", key=None):
+    '''
+    현재 container(보통 sidebar)에 job 상태 표시, 진행 중이면 True
+    failed -> error + Retry 버튼 (누르면 on_retry() 후 rerun)
+    key: 한 page에 Retry 버튼이 여러 개일 때 (DocumentGPT의 파일별 버튼)
+    '''
+    import streamlit as st
+
+    if not state:
+        return False
+    if state["status"] == "failed":
+        st.error(f"{label}: {state['error']}")
+        if st.button("Retry", key=key):
+            on_retry()
+            st.rerun()
+        return False
+    if is_active(state):
+        st.caption(f"{action} {label}: {describe(state)}")
+        return True
+    return False
+
+
+def poll_if_active(states):
+    ''' page 마지막에 호출: 진행 중인 job이 있으면 잠시 후 다시 실행해서 progress / 완성된 결과 반영 '''
+    import streamlit as st
+
+    if any(is_active(state) for state in states):
+        time.sleep(POLL_SECONDS)
+        st.rerun()
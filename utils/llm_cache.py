@@ -0,0 +1,128 @@
+"""
+Persistent LLM response cache.
+
+A SQLite database under `./.cache` shared by every Streamlit worker and
+surviving restarts. Entries are keyed by langchain on the full prompt text
+plus the model's parameter string (model name, temperature, ... -- the same
+fields as model.json), so a prompt built from different source documents is
+a different key and stale answers are never returned.
+
+langchain only supports one process-global cache, so every page would read
+and write it once one page enables it. Clients opt in instead: the ones
+built by `get_chat_openai` default to `cache=False`, and only QuizGPT's quiz
+model passes `cache=True`. Ollama chat models are created with `cache=False`
+as well.
+
+langchain writes a response to the cache before the chain parses it, so a
+malformed completion would be replayed on every retry. `ValidatedCache`
+only stores (and only returns) responses that pass `validate` -- QuizGPT
+passes the quiz parsers. Entries expire after `ttl` seconds and the least
+recently used ones are deleted past `max_size`.
+"""
+import os
+import time
+
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain.load.dump import dumps
+from langchain.load.load import loads
+from langchain.schema.cache import BaseCache
+from sqlalchemy import Column, Float, String, create_engine, delete, event, select, update
+from sqlalchemy.orm import Session, declarative_base
+
+LLM_CACHE_PATH = "./.cache/llm_cache.db"
+LLM_CACHE_TTL = 7 * 24 * 60 * 60
+LLM_CACHE_MAX_SIZE = 2000
+
+Base = declarative_base()
+
+
+class LLMCacheEntry(Base):
+    __tablename__ = "validated_llm_cache"
+    prompt = Column(String, primary_key=True)
+    llm = Column(String, primary_key=True)
+    # generation 목록 전체를 한 row에
+    response = Column(String)
+    created = Column(Float, index=True)
+    used = Column(Float, index=True)
+
+
+class ValidatedCache(BaseCache):
+    def __init__(self, engine, validate=None, ttl=LLM_CACHE_TTL, max_size=LLM_CACHE_MAX_SIZE):
+        self.engine = engine
+        self.validate = validate
+        self.ttl = ttl
+        self.max_size = max_size
+        Base.metadata.create_all(self.engine)
+
+    def is_valid(self, generations):
+        return self.validate is None or self.validate(generations)
+
+    def key(self, prompt, llm_string):
+        return (LLMCacheEntry.prompt == prompt) & (LLMCacheEntry.llm == llm_string)
+
+    def lookup(self, prompt, llm_string):
+        now = time.time()
+        with Session(self.engine) as session, session.begin():
+            row = session.execute(
+                select(LLMCacheEntry.response, LLMCacheEntry.created)
+                .where(self.key(prompt, llm_string))
+            ).first()
+            if row is None:
+                return None
+            try:
+                generations = loads(row.response)
+            except Exception:
+                generations = None
+            # 만료 / 읽을 수 없는 값 / 지금 parser가 거부하는 값은 지우고 다시 호출
+            if now - row.created > self.ttl or not generations or not self.is_valid(generations):
+                session.execute(delete(LLMCacheEntry).where(self.key(prompt, llm_string)))
+                return None
+            session.execute(
+                update(LLMCacheEntry).where(self.key(prompt, llm_string)).values(used=now)
+            )
+            return generations
+
+    def update(self, prompt, llm_string, return_val):
+        # parser가 실패할 응답은 저장하지 않음 -> retry 하면 LLM을 다시 호출
+        if not self.is_valid(return_val):
+            return
+        now = time.time()
+        with Session(self.engine) as session, session.begin():
+            session.merge(LLMCacheEntry(
+                prompt=prompt, llm=llm_string, response=dumps(return_val),
+                created=now, used=now,
+            ))
+            session.execute(delete(LLMCacheEntry).where(LLMCacheEntry.created < now - self.ttl))
+            # 가장 오래 사용하지 않은 entry부터 삭제
+            cutoff = session.execute(
+                select(LLMCacheEntry.used)
+                .order_by(LLMCacheEntry.used.desc())
+                .offset(self.max_size).limit(1)
+            ).scalar()
+            if cutoff is not None:
+                session.execute(delete(LLMCacheEntry).where(LLMCacheEntry.used <= cutoff))
+
+    def clear(self, **kwargs):
+        with Session(self.engine) as session, session.begin():
+            session.execute(delete(LLMCacheEntry))
+
+
+def create_cache_engine(database_path=LLM_CACHE_PATH):
+    os.makedirs(os.path.dirname(database_path) or ".", exist_ok=True)
+    engine = create_engine(
+        f"sqlite:///{database_path}",
+        connect_args={"timeout": 30},
+    )
+
+    @event.listens_for(engine, "connect")
+    def use_wal(connection, _):
+        # 여러 worker가 동시에 읽고 쓸 수 있도록
+        connection.execute("PRAGMA journal_mode=WAL")
+
+    return engine
+
+
+def enable_llm_cache(database_path=LLM_CACHE_PATH, validate=None):
+    if isinstance(get_llm_cache(), ValidatedCache):
+        return
+    set_llm_cache(ValidatedCache(create_cache_engine(database_path), validate=validate))
@@ -0,0 +1,203 @@
+"""
+Local Ollama model lifecycle for PrivateGPT.
+
+- chat and embedding models are preloaded once per process and kept warm:
+  every preload request carries `keep_alive`, and a daemon thread repeats it
+  before the keep-alive window runs out. langchain's ChatOllama /
+  OllamaEmbeddings do not send `keep_alive`, so every chat call resets the
+  window to Ollama's default (`OLLAMA_DEFAULT_KEEP_ALIVE`, 5 minutes); the
+  ping interval is therefore half of the shorter of the two windows
+- embeddings use a dedicated small model (`OLLAMA_EMBEDDING_MODEL`) instead of
+  the 7B chat model
+- context size / thread count are passed to both models
+- `InferenceMetricsHandler` records time-to-first-token, total time and
+  tokens/sec per request; preload records model load time (keep-alive pings
+  to a model that is still loaded only replace it when Ollama actually had to
+  load the model again)
+
+Everything goes through plain HTTP on `base_url`, so a stub server that
+answers /api/generate and /api/embeddings is enough to test it.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import requests
+from langchain.callbacks.base import BaseCallbackHandler
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_CHAT_MODEL = os.getenv("OLLAMA_CHAT_MODEL", "mistral:latest")
+OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 4096))
+OLLAMA_NUM_THREAD = int(os.getenv("OLLAMA_NUM_THREAD", 0)) or None
+# Ollama 서버 기본값 -> keep_alive 없이 온 요청은 window를 이 값으로 되돌림
+OLLAMA_DEFAULT_KEEP_ALIVE = 5 * 60
+# keep-alive ping에도 load_duration이 오지만 이미 load 된 model이면 몇 ms
+COLD_LOAD_SECONDS = 0.5
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value):
+    '''
+    Ollama keep_alive 값 -> 초 ("30m", "1h30m", "300", 300)
+    음수는 계속 유지 -> None
+    '''
+    value = str(value).strip()
+    if value.startswith("-"):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        raise ValueError(f"invalid keep_alive duration: {value!r}")
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def keep_alive_interval(keep_alive=OLLAMA_KEEP_ALIVE):
+    ''' chat 요청이 window를 기본값으로 되돌릴 수 있으므로 더 짧은 window의 절반마다 ping '''
+    window = parse_duration(keep_alive)
+    if window is None:
+        window = OLLAMA_DEFAULT_KEEP_ALIVE
+    return max(1.0, min(window, OLLAMA_DEFAULT_KEEP_ALIVE) / 2)
+
+
+class InferenceMetricsHandler(BaseCallbackHandler):
+    ''' 요청마다 TTFT, 전체 시간, tokens/sec 기록 '''
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def on_llm_start(self, *args, **kwargs):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.tokens = 0
+
+    def on_chat_model_start(self, *args, **kwargs):
+        self.on_llm_start()
+
+    def on_llm_new_token(self, token, *args, **kwargs):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.tokens += 1
+
+    def on_llm_end(self, response, *args, **kwargs):
+        ended = time.perf_counter()
+        record = {
+            "time": time.time(),
+            "total_s": ended - self.started,
+            "ttft_s": (self.first_token or ended) - self.started,
+            "tokens": self.tokens,
+        }
+        generation_time = ended - (self.first_token or self.started)
+        record["tokens_per_s"] = self.tokens / generation_time if generation_time > 0 else None
+
+        # Ollama가 마지막 chunk에 넣어주는 값이 있으면 그것을 사용 (duration 단위: ns)
+        info = {}
+        if response.generations and response.generations[0]:
+            info = response.generations[0][0].generation_info or {}
+        if info.get("eval_count") and info.get("eval_duration"):
+            record["tokens"] = info["eval_count"]
+            record["tokens_per_s"] = info["eval_count"] / (info["eval_duration"] / 1e9)
+        if info.get("load_duration"):
+            record["load_s"] = info["load_duration"] / 1e9
+        self.metrics.append(record)
+
+
+class OllamaManager:
+    def __init__(
+        self,
+        base_url=OLLAMA_BASE_URL,
+        chat_model=OLLAMA_CHAT_MODEL,
+        embedding_model=OLLAMA_EMBEDDING_MODEL,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        num_ctx=OLLAMA_NUM_CTX,
+        num_thread=OLLAMA_NUM_THREAD,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.chat_model_name = chat_model
+        self.embedding_model_name = embedding_model
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.num_thread = num_thread
+        self.session = requests.Session()
+        self.load_times = {}
+        self.errors = {}
+        self.metrics = deque(maxlen=200)
+        self.keep_alive_thread = None
+
+    @property
+    def options(self):
+        options = {"num_ctx": self.num_ctx}
+        if self.num_thread:
+            options["num_thread"] = self.num_thread
+        return options
+
+    def load_model(self, model, endpoint, payload):
+        started = time.perf_counter()
+        try:
+            response = self.session.post(
+                f"{self.base_url}{endpoint}",
+                json={"model": model, "keep_alive": self.keep_alive, "options": self.options, **payload},
+                timeout=300,
+            )
+            response.raise_for_status()
+        except requests.RequestException as error:
+            self.errors[model] = str(error)
+            return None
+        self.errors.pop(model, None)
+        load_duration = response.json().get("load_duration")
+        seconds = load_duration / 1e9 if load_duration else time.perf_counter() - started
+        # 처음 load 한 시간은 유지, 이후에는 model이 unload 되어 다시 load 된 경우만 기록
+        if model not in self.load_times or seconds >= COLD_LOAD_SECONDS:
+            self.load_times[model] = seconds
+        return seconds
+
+    def preload(self):
+        ''' prompt 없이 요청하면 Ollama는 model만 memory에 올림 '''
+        self.load_model(self.chat_model_name, "/api/generate", {"stream": False})
+        self.load_model(self.embedding_model_name, "/api/embeddings", {"prompt": ""})
+
+    def start_keep_alive(self, interval=None):
+        if self.keep_alive_thread is not None:
+            return
+        interval = interval or keep_alive_interval(self.keep_alive)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.preload()
+
+        self.keep_alive_thread = threading.Thread(target=run, name="ollama-keep-alive", daemon=True)
+        self.keep_alive_thread.start()
+
+    def chat_model(self, **kwargs):
+        from langchain.chat_models import ChatOllama
+
+        # LLM cache는 QuizGPT의 model만 사용 (utils/llm_cache.py)
+        kwargs.setdefault("cache", False)
+        return ChatOllama(
+            base_url=self.base_url,
+            model=self.chat_model_name,
+            num_ctx=self.num_ctx,
+            num_thread=self.num_thread,
+            **kwargs,
+        )
+
+    def embeddings(self):
+        from langchain.embeddings import OllamaEmbeddings
+
+        return OllamaEmbeddings(
+            base_url=self.base_url,
+            model=self.embedding_model_name,
+            num_ctx=self.num_ctx,
+            num_thread=self.num_thread,
+        )
+
+    def metrics_handler(self):
+        return InferenceMetricsHandler(self.metrics)
@@ -0,0 +1,223 @@
+"""
+Parallel PDF parsing for the ingestion pipeline (utils/ingest.py).
+
+PDFs used to be read page by page in the ingesting thread, and pages without
+a text layer (scans) were silently dropped. A PDF is now split into ranges of
+`PAGES_PER_RANGE` pages that are parsed in a process pool (`PARSE_WORKERS`,
+one per core by default), so parse time scales with the available cores.
+Every page goes through the cheapest step that works:
+
+1. cache: pages are keyed by a hash of their content stream and every stream
+   it references (fonts, images), so the same page in a re-uploaded or
+   edited PDF is never parsed twice
+
+       ./.cache/pages/{hash[:2]}/{hash}.pkl    {"text", "method"}
+
+2. text layer: pypdf `extract_text`, fast and enough for born-digital PDFs
+3. OCR: only pages whose text layer is empty are rendered (pdf2image /
+   poppler) and read with tesseract; `PDF_OCR=0` skips them instead, and
+   skipped pages are not cached so they are OCRed once OCR is turned on
+
+Pages are yielded in order while later ranges are still being parsed, with at
+most two ranges per worker in flight, so a long PDF is never held in memory
+at once. A PDF that fits in one range is parsed inline, without a pool.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import pickle
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from langchain.schema import Document
+
+PAGES_DIR = "./.cache/pages"
+PAGES_PER_RANGE = 8
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", 0)) or os.cpu_count() or 1
+OCR_ENABLED = os.getenv("PDF_OCR", "1") != "0"
+OCR_DPI = 300
+# 추출 방식이 바뀌면 올려서 page cache 무효화
+PARSER_VERSION = "1"
+MAX_HASH_DEPTH = 8
+
+logger = logging.getLogger(__name__)
+
+
+def get_page_path(page_hash):
+    return os.path.join(PAGES_DIR, page_hash[:2], f"{page_hash}.pkl")
+
+
+def load_parsed(page_hash):
+    path = get_page_path(page_hash)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_parsed(page_hash, parsed):
+    path = get_page_path(page_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 여러 worker process가 같은 page를 동시에 쓸 수 있으므로 pid별 임시 파일
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(parsed, f)
+    os.replace(tmp_path, path)
+
+
+def hash_object(sha, obj, digests, depth=0):
+    '''
+    PDF object를 재귀적으로 hash (stream은 내용까지)
+    indirect object는 reader 안에서 한 번만 계산 -> page마다 같은 font를 다시 풀지 않음
+    '''
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if depth > MAX_HASH_DEPTH:
+        return
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in digests:
+            # 순환 참조 방지용으로 먼저 비워 둠
+            digests[key] = b""
+            inner = hashlib.sha256()
+            hash_object(inner, obj.get_object(), digests, depth + 1)
+            digests[key] = inner.digest()
+        sha.update(digests[key])
+    elif isinstance(obj, StreamObject):
+        try:
+            sha.update(obj.get_data())
+        except NotImplementedError:
+            # pypdf가 풀지 못하는 filter (JBIG2 등) -> encoding 된 bytes 그대로
+            sha.update(obj._data)
+        for key in sorted(obj):
+            if key not in ("/Length", "/Filter", "/DecodeParms"):
+                sha.update(key.encode())
+                hash_object(sha, obj.raw_get(key), digests, depth + 1)
+    elif isinstance(obj, DictionaryObject):
+        for key in sorted(obj):
+            if key != "/Parent":
+                sha.update(key.encode())
+                hash_object(sha, obj.raw_get(key), digests, depth + 1)
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            hash_object(sha, item, digests, depth + 1)
+    else:
+        sha.update(repr(obj).encode())
+
+
+def page_hash(page, digests):
+    ''' 내용 stream + resources(font, image) 기준 -> 내용 stream이 같은 scan page끼리도 구분 '''
+    sha = hashlib.sha256(PARSER_VERSION.encode())
+    for key in ("/Contents", "/Resources"):
+        if key in page:
+            sha.update(key.encode())
+            hash_object(sha, page.raw_get(key), digests)
+    return sha.hexdigest()
+
+
+def ocr_page(file_path, number):
+    ''' 실패하면 None (cache 하지 않음 -> tesseract를 설치한 뒤에는 다시 시도) '''
+    try:
+        import pytesseract
+        from pdf2image import convert_from_path
+    except ImportError:
+        logger.warning("pdf2image / pytesseract are not installed, skipping OCR")
+        return None
+    try:
+        images = convert_from_path(
+            file_path, dpi=OCR_DPI, first_page=number, last_page=number
+        )
+        return "\n".join(pytesseract.image_to_string(image) for image in images)
+    # poppler / tesseract binary가 없거나 page를 render 할 수 없는 경우
+    except Exception as error:
+        logger.warning("OCR failed on page %d of %s: %s", number, file_path, error)
+        return None
+
+
+def parse_range(file_path, start, stop, ocr=OCR_ENABLED):
+    '''
+    process pool에서 실행, page start ~ stop-1 (1부터 시작)
+    [(page number, text, method)] 반환, method: cache / text / ocr / skipped / failed
+    '''
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    digests = {}
+    results = []
+    for number in range(start, stop):
+        page = reader.pages[number - 1]
+        key = page_hash(page, digests)
+        parsed = load_parsed(key)
+        if parsed is not None:
+            results.append((number, parsed["text"], "cache"))
+            continue
+
+        text = page.extract_text() or ""
+        method = "text"
+        # text layer가 없는 page만 OCR
+        if not text.strip():
+            # OCR을 끈 상태의 빈 page는 cache 하지 않음 -> PDF_OCR=1로 다시 올리면 OCR
+            if not ocr:
+                results.append((number, "", "skipped"))
+                continue
+            text = ocr_page(file_path, number)
+            method = "ocr"
+            if text is None:
+                results.append((number, "", "failed"))
+                continue
+        save_parsed(key, {"text": text, "method": method})
+        results.append((number, text, method))
+    return results
+
+
+def iter_ranges(page_count, pages_per_range=PAGES_PER_RANGE):
+    for start in range(1, page_count + 1, pages_per_range):
+        yield start, min(page_count + 1, start + pages_per_range)
+
+
+def iter_parsed_ranges(file_path, ranges, workers, ocr):
+    if len(ranges) <= 1 or workers <= 1:
+        for start, stop in ranges:
+            yield parse_range(file_path, start, stop, ocr)
+        return
+
+    remaining = iter(ranges)
+    # fork는 Streamlit의 thread / lock 상태까지 복사 -> spawn으로 새 interpreter에서 실행
+    # (worker에서 실행되는 parse_range는 module 최상위 함수)
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(ranges)),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as pool:
+        pending = deque(
+            pool.submit(parse_range, file_path, start, stop, ocr)
+            for start, stop in islice(remaining, workers * 2)
+        )
+        try:
+            while pending:
+                results = pending.popleft().result()
+                for start, stop in islice(remaining, 1):
+                    pending.append(pool.submit(parse_range, file_path, start, stop, ocr))
+                yield results
+        finally:
+            # 소비하는 쪽이 중간에 멈추면 아직 시작하지 않은 range는 취소
+            for future in pending:
+                future.cancel()
+
+
+def iter_pdf_pages(file_path, workers=PARSE_WORKERS, pages_per_range=PAGES_PER_RANGE, ocr=OCR_ENABLED):
+    ''' page 순서대로 Document를 yield (text가 없는 page는 건너뜀) '''
+    from pypdf import PdfReader
+
+    ranges = list(iter_ranges(len(PdfReader(file_path).pages), pages_per_range))
+    methods = Counter()
+    for results in iter_parsed_ranges(file_path, ranges, workers, ocr):
+        for number, text, method in results:
+            methods[method] += 1
+            if text.strip():
+                yield Document(
+                    page_content=text,
+                    metadata={"source": file_path, "page": number},
+                )
+    logger.info("parsed %s: %s", file_path, dict(methods))
@@ -0,0 +1,291 @@
+"""
+Quiz generation chains for QuizGPT.
+
+The quiz used to take two LLM calls: one writing questions in the
+`Question: / Answers: a|b(o)|c` text format and a second one only to turn
+that text into JSON. `build_quiz_chain` does it in one call with OpenAI
+function calling, and falls back to the text format parsed locally by
+`parse_quiz_text` (still a single call) if the structured call fails.
+
+Large inputs go through `run_map_reduce_quiz`: chunks are sampled down to a
+fixed token budget, packed into groups, each group gets its own quiz in
+parallel, near-duplicate questions are dropped by embedding similarity and
+the survivors are reduced to `QUIZ_SIZE`.
+
+The context is assembled by utils/context.py: the overlap between
+neighbouring chunks is merged away and the text is cut to the model's
+context window.
+"""
+import re
+
+import numpy as np
+
+from langchain.output_parsers.openai_functions import JsonOutputFunctionsParser
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema import OutputParserException
+from langchain.schema.output_parser import StrOutputParser
+from langchain.schema.runnable import RunnableLambda
+
+from utils.context import get_encoding, make_formatter
+from utils.resources import get_resource
+
+QUESTION_PATTERN = re.compile(r"^\s*(?:\d+[.)]\s*)?Question\s*:\s*(.+)$", re.IGNORECASE)
+ANSWERS_PATTERN = re.compile(r"^\s*Answers\s*:\s*(.+)$", re.IGNORECASE)
+CORRECT_MARK = "(o)"
+
+QUIZ_SIZE = 10
+GROUP_TOKENS = 3000
+MAX_GROUPS = 6
+MAP_CONCURRENCY = 4
+DUPLICATE_THRESHOLD = 0.9
+# 이보다 긴 문서는 chunk group별로 나눠서 quiz 생성 (map-reduce)
+MAP_REDUCE_TOKENS = 6000
+
+QUIZ_FUNCTION = {
+    "name": "create_quiz",
+    "description": "function that takes a list of questions and answers and returns a quiz",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "questions": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "question": {"type": "string"},
+                        "answers": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "answer": {"type": "string"},
+                                    "correct": {"type": "boolean"},
+                                },
+                                "required": ["answer", "correct"],
+                            },
+                        },
+                    },
+                    "required": ["question", "answers"],
+                },
+            },
+        },
+        "required": ["questions"],
+    },
+}
+
+
+def parse_quiz_text(text):
+    '''
+    "Question: ... / Answers: a|b(o)|c" 형식을 LLM 없이 바로 JSON 구조로 변환
+    '''
+    questions = []
+    question = None
+    for line in text.splitlines():
+        if match := QUESTION_PATTERN.match(line):
+            question = match.group(1).strip()
+        elif (match := ANSWERS_PATTERN.match(line)) and question:
+            answers = []
+            for answer in match.group(1).split("|"):
+                answer = answer.strip()
+                if not answer:
+                    continue
+                correct = answer.endswith(CORRECT_MARK)
+                if correct:
+                    answer = answer[:-len(CORRECT_MARK)].strip()
+                answers.append({"answer": answer, "correct": correct})
+            if answers:
+                questions.append({"question": question, "answers": answers})
+            question = None
+    if not questions:
+        raise OutputParserException(f"No questions found in: {text[:200]}")
+    return {"questions": questions}
+
+
+def is_valid_response(generations):
+    '''
+    LLM cache(utils/llm_cache.py)에 저장해도 되는 응답인지
+    quiz chain과 같은 parser로 확인 -> parser가 실패한 응답은 cache에 남지 않음
+    '''
+    try:
+        message = getattr(generations[0], "message", None)
+        if message is not None and "function_call" in message.additional_kwargs:
+            result = JsonOutputFunctionsParser().parse_result(generations)
+        else:
+            result = parse_quiz_text(generations[0].text)
+    except (OutputParserException, IndexError):
+        return False
+    return isinstance(result, dict) and bool(result.get("questions"))
+
+
+questions_prompt = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        """
+        You are a helpful assistant that is role playing as a teacher.
+
+        Based ONLY on the following context make 10 questions to test the user's
+        knowledge about the text.
+
+        Each question should have 4 answers, three of them must be incorrect and
+        one should me correct.
+
+        Use (o) signal to correct answer.
+
+        Question examples:
+
+        Question: What is the color of the ocean?
+        Answers: Red|Yellow|Green|Blue(o)
+
+        Question: What is the capital of Georgia?
+        Answers: Baku|Tbilisi(o)|Manila|Beirut
+
+        Question: When was Avartar released?
+        Answers: 2007|2001|2009(o)|1998
+
+        Question: Who was Julius Caesar?
+        Answers: A Roman Emperor(o)|Painter|Actor|Model
+
+        Your turn!
+
+        Context: {context}
+        """
+    ),
+])
+
+structured_prompt = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        """
+        You are a helpful assistant that is role playing as a teacher.
+
+        Based ONLY on the following context make 10 questions to test the user's
+        knowledge about the text.
+
+        Each question should have 4 answers, three of them must be incorrect and
+        one should be correct.
+
+        Context: {context}
+        """
+    ),
+])
+
+
+def build_text_quiz_chain(llm):
+    ''' LLM 1번 + local parser '''
+    # quiz는 문서 전체가 context -> CONTEXT_TOKENS 대신 model context 크기까지
+    return {
+        "context": make_formatter(llm, questions_prompt, cap=None)
+    } | questions_prompt | llm | StrOutputParser() | RunnableLambda(parse_quiz_text)
+
+
+def build_structured_quiz_chain(llm):
+    ''' function calling으로 LLM 1번에 JSON 구조까지 '''
+    return {
+        "context": make_formatter(llm, structured_prompt, cap=None)
+    } | structured_prompt | llm.bind(
+        function_call={"name": QUIZ_FUNCTION["name"]},
+        functions=[QUIZ_FUNCTION],
+    ) | JsonOutputFunctionsParser()
+
+
+def build_quiz_chain(llm):
+    return build_structured_quiz_chain(llm).with_fallbacks([
+        build_text_quiz_chain(llm)
+    ])
+
+
+def get_quiz_chain(llm):
+    ''' llm마다 한 번만 compile (llm은 process 전체에서 공유되는 client) '''
+    return get_resource(("quiz_chain", id(llm)), build_quiz_chain, llm)
+
+
+def count_tokens(text):
+    # encoding은 처음 token을 셀 때 load (utils/context.py의 cache 공유)
+    return len(get_encoding().encode(text))
+
+
+def group_docs(docs, group_tokens=GROUP_TOKENS, max_groups=MAX_GROUPS):
+    '''
+    전체 token이 group_tokens * max_groups를 넘으면 문서 전체에서 고르게 chunk를 sampling
+    -> 문서 크기와 상관없이 LLM에 들어가는 token은 일정
+    '''
+    sizes = [count_tokens(doc.page_content) for doc in docs]
+    budget = group_tokens * max_groups
+    if sum(sizes) > budget:
+        average = sum(sizes) / len(sizes)
+        keep = max(1, int(budget / average))
+        step = len(docs) / keep
+        picked = sorted({int(i * step) for i in range(keep)})
+        docs = [docs[i] for i in picked]
+        sizes = [sizes[i] for i in picked]
+
+    groups = []
+    group = []
+    used = 0
+    for doc, size in zip(docs, sizes):
+        if group and used + size > group_tokens:
+            groups.append(group)
+            group = []
+            used = 0
+        group.append(doc)
+        used += size
+    if group:
+        groups.append(group)
+    return groups[:max_groups]
+
+
+def interleave(question_lists):
+    ''' group마다 한 문제씩 번갈아 -> 문서 앞부분 문제만 남지 않도록 '''
+    merged = []
+    for i in range(max((len(questions) for questions in question_lists), default=0)):
+        merged.extend(questions[i] for questions in question_lists if i < len(questions))
+    return merged
+
+
+def dedupe_questions(questions, embeddings, threshold=DUPLICATE_THRESHOLD):
+    if not questions:
+        return []
+    vectors = np.asarray(
+        embeddings.embed_documents([question["question"] for question in questions]),
+        dtype=np.float32,
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    kept = []
+    for i in range(len(questions)):
+        if all(vectors[i] @ vectors[j] < threshold for j in kept):
+            kept.append(i)
+    return [questions[i] for i in kept]
+
+
+def run_map_reduce_quiz(
+    docs,
+    llm,
+    embeddings,
+    quiz_size=QUIZ_SIZE,
+    max_concurrency=MAP_CONCURRENCY,
+    config=None,
+):
+    '''
+    map: group마다 quiz 생성 (동시에 실행)
+    reduce: 비슷한 문제 제거 후 quiz_size개
+    '''
+    groups = group_docs(docs)
+    results = get_quiz_chain(llm).batch(
+        groups,
+        config={**(config or {}), "max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    candidates = interleave([
+        result.get("questions", []) for result in results
+        if isinstance(result, dict)
+    ])
+    if not candidates:
+        raise OutputParserException("No group produced any questions")
+    return {"questions": dedupe_questions(candidates, embeddings)[:quiz_size]}
+
+
+def make_quiz(docs, llm, embeddings, config=None, map_reduce_tokens=MAP_REDUCE_TOKENS):
+    ''' 짧은 문서는 LLM 1번, 긴 문서는 map-reduce '''
+    if sum(count_tokens(doc.page_content) for doc in docs) > map_reduce_tokens:
+        return run_map_reduce_quiz(docs, llm, embeddings, config=config)
+    return get_quiz_chain(llm).invoke(docs, config=config)
@@ -0,0 +1,85 @@
+"""
+Process-wide registry of clients and other objects that are expensive to
+build and safe to share between sessions.
+
+Streamlit re-executes a page's top level on every rerun, which used to
+rebuild the LLM clients, prompts, tiktoken-backed splitters and chains each
+time. Everything that holds no per-session state is now built once per
+process through `get_resource(key, factory, *args)`:
+
+- LLM / embedding clients (`get_chat_openai`, `get_openai_embeddings`)
+- the cache-backed, batched embeddings used for ingestion
+  (`get_cached_embeddings`, one SQLite connection per namespace)
+- splitters (utils/ingest.py, utils/crawl.py) and the `requests` session
+  used for sitemaps
+- compiled chains, e.g. the quiz chains in utils/quiz.py
+
+Per-session callbacks (ChatCallbackHandler, trace handlers, Ollama metrics)
+are passed per invocation through `config={"callbacks": [...]}` instead of
+being baked into the shared client. Unlike `st.cache_resource` this registry
+also works from background job threads and from the benchmarks; pages keep
+using `st.cache_resource` for their own chains.
+
+aiohttp sessions are not shared: they belong to one event loop, and each
+crawl runs its own loop (utils/fetcher.py).
+
+Client classes are imported inside their getters, the first time a page
+actually needs one.
+"""
+import threading
+
+registry = {}
+# factory 안에서 다시 get_resource를 부를 수 있으므로 RLock
+registry_lock = threading.RLock()
+
+
+def get_resource(key, factory, *args, **kwargs):
+    with registry_lock:
+        if key not in registry:
+            registry[key] = factory(*args, **kwargs)
+        return registry[key]
+
+
+def clear_resources():
+    with registry_lock:
+        registry.clear()
+
+
+def get_chat_openai(**kwargs):
+    '''
+    같은 설정이면 같은 client (callbacks는 invoke 할 때 config로 전달)
+    LLM cache는 process 전체에 켜지므로 (utils/llm_cache.py) cache=True를 넘긴 client만 사용
+    '''
+    from langchain.chat_models import ChatOpenAI
+
+    kwargs.setdefault("cache", False)
+    return get_resource(("ChatOpenAI", tuple(sorted(kwargs.items()))), ChatOpenAI, **kwargs)
+
+
+def get_openai_embeddings():
+    from langchain.embeddings import OpenAIEmbeddings
+
+    return get_resource("OpenAIEmbeddings", OpenAIEmbeddings)
+
+
+def get_cached_embeddings(name="openai", underlying=None, **batch_kwargs):
+    '''
+    SQLite cache -> token 수 기준 batching -> provider (기본은 OpenAIEmbeddings)
+    name마다 하나 -> underlying은 처음 한 번만 사용, on_progress가 필요하면 직접 만들 것
+    '''
+    from utils.embedding_executor import BatchedEmbeddings
+    from utils.embedding_store import cache_backed_embeddings
+
+    return get_resource(
+        ("cached_embeddings", name, tuple(sorted(batch_kwargs.items()))),
+        lambda: cache_backed_embeddings(
+            BatchedEmbeddings(underlying or get_openai_embeddings(), **batch_kwargs)
+        ),
+    )
+
+
+def get_http_session():
+    ''' sitemap 요청용 (connection pool 재사용) '''
+    import requests
+
+    return get_resource("requests.Session", requests.Session)
@@ -0,0 +1,66 @@
+"""
+Semantic answer cache for the RAG chat pages.
+
+Questions are embedded and compared (cosine similarity) against the questions
+already answered for the same index. Above `threshold` the stored answer is
+returned without running retriever -> prompt -> LLM again. Entries expire
+after `ttl` seconds and the least recently used entry is evicted past
+`max_size`.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    def __init__(self, embeddings, threshold=0.95, max_size=256, ttl=60 * 60):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def expire(self, now):
+        for key in [
+            key for key, (_, _, created) in self.entries.items()
+            if now - created > self.ttl
+        ]:
+            del self.entries[key]
+
+    def lookup(self, vector):
+        ''' 비슷한 질문이 있으면 저장된 답변, 없으면 None '''
+        with self.lock:
+            self.expire(time.monotonic())
+            if self.entries:
+                keys = list(self.entries)
+                matrix = np.stack([self.entries[key][0] for key in keys])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self.entries[keys[best]][1]
+            self.misses += 1
+            return None
+
+    def store(self, vector, answer):
+        with self.lock:
+            self.entries[self.next_id] = (vector, answer, time.monotonic())
+            self.next_id += 1
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
@@ -0,0 +1,279 @@
+"""
+Request-level tracing shared by all GPT pages.
+
+A `Trace` covers one operation of one app (an upload being ingested, a chat
+message being answered, a quiz being generated). Stage timings come from two
+places:
+
+- `trace.stage(name)` / `trace.timed(iterable, name)` around plain Python
+  work such as load, split and embed (times are exclusive, so a stage nested
+  inside another is not counted twice)
+- `trace.handler()`, a langchain callback passed per invocation through
+  `config={"callbacks": [...]}`, which records retrieve, prompt_build, parse,
+  time-to-first-token, generation and token counts; code called inside a
+  run (e.g. `HybridRetriever`) finds the trace with `trace_from(run_manager)`
+
+Streaming chat models report no `token_usage`, so the handler also counts
+the prompt messages with tiktoken when a chat model starts and uses that
+count when the provider does not return one (approximate for Ollama models,
+whose tokenizers differ).
+
+`trace.finish()` appends one JSON line to `METRICS_PATH`; `summarize` and
+`to_openmetrics` turn those lines into p50/p95 per app / operation / stage
+for the Admin page.
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+METRICS_PATH = os.getenv("METRICS_PATH", "./.cache/metrics/traces.jsonl")
+write_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, app, operation):
+        self.app = app
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.tokens = defaultdict(int)
+        self.cache = {}
+        self.stack = []
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.stages[name] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        self.stack.append(0.0)
+        try:
+            yield
+        finally:
+            nested = self.stack.pop()
+            elapsed = time.perf_counter() - started
+            self.add(name, elapsed - nested)
+            if self.stack:
+                self.stack[-1] += elapsed
+
+    def timed(self, iterable, name):
+        ''' generator에서 다음 값을 기다리는 시간만 name stage로 기록 '''
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def cache_result(self, name, hit):
+        self.cache[name] = "hit" if hit else "miss"
+
+    def add_tokens(self, prompt=0, completion=0):
+        with self.lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["completion"] += completion
+
+    def handler(self):
+        return TracingCallbackHandler(self)
+
+    def to_record(self):
+        return {
+            "time": time.time(),
+            "app": self.app,
+            "operation": self.operation,
+            "total_ms": (time.perf_counter() - self.started) * 1000,
+            "stages": {name: seconds * 1000 for name, seconds in self.stages.items()},
+            "tokens": dict(self.tokens),
+            "cache": self.cache,
+        }
+
+    def finish(self, path=METRICS_PATH):
+        record = self.to_record()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with write_lock, open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return record
+
+
+class NullTrace(Trace):
+    def __init__(self):
+        super().__init__(None, None)
+
+    def finish(self, path=METRICS_PATH):
+        return None
+
+
+def stage_name(serialized, run_type=None):
+    name = (serialized or {}).get("id", [""])[-1]
+    if run_type == "prompt" or name.endswith("PromptTemplate"):
+        return "prompt_build"
+    if run_type == "parser" or "Parser" in name:
+        return "parse"
+    return None
+
+
+def count_message_tokens(messages, model_name=None):
+    ''' OpenAI chat format 기준 prompt token 수 (message마다 role 등 3 token + 응답 시작 3 token) '''
+    # tiktoken은 chat model이 처음 시작될 때 load
+    from utils.context import get_encoding
+
+    encoding = get_encoding(model_name)
+    tokens = 3
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        tokens += 3 + len(encoding.encode(content, disallowed_special=()))
+    return tokens
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    def __init__(self, trace):
+        self.trace = trace
+        self.runs = {}
+        self.first_tokens = {}
+        self.streamed = defaultdict(int)
+        self.prompt_tokens = {}
+        self.lock = threading.Lock()
+
+    def start(self, run_id, name):
+        with self.lock:
+            self.runs[run_id] = (name, time.perf_counter())
+
+    def end(self, run_id):
+        with self.lock:
+            name, started = self.runs.pop(run_id, (None, None))
+        if name:
+            self.trace.add(name, time.perf_counter() - started)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, run_type=None, **kwargs):
+        name = stage_name(serialized, run_type)
+        if name:
+            self.start(run_id, name)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self.start(run_id, "retrieve")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.start(run_id, "generation")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.start(run_id, "generation")
+        params = kwargs.get("invocation_params") or {}
+        model_name = params.get("model_name") or params.get("model")
+        tokens = sum(count_message_tokens(batch, model_name) for batch in messages)
+        with self.lock:
+            self.prompt_tokens[run_id] = tokens
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self.lock:
+            self.streamed[run_id] += 1
+            if run_id in self.first_tokens:
+                return
+            self.first_tokens[run_id] = time.perf_counter()
+            started = self.runs.get(run_id, (None, None))[1]
+        if started:
+            self.trace.add("ttft", self.first_tokens[run_id] - started)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.end(run_id)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        with self.lock:
+            streamed = self.streamed.pop(run_id, 0)
+            self.first_tokens.pop(run_id, None)
+            # streaming 응답에는 token_usage가 없음 -> 시작할 때 센 prompt token
+            counted = self.prompt_tokens.pop(run_id, 0)
+        self.trace.add_tokens(
+            prompt=usage.get("prompt_tokens", counted),
+            completion=usage.get("completion_tokens", streamed),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.end(run_id)
+        with self.lock:
+            self.streamed.pop(run_id, None)
+            self.first_tokens.pop(run_id, None)
+            self.prompt_tokens.pop(run_id, None)
+
+
+def trace_from(run_manager):
+    ''' run의 callback 중 TracingCallbackHandler의 Trace, 없으면 NullTrace '''
+    for handler in getattr(run_manager, "handlers", None) or []:
+        if isinstance(handler, TracingCallbackHandler):
+            return handler.trace
+    return NullTrace()
+
+
+def load_records(path=METRICS_PATH, limit=10_000):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        lines = f.readlines()[-limit:]
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return records
+
+
+def percentile(values, q):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def summarize(records):
+    ''' [{app, operation, stage, count, p50_ms, p95_ms}] '''
+    groups = defaultdict(list)
+    for record in records:
+        key = (record["app"], record["operation"])
+        groups[key + ("total",)].append(record["total_ms"])
+        for stage, milliseconds in record["stages"].items():
+            groups[key + (stage,)].append(milliseconds)
+    return [
+        {
+            "app": app,
+            "operation": operation,
+            "stage": stage,
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1),
+        }
+        for (app, operation, stage), values in sorted(groups.items())
+    ]
+
+
+def to_openmetrics(summary):
+    lines = [
+        "# TYPE gpt_stage_latency_milliseconds summary",
+        "# UNIT gpt_stage_latency_milliseconds milliseconds",
+    ]
+    for row in summary:
+        labels = f'app="{row["app"]}",operation="{row["operation"]}",stage="{row["stage"]}"'
+        lines.append(f'gpt_stage_latency_milliseconds{{{labels},quantile="0.5"}} {row["p50_ms"]}')
+        lines.append(f'gpt_stage_latency_milliseconds{{{labels},quantile="0.95"}} {row["p95_ms"]}')
+        lines.append(f'gpt_stage_latency_milliseconds_count{{{labels}}} {row["count"]}')
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,139 @@
+"""
+Thin client for the shared vector service (utils/vector_service.py).
+
+When `VECTOR_SERVICE_URL` is set the pages do not load FAISS indexes at all:
+`remote_retriever` returns a retriever that embeds the question locally
+(with the same embeddings the index was built with) and sends the text and
+vector to the service. Without the variable, or when the service does not
+answer its health check, it returns None and the pages load the index from
+disk as before; a search that fails later (service stopped, timeout) falls
+back to the page's local retriever.
+
+    VECTOR_SERVICE_URL=http://127.0.0.1:8765
+    VECTOR_SERVICE_URL=unix:///tmp/vectors.sock
+"""
+import logging
+import os
+
+from langchain.schema import BaseRetriever, Document
+
+from utils.ingest import CACHE_DIR
+from utils.resources import get_resource
+
+VECTOR_SERVICE_URL = os.getenv("VECTOR_SERVICE_URL")
+TIMEOUT = 30
+HEALTH_TIMEOUT = 2
+
+logger = logging.getLogger(__name__)
+
+
+class VectorServiceClient:
+    def __init__(self, url, timeout=TIMEOUT):
+        import httpx
+
+        if url.startswith("unix://"):
+            # host는 Unix socket에서는 의미 없음
+            self.client = httpx.Client(
+                transport=httpx.HTTPTransport(uds=url[len("unix://"):]),
+                base_url="http://vector-service",
+                timeout=timeout,
+            )
+        else:
+            self.client = httpx.Client(base_url=url, timeout=timeout)
+
+    def search(self, queries):
+        '''
+        queries: [{"indexes", "query", "embedding", "k", "fetch_k"}]
+        query마다 [Document] 반환 (metadata["index"]에 검색된 index 이름)
+        '''
+        response = self.client.post("/search", json={"queries": queries})
+        response.raise_for_status()
+        return [
+            [Document(**doc) for doc in docs]
+            for docs in response.json()["results"]
+        ]
+
+    def healthy(self):
+        import httpx
+
+        try:
+            self.client.get("/health", timeout=HEALTH_TIMEOUT).raise_for_status()
+            return True
+        except httpx.HTTPError as error:
+            logger.warning("vector service is not reachable, loading indexes locally: %s", error)
+            return False
+
+    def indexes(self):
+        ''' 올라와 있는 index와 memory 사용량 '''
+        response = self.client.get("/indexes")
+        response.raise_for_status()
+        return response.json()
+
+
+def get_vector_client():
+    if not VECTOR_SERVICE_URL:
+        return None
+    return get_resource(("VectorServiceClient", VECTOR_SERVICE_URL), VectorServiceClient, VECTOR_SERVICE_URL)
+
+
+def get_index_name(index_dir):
+    ''' ./.cache/files/{digest} -> files/{digest} '''
+    return os.path.relpath(index_dir, CACHE_DIR).replace(os.sep, "/")
+
+
+class RemoteRetriever(BaseRetriever):
+    client: object
+    embeddings: object
+    indexes: list
+    # index 이름 -> 검색된 문서에 추가할 metadata (DocumentGPT의 digest / file_name)
+    labels: dict = {}
+    # service 검색이 실패하면 호출해서 받은 (local) retriever로 검색
+    fallback: object = None
+    k: int = 4
+    fetch_k: int = 20
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        import httpx
+
+        embedding = [float(value) for value in self.embeddings.embed_query(query)]
+        try:
+            [docs] = self.client.search([{
+                "indexes": self.indexes,
+                "query": query,
+                "embedding": embedding,
+                "k": self.k,
+                "fetch_k": self.fetch_k,
+            }])
+        except httpx.HTTPError as error:
+            if self.fallback is None:
+                raise
+            logger.warning("vector service search failed, searching locally: %s", error)
+            return self.fallback().get_relevant_documents(
+                query, callbacks=run_manager.get_child() if run_manager else None
+            )
+        for doc in docs:
+            doc.metadata.update(self.labels.get(doc.metadata["index"], {}))
+        return docs
+
+
+def remote_retriever(index_dirs, embeddings, labels=None, fallback=None, **kwargs):
+    '''
+    vector service를 쓰면 RemoteRetriever, 아니면 None (page가 index를 직접 load)
+    service가 응답하지 않아도 None
+    labels: {index_dir: metadata}
+    fallback: 검색 중 service가 실패하면 대신 쓸 local retriever를 만드는 함수
+    '''
+    client = get_vector_client()
+    if client is None or not client.healthy():
+        return None
+    return RemoteRetriever(
+        client=client,
+        embeddings=embeddings,
+        indexes=[get_index_name(index_dir) for index_dir in index_dirs],
+        labels={get_index_name(index_dir): label for index_dir, label in (labels or {}).items()},
+        fallback=fallback,
+        **kwargs,
+    )
@@ -0,0 +1,234 @@
+"""
+Shared vector service: one process that owns the FAISS indexes of every page.
+
+Each Streamlit process used to load its own copy of every index it searched,
+so memory grew with processes x documents. This service loads the indexes the
+ingest / crawl jobs write under ./.cache once, and the pages query it over
+HTTP or a Unix socket (utils/vector_client.py) when `VECTOR_SERVICE_URL` is
+set. Web workers can then be scaled without multiplying index memory.
+
+- indexes are named by their directory under ./.cache
+  (`files/{digest}`, `private_files/{digest}`, `sites/{digest}`) and are
+  loaded on first use (mmap, see utils/index_store.py) with their BM25 index
+- the service never embeds: clients send the query text (for BM25) and its
+  vector, so it works for OpenAI and Ollama indexes alike
+- `POST /search` takes a batch of queries; each query may span several
+  indexes (a DocumentGPT collection), whose rankings are fused with RRF
+- searches run concurrently on the server's thread pool (faiss releases the
+  GIL); loading is serialised per index
+- indexes are accounted by their size on disk (index.faiss + index.pkl +
+  bm25.pkl), not by measured memory, and the least recently used indexes
+  are evicted once the total passes `VECTOR_SERVICE_MEMORY_MB`. Disk size is
+  close to resident size for Flat / HNSW indexes and the docstore, and
+  overstates it for IVF indexes, whose mmapped lists stay in the shared page
+  cache. Evicting only drops the in-memory copy: the jobs already persisted
+  the index, so it is reloaded from disk on the next query
+- an index that was saved again (re-crawl, re-ingest) is reloaded on its
+  next query
+
+    python -m utils.vector_service --port 8765        # VECTOR_SERVICE_URL=http://127.0.0.1:8765
+    python -m utils.vector_service --uds /tmp/vectors.sock   # VECTOR_SERVICE_URL=unix:///tmp/vectors.sock
+
+Run it from the app's directory so ./.cache is the one the pages write to.
+"""
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from pydantic import BaseModel
+
+from utils.hybrid import HybridRetriever
+from utils.index_store import get_index_paths, index_exists, index_version, load_index
+from utils.ingest import CACHE_DIR
+
+MEMORY_MB = int(os.getenv("VECTOR_SERVICE_MEMORY_MB", 2048))
+
+
+class PrecomputedEmbeddings(Embeddings):
+    ''' load_index에 넘기는 자리 표시 -> 검색은 항상 client가 보낸 vector로 '''
+
+    def embed_documents(self, texts):
+        raise RuntimeError("the vector service only searches by vector")
+
+    def embed_query(self, text):
+        raise RuntimeError("the vector service only searches by vector")
+
+
+def get_index_dir(name):
+    ''' index 이름 -> ./.cache 아래 경로 (밖으로 나가는 이름은 거부) '''
+    root = os.path.abspath(CACHE_DIR)
+    index_dir = os.path.abspath(os.path.join(root, name))
+    if os.path.commonpath([root, index_dir]) != root or index_dir == root:
+        raise HTTPException(status_code=400, detail=f"invalid index name: {name}")
+    return index_dir
+
+
+def index_files(index_dir):
+    return [*get_index_paths(index_dir), os.path.join(index_dir, "bm25.pkl")]
+
+
+class LoadedIndex:
+    def __init__(self, name, index_dir):
+        self.name = name
+        self.version = index_version(index_dir)
+        vectorstore = load_index(index_dir, PrecomputedEmbeddings())
+        self.retriever = HybridRetriever.from_vectorstore(vectorstore, index_dir)
+        self.vectors = vectorstore.index.ntotal
+        # memory가 아니라 disk 크기로 계산 (module docstring 참고)
+        self.disk_bytes = sum(
+            os.path.getsize(path) for path in index_files(index_dir) if os.path.exists(path)
+        )
+        self.hits = 0
+        self.last_used = time.time()
+
+    def search(self, query, embedding, k, fetch_k):
+        # retriever 설정은 query마다 다르므로 복사본에서 검색 (동시 검색끼리 공유하지 않음)
+        retriever = self.retriever.copy(update={"k": k, "fetch_k": fetch_k})
+        self.hits += 1
+        self.last_used = time.time()
+        return retriever.search(query, embedding)
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "vectors": self.vectors,
+            "disk_bytes": self.disk_bytes,
+            "hits": self.hits,
+            "last_used": self.last_used,
+            "version": self.version,
+        }
+
+
+class IndexRegistry:
+    def __init__(self, max_disk_bytes=MEMORY_MB * 1024 * 1024):
+        self.max_disk_bytes = max_disk_bytes
+        self.indexes = OrderedDict()
+        self.loading = {}
+        self.evictions = 0
+        self.loads = 0
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        index_dir = get_index_dir(name)
+        if not index_exists(index_dir):
+            raise HTTPException(status_code=404, detail=f"index not found: {name}")
+        version = index_version(index_dir)
+
+        with self.lock:
+            loaded = self.indexes.get(name)
+            if loaded is not None and loaded.version == version:
+                self.indexes.move_to_end(name)
+                return loaded
+            # 같은 index를 여러 요청이 동시에 load 하지 않도록 index마다 lock
+            load_lock = self.loading.setdefault(name, threading.Lock())
+
+        with load_lock:
+            with self.lock:
+                loaded = self.indexes.get(name)
+                if loaded is not None and loaded.version == version:
+                    return loaded
+            loaded = LoadedIndex(name, index_dir)
+            with self.lock:
+                self.indexes[name] = loaded
+                self.loads += 1
+                self.evict(keep=name)
+            return loaded
+
+    def evict(self, keep=None):
+        ''' lock을 잡은 상태에서 호출, 검색 중인 요청은 자기 참조로 끝까지 사용 '''
+        while self.total_disk_bytes() > self.max_disk_bytes:
+            name = next((name for name in self.indexes if name != keep), None)
+            if name is None:
+                return
+            del self.indexes[name]
+            self.evictions += 1
+
+    def total_disk_bytes(self):
+        return sum(loaded.disk_bytes for loaded in self.indexes.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                "indexes": [loaded.describe() for loaded in self.indexes.values()],
+                "total_disk_bytes": self.total_disk_bytes(),
+                "max_disk_bytes": self.max_disk_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+class Query(BaseModel):
+    indexes: List[str]
+    query: str
+    embedding: List[float]
+    k: int = 4
+    fetch_k: int = 20
+
+
+class SearchRequest(BaseModel):
+    queries: List[Query]
+
+
+def search_query(query):
+    ''' index가 여러 개면 index별 결과를 RRF로 합침, 문서에 어느 index인지 표시 '''
+    if not query.indexes:
+        return []
+    rankings = []
+    retriever = None
+    for name in query.indexes:
+        loaded = registry.get(name)
+        retriever = loaded.retriever
+        rankings.append([
+            # docstore의 문서를 직접 바꾸지 않도록 새 Document
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "index": name})
+            for doc in loaded.search(query.query, query.embedding, query.k, query.fetch_k)
+        ])
+    docs = rankings[0] if len(rankings) == 1 else retriever.fuse(rankings)[:query.k]
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+
+registry = IndexRegistry()
+app = FastAPI(title="fullstack-gpt vector service")
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/indexes")
+def list_indexes():
+    return registry.stats()
+
+
+@app.post("/search")
+def search(request: SearchRequest):
+    '''
+    sync endpoint -> FastAPI가 thread pool에서 실행하므로 요청끼리는 동시에 검색
+    batch 안의 query는 순서대로 (대부분 1~수 개)
+    '''
+    started = time.perf_counter()
+    results = [search_query(query) for query in request.queries]
+    return {"results": results, "took_ms": (time.perf_counter() - started) * 1000}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--uds", help="listen on a Unix socket instead of host / port")
+    args = parser.parse_args()
+    # index는 process 안에서만 공유되므로 worker는 하나
+    uvicorn.run(app, host=args.host, port=args.port, uds=args.uds, workers=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Offline Wikipedia index for QuizGPT.
+
+A subset of a Wikipedia dump is ingested into one SQLite file: article bodies
+are stored zlib-compressed in `articles`, and a contentless FTS5 table indexes
+title + body for BM25 search. `search` answers in milliseconds with no
+network; QuizGPT falls back to the online WikipediaRetriever when the index
+is missing or has no match.
+
+    python -m utils.wiki_index ingest enwiki-latest-pages-articles1.xml.bz2 --limit 50000
+    python -m utils.wiki_index ingest wikiextractor_output.jsonl
+
+Accepted inputs are MediaWiki XML dumps (.xml / .xml.bz2) and JSON lines with
+`title` and `text` fields (e.g. WikiExtractor --json output).
+"""
+import argparse
+import bz2
+import json
+import os
+import re
+import sqlite3
+import xml.etree.ElementTree as ET
+import zlib
+from urllib.parse import quote
+
+from langchain.schema import Document
+
+WIKI_INDEX_PATH = os.getenv("WIKI_INDEX_PATH", "./.cache/wiki.db")
+DOC_CONTENT_CHARS_MAX = 4000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    title TEXT UNIQUE NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, body, content='', tokenize='porter unicode61'
+);
+"""
+
+WIKI_PATTERNS = [
+    (re.compile(r"<ref[^>]*/>", re.S), ""),
+    (re.compile(r"<ref.*?</ref>", re.S), ""),
+    (re.compile(r"<!--.*?-->", re.S), ""),
+    (re.compile(r"<[^>]+>"), ""),
+    (re.compile(r"\[\[(?:File|Image|Category):[^\]]*\]\]", re.I), ""),
+    (re.compile(r"\[\[(?:[^\]|]*\|)?([^\]]*)\]\]"), r"\1"),
+    (re.compile(r"\[https?://[^\s\]]+\s?([^\]]*)\]"), r"\1"),
+    (re.compile(r"'{2,}"), ""),
+    (re.compile(r"^=+\s*(.*?)\s*=+\s*$", re.M), r"\1"),
+    (re.compile(r"\n{3,}"), "\n\n"),
+]
+
+
+def strip_templates(text):
+    ''' {{...}} template은 중첩될 수 있어서 regex 대신 직접 depth 계산 '''
+    output = []
+    depth = 0
+    i = 0
+    while i < len(text):
+        pair = text[i:i + 2]
+        if pair in ("{{", "{|"):
+            depth += 1
+            i += 2
+        elif pair in ("}}", "|}") and depth:
+            depth -= 1
+            i += 2
+        else:
+            if not depth:
+                output.append(text[i])
+            i += 1
+    return "".join(output)
+
+
+def clean_wikitext(text):
+    text = strip_templates(text)
+    for pattern, replacement in WIKI_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+def iter_xml_articles(path):
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rb") as f:
+        for _, element in ET.iterparse(f):
+            if not element.tag.endswith("}page") and element.tag != "page":
+                continue
+            fields = {child.tag.rsplit("}", 1)[-1]: child for child in element.iter()}
+            is_article = fields.get("ns") is not None and fields["ns"].text == "0"
+            if is_article and "redirect" not in fields and fields.get("text") is not None:
+                yield fields["title"].text, clean_wikitext(fields["text"].text or "")
+            element.clear()
+
+
+def iter_jsonl_articles(path):
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                article = json.loads(line)
+                yield article["title"], article["text"]
+
+
+def connect(path=WIKI_INDEX_PATH, readonly=False):
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def ingest(source, path=WIKI_INDEX_PATH, limit=None, batch_size=1000):
+    if ".json" in source:
+        articles = iter_jsonl_articles(source)
+    else:
+        articles = iter_xml_articles(source)
+
+    connection = connect(path)
+    count = 0
+    with connection:
+        for title, body in articles:
+            if not body:
+                continue
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO articles (title, body) VALUES (?, ?)",
+                (title, zlib.compress(body.encode(), 6)),
+            )
+            if not cursor.rowcount:
+                continue
+            connection.execute(
+                "INSERT INTO articles_fts (rowid, title, body) VALUES (?, ?, ?)",
+                (cursor.lastrowid, title, body),
+            )
+            count += 1
+            if count % batch_size == 0:
+                connection.commit()
+            if limit and count >= limit:
+                break
+    connection.execute("INSERT INTO articles_fts (articles_fts) VALUES ('optimize')")
+    connection.commit()
+    connection.close()
+    return count
+
+
+def to_match_query(term):
+    ''' 사용자 입력을 FTS5 문법 오류 없이 쓸 수 있도록 단어마다 quote '''
+    words = re.findall(r"\w+", term)
+    return " ".join('"{}"'.format(word) for word in words)
+
+
+def search(term, top_k=5, path=WIKI_INDEX_PATH):
+    ''' WikipediaRetriever와 같은 형태의 Document 목록 반환, index가 없으면 [] '''
+    query = to_match_query(term)
+    if not query or not os.path.exists(path):
+        return []
+    connection = connect(path, readonly=True)
+    try:
+        rows = connection.execute(
+            """
+            SELECT articles.title, articles.body
+            FROM articles_fts
+            JOIN articles ON articles.id = articles_fts.rowid
+            WHERE articles_fts MATCH ?
+            ORDER BY bm25(articles_fts, 10.0, 1.0)
+            LIMIT ?
+            """,
+            (query, top_k),
+        ).fetchall()
+    finally:
+        connection.close()
+
+    docs = []
+    for title, body in rows:
+        body = zlib.decompress(body).decode()
+        docs.append(Document(
+            page_content=body[:DOC_CONTENT_CHARS_MAX],
+            metadata={
+                "title": title,
+                "summary": body.split("\n\n", 1)[0],
+                "source": f"https://en.wikipedia.org/wiki/{quote(title.replace(' ', '_'))}",
+            },
+        ))
+    return docs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Wikipedia index for QuizGPT")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest")
+    ingest_parser.add_argument("source")
+    ingest_parser.add_argument("--db", default=WIKI_INDEX_PATH)
+    ingest_parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+    print(f"Indexed {ingest(args.source, args.db, args.limit)} articles into {args.db}")